@@ -0,0 +1,587 @@
+# Copyright (c) 2025 @hacker.mbrebed
+# This script is licensed under the MIT License.
+# See the LICENSE file for details.
+"""Benchmark offline untuk main.py memakai Bot API tiruan, tanpa koneksi ke Telegram.
+
+Handler asli (start_command, check_subscription, help callback, broadcast_command) dijalankan
+lewat Application sungguhan; hanya lapisan HTTP yang diganti dengan server tiruan yang
+mensimulasikan latensi, pengguna yang memblokir bot (Forbidden) dan flood control (RetryAfter).
+
+Contoh:
+    python bench.py --users 100000 --channels 3 --starts 2000
+    python bench.py --users 1000000 --channels 10 --skip-broadcast --max-p99-ms 500
+"""
+import os
+import sys
+import json
+import time
+import random
+import asyncio
+import logging
+import argparse
+import resource
+import tempfile
+import socket
+from collections import Counter, deque
+
+from telegram import Update
+from telegram.request import BaseRequest
+
+REPO_DIR = os.path.dirname(os.path.abspath(__file__))
+BENCH_TOKEN = "123456:BENCHMARK"
+BOT_ID = 123456
+ADMIN_ID = 10 ** 12
+# Jumlah pengguna yang mengirim /start berulang-ulang saat --spam-pct dipakai
+SPAMMERS = 10
+BOT_ADMIN_MEMBER = {
+    "status": "administrator",
+    "user": {"id": BOT_ID, "is_bot": True, "first_name": "Bench"},
+    "can_be_edited": False, "is_anonymous": False, "can_manage_chat": True, "can_delete_messages": True,
+    "can_manage_video_chats": True, "can_restrict_members": True, "can_promote_members": False,
+    "can_change_info": True, "can_invite_users": True, "can_post_stories": False, "can_edit_stories": False,
+    "can_delete_stories": False,
+}
+SEND_METHODS = {"sendMessage", "sendPhoto", "sendVideo", "sendMediaGroup", "copyMessage", "copyMessages"}
+
+# --- Server Bot API Tiruan ---
+class FakeTelegram:
+    """Mensimulasikan Bot API: latensi, keanggotaan channel, pengguna yang memblokir bot dan flood control."""
+
+    def __init__(self, latency, jitter, member_pct, blocked_pct, send_limit, retry_after_pct, seed=1):
+        self.latency = latency
+        self.jitter = jitter
+        self.member_pct = member_pct
+        self.blocked_pct = blocked_pct
+        self.send_limit = send_limit
+        self.retry_after_pct = retry_after_pct
+        self.random = random.Random(seed)
+        self.calls = Counter()
+        self.errors = Counter()
+        self._sends = deque()
+        self._message_id = 0
+        self._unblocked = set()
+
+    def _message(self, chat_id, **extra):
+        self._message_id += 1
+        message = {
+            "message_id": self._message_id,
+            "date": int(time.time()),
+            "chat": {"id": int(chat_id), "type": "private" if int(chat_id) > 0 else "channel"},
+        }
+        message.update(extra)
+        return message
+
+    def _error(self, code, description, **parameters):
+        self.errors[code] += 1
+        body = {"ok": False, "error_code": code, "description": description}
+        if parameters:
+            body["parameters"] = parameters
+        return code, body
+
+    def _is_member(self, chat_id, user_id):
+        return hash((int(chat_id), int(user_id))) % 100 < self.member_pct
+
+    def note_incoming(self, user_id):
+        """Pengguna yang baru mengirim update ke bot pasti tidak sedang memblokir bot."""
+        self._unblocked.add(user_id)
+
+    def _is_blocked(self, chat_id):
+        chat_id = int(chat_id)
+        if chat_id <= 0 or chat_id == ADMIN_ID or chat_id in self._unblocked:
+            return False
+        return chat_id % 100 < self.blocked_pct
+
+    def _flood_limited(self):
+        """Jendela geser satu detik untuk batas pengiriman global bot."""
+        now = time.monotonic()
+        while self._sends and now - self._sends[0] > 1:
+            self._sends.popleft()
+        if len(self._sends) >= self.send_limit:
+            return True
+        self._sends.append(now)
+        return False
+
+    async def handle(self, method, params):
+        self.calls[method] += 1
+        await asyncio.sleep(max(0.0, self.latency + self.random.uniform(-self.jitter, self.jitter)))
+
+        if method == "getMe":
+            return 200, {"ok": True, "result": {"id": BOT_ID, "is_bot": True, "first_name": "Bench", "username": "bench_bot"}}
+        if method == "getChatMember":
+            user_id = int(params["user_id"])
+            if user_id == BOT_ID:
+                return 200, {"ok": True, "result": BOT_ADMIN_MEMBER}
+            status = "member" if self._is_member(params["chat_id"], user_id) else "left"
+            return 200, {"ok": True, "result": {"status": status, "user": {"id": user_id, "is_bot": False, "first_name": "U"}}}
+        if method in SEND_METHODS:
+            if self._is_blocked(params["chat_id"]):
+                return self._error(403, "Forbidden: bot was blocked by the user")
+            if self._flood_limited() or self.random.random() * 100 < self.retry_after_pct:
+                return self._error(429, "Too Many Requests: retry after 1", retry_after=1)
+            if method == "sendMediaGroup":
+                media = params.get("media") or []
+                return 200, {"ok": True, "result": [self._message(params["chat_id"]) for _ in media]}
+            if method == "copyMessages":
+                message_ids = params.get("message_ids") or []
+                return 200, {"ok": True, "result": [{"message_id": self._message(params["chat_id"])["message_id"]} for _ in message_ids]}
+            if method == "copyMessage":
+                return 200, {"ok": True, "result": {"message_id": self._message(params["chat_id"])["message_id"]}}
+            return 200, {"ok": True, "result": self._message(params["chat_id"], text=params.get("text", ""))}
+        if method in ("editMessageText", "editMessageCaption"):
+            return 200, {"ok": True, "result": self._message(params.get("chat_id", ADMIN_ID), text=params.get("text", ""))}
+        return 200, {"ok": True, "result": True}
+
+class FakeRequest(BaseRequest):
+    """Pengganti HTTPXRequest yang meneruskan setiap panggilan Bot API ke FakeTelegram."""
+
+    def __init__(self, server: FakeTelegram):
+        self.server = server
+
+    @property
+    def read_timeout(self):
+        return None
+
+    async def initialize(self):
+        pass
+
+    async def shutdown(self):
+        pass
+
+    async def do_request(self, url, method, request_data=None, read_timeout=None, write_timeout=None, connect_timeout=None, pool_timeout=None):
+        endpoint = url.rsplit("/", 1)[-1]
+        params = request_data.parameters if request_data else {}
+        status, body = await self.server.handle(endpoint, params)
+        return status, json.dumps(body).encode("utf-8")
+
+# --- Server Redis Tiruan ---
+class FakeRedis:
+    """Pengganti Redis di memori (protokol RESP) untuk menguji STATE_BACKEND=redis tanpa server sungguhan.
+
+    Hanya perintah yang dipakai state.py yang didukung.
+    """
+
+    def __init__(self):
+        self.data = {}
+        self.commands = Counter()
+        self._server = None
+        self._connections = set()
+
+    async def start(self, host, port):
+        self._server = await asyncio.start_server(self._handle, host, port)
+
+    async def stop(self):
+        if self._server:
+            self._server.close()
+            for task in self._connections:
+                task.cancel()
+            await asyncio.gather(*self._connections, return_exceptions=True)
+            await self._server.wait_closed()
+
+    async def _handle(self, reader, writer):
+        task = asyncio.current_task()
+        self._connections.add(task)
+        # Perintah di antara MULTI dan EXEC milik koneksi ini
+        queued = None
+        try:
+            while True:
+                header = await reader.readline()
+                if not header:
+                    break
+                args = []
+                for _ in range(int(header[1:])):
+                    length = int((await reader.readline())[1:])
+                    args.append((await reader.readexactly(length + 2))[:-2].decode("utf-8"))
+                name = args[0].upper()
+                if name == "MULTI":
+                    queued, reply = [], True
+                elif name == "EXEC":
+                    # Dijalankan tanpa jeda await, jadi atomik terhadap koneksi lain
+                    reply, queued = [self.execute(command) for command in queued or []], None
+                elif queued is not None:
+                    queued.append(args)
+                    reply = "QUEUED"
+                else:
+                    reply = self.execute(args)
+                writer.write(self._encode(reply))
+                await writer.drain()
+        except (ConnectionError, asyncio.IncompleteReadError, asyncio.CancelledError):
+            pass
+        finally:
+            self._connections.discard(task)
+            writer.close()
+
+    def _encode(self, value):
+        if value is True:
+            return b"+OK\r\n"
+        if isinstance(value, Exception):
+            return f"-ERR {value}\r\n".encode("utf-8")
+        if value is None:
+            return b"$-1\r\n"
+        if isinstance(value, int):
+            return b":%d\r\n" % value
+        if isinstance(value, list):
+            return b"*%d\r\n" % len(value) + b"".join(self._encode(item) for item in value)
+        data = str(value).encode("utf-8")
+        return b"$%d\r\n%s\r\n" % (len(data), data)
+
+    def execute(self, args):
+        name, key, rest = args[0].upper(), args[1] if len(args) > 1 else None, args[2:]
+        self.commands[name] += 1
+        if name in ("AUTH", "SELECT", "PING"):
+            return True
+        if name == "GET":
+            return self.data.get(key)
+        if name == "INCR":
+            self.data[key] = str(int(self.data.get(key, 0)) + 1)
+            return int(self.data[key])
+        if name in ("HSET", "HSETNX", "HDEL", "HGETALL", "HMGET"):
+            table = self.data.setdefault(key, {})
+            if name == "HSET":
+                added = sum(field not in table for field in rest[::2])
+                table.update(zip(rest[::2], rest[1::2]))
+                return added
+            if name == "HSETNX":
+                if rest[0] in table:
+                    return 0
+                table[rest[0]] = rest[1]
+                return 1
+            if name == "HDEL":
+                return sum(table.pop(field, None) is not None for field in rest)
+            if name == "HGETALL":
+                return [item for pair in table.items() for item in pair]
+            return [table.get(field) for field in rest]
+        if name in ("SADD", "SREM", "SCARD", "SMISMEMBER"):
+            members = self.data.setdefault(key, set())
+            if name == "SADD":
+                before = len(members)
+                members.update(rest)
+                return len(members) - before
+            if name == "SREM":
+                before = len(members)
+                members.difference_update(rest)
+                return before - len(members)
+            if name == "SCARD":
+                return len(members)
+            return [int(member in members) for member in rest]
+        if name in ("ZADD", "ZCARD", "ZRANGEBYSCORE"):
+            zset = self.data.setdefault(key, {})
+            if name == "ZADD":
+                nx = rest[0].upper() == "NX"
+                pairs = rest[1:] if nx else rest
+                added = 0
+                for score, member in zip(pairs[::2], pairs[1::2]):
+                    if member not in zset:
+                        added += 1
+                    elif nx:
+                        continue
+                    zset[member] = float(score)
+                return added
+            if name == "ZCARD":
+                return len(zset)
+            low, high, offset, count = rest[0], rest[1], 0, None
+            if len(rest) > 2 and rest[2].upper() == "LIMIT":
+                offset, count = int(rest[3]), int(rest[4])
+
+            def above(score):
+                if low == "-inf":
+                    return True
+                return score > float(low[1:]) if low.startswith("(") else score >= float(low)
+
+            def below(score):
+                if high == "+inf":
+                    return True
+                return score < float(high[1:]) if high.startswith("(") else score <= float(high)
+
+            matched = sorted((score, member) for member, score in zset.items() if above(score) and below(score))
+            matched = matched[offset:offset + count if count is not None else None]
+            return [member for _, member in matched]
+        if name in ("RPUSH", "LLEN", "LRANGE", "LTRIM"):
+            items = self.data.setdefault(key, [])
+            if name == "RPUSH":
+                items.extend(rest)
+                return len(items)
+            if name == "LLEN":
+                return len(items)
+            start, stop = int(rest[0]), int(rest[1])
+            selected = items[start:None if stop == -1 else stop + 1]
+            if name == "LTRIM":
+                items[:] = selected
+                return True
+            return selected
+        return ValueError(f"perintah {name} tidak didukung")
+
+def free_port():
+    with socket.socket() as sock:
+        sock.bind(("127.0.0.1", 0))
+        return sock.getsockname()[1]
+
+# --- Pembuat Update Sintetis ---
+def user_dict(user_id):
+    return {"id": user_id, "is_bot": False, "first_name": f"User{user_id}"}
+
+def command_update(update_id, user_id, text, reply_to=None):
+    command = text.split()[0]
+    message = {
+        "message_id": update_id,
+        "date": int(time.time()),
+        "chat": {"id": user_id, "type": "private"},
+        "from": user_dict(user_id),
+        "text": text,
+        "entities": [{"type": "bot_command", "offset": 0, "length": len(command)}],
+    }
+    if reply_to:
+        message["reply_to_message"] = reply_to
+    return {"update_id": update_id, "message": message}
+
+def callback_update(update_id, user_id, data):
+    return {
+        "update_id": update_id,
+        "callback_query": {
+            "id": str(update_id),
+            "from": user_dict(user_id),
+            "chat_instance": "bench",
+            "data": data,
+            "message": {
+                "message_id": update_id,
+                "date": int(time.time()),
+                "chat": {"id": user_id, "type": "private"},
+                "from": {"id": BOT_ID, "is_bot": True, "first_name": "Bench"},
+                "text": "help",
+            },
+        },
+    }
+
+def chat_member_update(update_id, channel_id, user_id, joined=True):
+    user = user_dict(user_id)
+    old_status, new_status = ("left", "member") if joined else ("member", "left")
+    return {
+        "update_id": update_id,
+        "chat_member": {
+            "chat": {"id": channel_id, "type": "channel", "title": "Bench"},
+            "from": user,
+            "date": int(time.time()),
+            "old_chat_member": {"status": old_status, "user": user},
+            "new_chat_member": {"status": new_status, "user": user},
+        },
+    }
+
+# --- Pengukuran ---
+def percentile(values, pct):
+    if not values:
+        return 0.0
+    ordered = sorted(values)
+    index = min(len(ordered) - 1, int(round(pct / 100 * (len(ordered) - 1))))
+    return ordered[index]
+
+def peak_memory_mb():
+    # ru_maxrss dalam KB di Linux
+    return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024
+
+async def drive(application, server, updates, concurrency):
+    """Memproses update secara bersamaan seperti saat bot berjalan; mengembalikan (durasi, latensi)."""
+    semaphore = asyncio.Semaphore(concurrency)
+    latencies = []
+
+    async def one(data):
+        async with semaphore:
+            update = Update.de_json(data, application.bot)
+            server.note_incoming(update.effective_user.id)
+            started = time.perf_counter()
+            await application.update_processor.process_update(update, application.process_update(update))
+            latencies.append(time.perf_counter() - started)
+
+    started = time.perf_counter()
+    await asyncio.gather(*(one(data) for data in updates))
+    return time.perf_counter() - started, latencies
+
+def report(name, count, duration, latencies, server, calls_before):
+    calls = {method: n - calls_before.get(method, 0) for method, n in server.calls.items() if n - calls_before.get(method, 0)}
+    result = {
+        "workload": name,
+        "updates": count,
+        "duration_s": round(duration, 3),
+        "throughput": round(count / duration, 1) if duration else 0.0,
+        "p50_ms": round(percentile(latencies, 50) * 1000, 2),
+        "p99_ms": round(percentile(latencies, 99) * 1000, 2),
+        "api_calls": calls,
+        "peak_memory_mb": round(peak_memory_mb(), 1),
+    }
+    print(f"== {name} ==")
+    print(f"  update      : {count} dalam {result['duration_s']} s ({result['throughput']} update/s)")
+    print(f"  latensi     : p50 {result['p50_ms']} ms | p99 {result['p99_ms']} ms")
+    print(f"  panggilan   : {', '.join(f'{m}={n}' for m, n in sorted(calls.items()))}")
+    print(f"  memori puncak: {result['peak_memory_mb']} MB")
+    return result
+
+def flood_dropped(bot_module):
+    return int(sum(value for _, value in bot_module.metrics.counter_series("flood_dropped_total")))
+
+# --- Skenario ---
+async def run_benchmark(args, bot_module):
+    server = FakeTelegram(
+        latency=args.latency_ms / 1000, jitter=args.jitter_ms / 1000,
+        member_pct=args.member_pct, blocked_pct=args.blocked_pct,
+        send_limit=args.send_limit, retry_after_pct=args.retry_after_pct, seed=args.seed
+    )
+    application = bot_module.build_application(BENCH_TOKEN, request=FakeRequest(server))
+    errors = Counter()
+    redis = None
+    if args.state == "redis":
+        redis = FakeRedis()
+        await redis.start("127.0.0.1", args.redis_port)
+
+    async def count_errors(update, context):
+        errors[type(context.error).__name__] += 1
+
+    application.add_error_handler(count_errors)
+
+    config = bot_module.get_config()
+    config["admin_ids"] = [ADMIN_ID]
+    config["fsub_channels"] = [-1000000000000 - i for i in range(args.channels)]
+    config["fsub_buttons"] = [{"text": f"Channel {i + 1}", "url": f"https://t.me/bench_channel_{i}"} for i in range(args.channels)]
+    config["videos"] = {f"video_{i}": f"BENCH_FILE_{i}" for i in range(args.videos)}
+
+    await application.initialize()
+    await bot_module.on_startup(application)
+    results = []
+    rng = random.Random(args.seed)
+    try:
+        started = time.perf_counter()
+        for offset in range(1, args.users + 1, 50000):
+            await bot_module.tenant().user_store.add_many(range(offset, min(offset + 50000, args.users + 1)))
+        print(f"Menyiapkan {args.users} pengguna: {time.perf_counter() - started:.2f} s")
+
+        update_id = 0
+        if args.member_events:
+            updates = []
+            for _ in range(args.member_events):
+                update_id += 1
+                channel_id = rng.choice(config["fsub_channels"])
+                updates.append(chat_member_update(update_id, channel_id, rng.randint(1, args.users), joined=rng.random() < 0.9))
+            calls_before = dict(server.calls)
+            duration, latencies = await drive(application, server, updates, args.concurrency)
+            results.append(report("chat_member", len(updates), duration, latencies, server, calls_before))
+
+        if args.starts:
+            updates = []
+            for _ in range(args.starts):
+                update_id += 1
+                parameter = f" video_{rng.randrange(args.videos)}" if args.videos and rng.random() < 0.8 else ""
+                # Sebagian /start dikirim berulang-ulang oleh segelintir pengguna (spam)
+                user_id = rng.randint(1, SPAMMERS) if rng.random() * 100 < args.spam_pct else rng.randint(1, args.users)
+                updates.append(command_update(update_id, user_id, f"/start{parameter}"))
+            calls_before = dict(server.calls)
+            dropped_before = flood_dropped(bot_module)
+            duration, latencies = await drive(application, server, updates, args.concurrency)
+            result = report(f"/start ({args.channels} channel)", len(updates), duration, latencies, server, calls_before)
+            result["flood_dropped"] = flood_dropped(bot_module) - dropped_before
+            print(f"  flood       : {result['flood_dropped']} update diabaikan")
+            results.append(result)
+
+        if args.callbacks:
+            updates = []
+            choices = ["help_menu_user", "help_menu_admin", "help_desc_user_start", "help_desc_admin_broadcast", "help_main_menu"]
+            for _ in range(args.callbacks):
+                update_id += 1
+                updates.append(callback_update(update_id, rng.randint(1, args.users), rng.choice(choices)))
+            calls_before = dict(server.calls)
+            duration, latencies = await drive(application, server, updates, args.concurrency)
+            results.append(report("help callback", len(updates), duration, latencies, server, calls_before))
+
+        if not args.skip_broadcast:
+            update_id += 1
+            source = {
+                "message_id": update_id, "date": int(time.time()),
+                "chat": {"id": ADMIN_ID, "type": "private"}, "from": user_dict(ADMIN_ID),
+                "text": "Pesan broadcast benchmark",
+            }
+            update_id += 1
+            calls_before = dict(server.calls)
+            started = time.perf_counter()
+            _, latencies = await drive(application, server, [command_update(update_id, ADMIN_ID, "/broadcast", reply_to=source)], 1)
+            job = application.bot_data.get("broadcast_job")
+            if job and job.task:
+                await job.task
+            duration = time.perf_counter() - started
+            result = report("broadcast", job.done if job else 0, duration, latencies, server, calls_before)
+            result.update({"sent": job.sent, "failed": job.failed, "blocked": job.blocked} if job else {})
+            print(f"  hasil       : terkirim {result.get('sent')} | gagal {result.get('failed')} | memblokir {result.get('blocked')}")
+            results.append(result)
+    finally:
+        await bot_module.on_stop(application)
+        await application.shutdown()
+        await bot_module.on_shutdown(application)
+        if redis:
+            await redis.stop()
+            print(f"Perintah Redis: {dict(redis.commands.most_common(8))}")
+
+    if errors:
+        print(f"Error handler: {dict(errors)}")
+    return results, errors
+
+def parse_args(argv=None):
+    parser = argparse.ArgumentParser(description="Benchmark offline bot FSub dengan Bot API tiruan.")
+    parser.add_argument("--users", type=int, default=10000, help="jumlah pengguna terdaftar")
+    parser.add_argument("--channels", type=int, default=3, help="jumlah channel FSub")
+    parser.add_argument("--videos", type=int, default=50, help="jumlah parameter video")
+    parser.add_argument("--starts", type=int, default=2000, help="jumlah update /start")
+    parser.add_argument("--member-events", type=int, default=0, help="jumlah update chat_member (bergabung/keluar) sebelum skenario /start")
+    parser.add_argument("--spam-pct", type=float, default=0, help=f"persentase /start yang dikirim oleh {SPAMMERS} pengguna spam")
+    parser.add_argument("--callbacks", type=int, default=500, help="jumlah callback menu bantuan")
+    parser.add_argument("--concurrency", type=int, default=100, help="jumlah update yang datang bersamaan")
+    parser.add_argument("--latency-ms", type=float, default=30, help="latensi rata-rata Bot API tiruan")
+    parser.add_argument("--jitter-ms", type=float, default=10, help="variasi latensi Bot API tiruan")
+    parser.add_argument("--member-pct", type=float, default=90, help="persentase pengguna yang sudah bergabung per channel")
+    parser.add_argument("--blocked-pct", type=float, default=5, help="persentase pengguna yang memblokir bot")
+    parser.add_argument("--send-limit", type=int, default=1000, help="batas pengiriman per detik sebelum RetryAfter")
+    parser.add_argument("--retry-after-pct", type=float, default=0, help="persentase acak pengiriman yang dibalas RetryAfter")
+    parser.add_argument("--broadcast-rate", type=float, default=900, help="BROADCAST_RATE yang dipakai selama benchmark")
+    parser.add_argument("--skip-broadcast", action="store_true", help="lewati skenario broadcast")
+    parser.add_argument("--state", choices=("file", "redis"), default="file", help="backend state (redis memakai server Redis tiruan di memori)")
+    parser.add_argument("--seed", type=int, default=1)
+    parser.add_argument("--json", help="simpan hasil ke file JSON")
+    parser.add_argument("--max-p99-ms", type=float, help="gagal (exit 1) jika p99 /start melebihi nilai ini")
+    parser.add_argument("--min-throughput", type=float, help="gagal (exit 1) jika throughput /start di bawah nilai ini")
+    parser.add_argument("--verbose", action="store_true", help="tampilkan log bot")
+    return parser.parse_args(argv)
+
+def load_bot_module(args, workdir):
+    """Mengimpor main.py dengan direktori kerja dan variabel lingkungan khusus benchmark."""
+    os.environ["BOT_TOKEN"] = BENCH_TOKEN
+    os.environ["USERS_DB_FILE"] = os.path.join(workdir, "bot_users.db")
+    os.environ["BROADCAST_RATE"] = str(args.broadcast_rate)
+    os.environ["OUTBOUND_GLOBAL_RATE"] = str(args.send_limit)
+    os.environ.setdefault("BROADCAST_PROGRESS_INTERVAL", "5")
+    os.environ["STATE_BACKEND"] = args.state
+    if args.state == "redis":
+        args.redis_port = free_port()
+        os.environ["REDIS_URL"] = f"redis://127.0.0.1:{args.redis_port}/0"
+    os.chdir(workdir)
+    sys.path.insert(0, REPO_DIR)
+    import main as bot_module
+    logging.getLogger().setLevel(logging.INFO if args.verbose else logging.WARNING)
+    return bot_module
+
+def main(argv=None):
+    args = parse_args(argv)
+    with tempfile.TemporaryDirectory(prefix="botfsub-bench-") as workdir:
+        bot_module = load_bot_module(args, workdir)
+        results, errors = asyncio.run(run_benchmark(args, bot_module))
+        os.chdir(REPO_DIR)
+
+    if args.json:
+        with open(args.json, "w") as f:
+            json.dump({"args": vars(args), "results": results, "errors": dict(errors)}, f, indent=4)
+
+    start_result = next((r for r in results if r["workload"].startswith("/start")), None)
+    failed = bool(errors)
+    if start_result and args.max_p99_ms is not None and start_result["p99_ms"] > args.max_p99_ms:
+        print(f"❌ p99 /start {start_result['p99_ms']} ms melebihi batas {args.max_p99_ms} ms")
+        failed = True
+    if start_result and args.min_throughput is not None and start_result["throughput"] < args.min_throughput:
+        print(f"❌ Throughput /start {start_result['throughput']} update/s di bawah batas {args.min_throughput}")
+        failed = True
+    return 1 if failed else 0
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,240 @@
+# Copyright (c) 2025 @hacker.mbrebed
+# This script is licensed under the MIT License.
+# See the LICENSE file for details.
+import sys
+import copy
+import json
+import time
+import queue
+import atexit
+import logging
+import datetime
+import threading
+import contextvars
+import logging.handlers
+
+# --- Logging Tanpa Blokir (Antrean + Thread Penulis) ---
+TEXT_FORMAT = "%(asctime)s - %(levelname)s - %(message)s"
+# Field terstruktur yang ikut ditulis bila ada di record (dari konteks handler atau `extra=`)
+STRUCTURED_FIELDS = ("bot", "handler", "user_id", "chat_id", "channel_id", "broadcast_id", "aggregate", "count")
+
+# Konteks update yang sedang diproses; diisi oleh pembungkus handler di main.py
+log_context = contextvars.ContextVar("log_context", default=None)
+
+class ContextFilter(logging.Filter):
+    """Menambahkan field konteks (bot, handler, user_id, chat_id) ke record tanpa menimpa `extra=`."""
+
+    def __init__(self):
+        super().__init__()
+        # Fungsi opsional yang mengembalikan field tambahan, misalnya {"bot": "123"}
+        self.context_fields = None
+
+    def filter(self, record):
+        fields = log_context.get()
+        if self.context_fields:
+            fields = {**self.context_fields(), **(fields or {})}
+        if fields:
+            for name, value in fields.items():
+                if not hasattr(record, name):
+                    setattr(record, name, value)
+        return True
+
+class AggregateFilter(logging.Filter):
+    """Meringkas record berulang yang diberi `extra={"aggregate": kunci}`.
+
+    Record pertama untuk satu kunci tetap ditulis; record berikutnya dalam `window` detik hanya
+    dihitung, lalu dilaporkan sebagai satu baris ringkasan oleh thread penulis.
+    """
+
+    def __init__(self, window):
+        super().__init__()
+        self.window = window
+        self._lock = threading.Lock()
+        # kunci -> [awal jendela, jumlah yang ditahan, record pertama]
+        self._windows = {}
+        # Ringkasan jendela yang sudah ditutup oleh record baru sebelum thread penulis sempat memeriksanya
+        self._pending = []
+
+    def filter(self, record):
+        key = getattr(record, "aggregate", None)
+        if key is None or self.window <= 0:
+            return True
+        now = time.monotonic()
+        with self._lock:
+            state = self._windows.get(key)
+            if state is None or now - state[0] >= self.window:
+                if state is not None and state[1]:
+                    self._pending.append(self._summary(state[2], state[1], now - state[0]))
+                self._windows[key] = [now, 0, record]
+                return True
+            state[1] += 1
+            return False
+
+    def expired(self, force=False):
+        """Record ringkasan untuk jendela yang sudah lewat (atau semua jendela jika `force`)."""
+        now = time.monotonic()
+        with self._lock:
+            summaries, self._pending = self._pending, []
+            for key, (started, count, first) in list(self._windows.items()):
+                if not force and now - started < self.window:
+                    continue
+                del self._windows[key]
+                if count:
+                    summaries.append(self._summary(first, count, now - started))
+        return summaries
+
+    @staticmethod
+    def _summary(first, count, elapsed):
+        record = logging.LogRecord(
+            first.name, first.levelno, first.pathname, first.lineno,
+            f"{first.aggregate}: {count} kejadian lagi dalam {elapsed:.0f} detik terakhir (contoh pertama: {first.getMessage()})",
+            None, None
+        )
+        for name in STRUCTURED_FIELDS:
+            # user_id milik contoh pertama saja, bukan semua kejadian yang diringkas
+            if name != "user_id" and hasattr(first, name):
+                setattr(record, name, getattr(first, name))
+        record.count = count
+        return record
+
+class JsonFormatter(logging.Formatter):
+    """Satu objek JSON per baris: waktu, level, logger, pesan dan field terstruktur."""
+
+    def format(self, record):
+        entry = {
+            "ts": datetime.datetime.fromtimestamp(record.created, datetime.timezone.utc).isoformat(timespec="milliseconds"),
+            "level": record.levelname,
+            "logger": record.name,
+            "msg": record.getMessage(),
+        }
+        for name in STRUCTURED_FIELDS:
+            value = getattr(record, name, None)
+            if value is not None:
+                entry[name] = value
+        if record.exc_info and not record.exc_text:
+            record.exc_text = self.formatException(record.exc_info)
+        if record.exc_text:
+            entry["exc"] = record.exc_text
+        return json.dumps(entry, ensure_ascii=False, default=str)
+
+class PipelineQueueHandler(logging.handlers.QueueHandler):
+    """QueueHandler yang tidak pernah memblokir: record dibuang (dan dihitung) jika antrean penuh."""
+
+    def __init__(self, log_queue, pipeline, maxsize):
+        super().__init__(log_queue)
+        self.pipeline = pipeline
+        self.maxsize = maxsize
+
+    def enqueue(self, record):
+        # SimpleQueue (implementasi C) jauh lebih murah dari queue.Queue; batasnya cukup diperiksa kira-kira
+        if self.queue.qsize() >= self.maxsize:
+            self.pipeline.dropped += 1
+            return
+        self.queue.put_nowait(record)
+
+    def prepare(self, record):
+        # Pesan dan traceback dirender di sini agar record aman dipindah ke thread lain,
+        # tetapi field terstruktur dibiarkan utuh untuk JsonFormatter
+        record = copy.copy(record)
+        record.msg = record.getMessage()
+        record.args = None
+        if record.exc_info:
+            record.exc_text = logging.Formatter().formatException(record.exc_info)
+            record.exc_info = None
+        return record
+
+class LogPipeline:
+    """Mengalihkan semua logging ke antrean yang ditulis oleh satu thread latar belakang."""
+
+    # Seberapa sering (detik) thread penulis memeriksa ringkasan yang jatuh tempo
+    TICK = 1.0
+
+    def __init__(self):
+        self.context_filter = ContextFilter()
+        self.handlers = []
+        self.dropped = 0
+        self._queue = None
+        self._queue_handler = None
+        self._aggregator = None
+        self._thread = None
+
+    @property
+    def context_fields(self):
+        return self.context_filter.context_fields
+
+    @context_fields.setter
+    def context_fields(self, value):
+        self.context_filter.context_fields = value
+
+    def install(self, level="INFO", fmt="text", path=None, max_bytes=10 * 1024 * 1024, backup_count=5,
+                aggregate_window=10, queue_size=10000):
+        """Memasang pipeline di root logger; aman dipanggil ulang (pipeline lama dihentikan dulu)."""
+        self.stop()
+        formatter = JsonFormatter() if fmt == "json" else logging.Formatter(TEXT_FORMAT)
+        if path:
+            handler = logging.handlers.RotatingFileHandler(path, maxBytes=max_bytes, backupCount=backup_count, encoding="utf-8")
+        else:
+            handler = logging.StreamHandler(sys.stderr)
+        handler.setFormatter(formatter)
+        self.handlers = [handler]
+
+        self._queue = queue.SimpleQueue()
+        self._aggregator = AggregateFilter(aggregate_window)
+        self._queue_handler = PipelineQueueHandler(self._queue, self, queue_size)
+        self._queue_handler.addFilter(self.context_filter)
+        self._queue_handler.addFilter(self._aggregator)
+
+        root = logging.getLogger()
+        for existing in list(root.handlers):
+            root.removeHandler(existing)
+        root.addHandler(self._queue_handler)
+        root.setLevel(level)
+
+        self._thread = threading.Thread(target=self._run, name="log-writer", daemon=True)
+        self._thread.start()
+
+    def stop(self):
+        """Menulis sisa antrean dan ringkasan, lalu menghentikan thread penulis."""
+        if not self._thread:
+            return
+        logging.getLogger().removeHandler(self._queue_handler)
+        self._queue.put(None)
+        self._thread.join()
+        self._thread = None
+        for handler in self.handlers:
+            handler.close()
+
+    def _emit(self, record):
+        for handler in self.handlers:
+            if record.levelno >= handler.level:
+                handler.handle(record)
+
+    def _flush_summaries(self, force=False):
+        for record in self._aggregator.expired(force):
+            self._emit(record)
+        if self.dropped:
+            dropped, self.dropped = self.dropped, 0
+            self._emit(logging.makeLogRecord({
+                "name": "logs", "levelno": logging.WARNING, "levelname": "WARNING", "count": dropped,
+                "msg": f"{dropped} baris log dibuang karena antrean log penuh.",
+            }))
+
+    def _run(self):
+        next_tick = time.monotonic() + self.TICK
+        while True:
+            try:
+                record = self._queue.get(timeout=max(0.0, next_tick - time.monotonic()))
+            except queue.Empty:
+                record = False
+            if record is None:
+                break
+            if record:
+                self._emit(record)
+            if time.monotonic() >= next_tick:
+                self._flush_summaries()
+                next_tick = time.monotonic() + self.TICK
+        # Antrean sudah kosong sampai penanda berhenti; tulis semua ringkasan yang tersisa
+        self._flush_summaries(force=True)
+
+log_pipeline = LogPipeline()
+atexit.register(log_pipeline.stop)
@@ -2,81 +2,636 @@
 # This script is licensed under the MIT License.
 # See the LICENSE file for details.
 import os
+import copy
 import json
+import asyncio
 import logging
 import html
+import time
+import functools
+import signal
+import contextvars
+import uuid
+import io
+import csv
+import gzip
+import tempfile
+import cProfile
+import pstats
+import tracemalloc
+import heapq
+import itertools
+import datetime
+from collections import OrderedDict
 
-from telegram import Update, InlineKeyboardButton, InlineKeyboardMarkup, ChatMember
+from telegram import Update, InlineKeyboardButton, InlineKeyboardMarkup, ChatMember, Message, InputMediaVideo
 from telegram.ext import (
     Application, 
     CommandHandler, 
+    MessageHandler,
     ContextTypes,
-    CallbackQueryHandler
+    CallbackQueryHandler,
+    ChatMemberHandler,
+    TypeHandler,
+    ApplicationHandlerStop,
+    BaseRateLimiter,
+    BaseUpdateProcessor,
+    filters
 )
-from telegram.constants import ParseMode, ChatMemberStatus
-from telegram.error import Forbidden
-
-# Konfigurasi logging
-logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(levelname)s - %(message)s')
+from telegram.request import BaseRequest, HTTPXRequest
+from telegram.constants import ParseMode, ChatMemberStatus, ChatType, MessageEntityType
+from telegram.error import Forbidden, RetryAfter, TelegramError
 
 # Memuat variabel dari file .env
 from dotenv import load_dotenv
 load_dotenv()
 
+# Konfigurasi logging: ditulis oleh thread latar belakang agar event loop tidak pernah menunggu disk/terminal
+from logs import log_pipeline, log_context
+LOG_LEVEL = os.getenv("LOG_LEVEL", "INFO").upper()
+# "text" (format lama) atau "json" (satu objek JSON per baris dengan field handler/user_id/chat_id)
+LOG_FORMAT = os.getenv("LOG_FORMAT", "text").lower()
+# Kosong = tulis ke stderr; jika diisi, file dirotasi setelah LOG_MAX_BYTES dan disimpan LOG_BACKUP_COUNT cadangan
+LOG_FILE = os.getenv("LOG_FILE", "")
+LOG_MAX_BYTES = int(os.getenv("LOG_MAX_BYTES", str(10 * 1024 * 1024)))
+LOG_BACKUP_COUNT = int(os.getenv("LOG_BACKUP_COUNT", "5"))
+# Error berulang (mis. pengguna memblokir bot saat broadcast) diringkas per jendela ini (detik); 0 = matikan
+LOG_AGGREGATE_WINDOW = float(os.getenv("LOG_AGGREGATE_WINDOW", "10"))
+LOG_QUEUE_SIZE = int(os.getenv("LOG_QUEUE_SIZE", "10000"))
+
+log_pipeline.install(
+    level=LOG_LEVEL, fmt=LOG_FORMAT, path=LOG_FILE or None, max_bytes=LOG_MAX_BYTES,
+    backup_count=LOG_BACKUP_COUNT, aggregate_window=LOG_AGGREGATE_WINDOW, queue_size=LOG_QUEUE_SIZE
+)
+# httpx mencatat setiap request Bot API di level INFO (satu baris per pesan broadcast)
+if LOG_LEVEL != "DEBUG":
+    logging.getLogger("httpx").setLevel(logging.WARNING)
+
+if LOG_FORMAT not in ("text", "json"):
+    logging.error(f"❌ LOG_FORMAT '{LOG_FORMAT}' tidak dikenal. Gunakan 'text' atau 'json'.")
+    exit()
+
+from store import SQLiteDatabase, BroadcastLedger, MembershipStore, VideoStatsStore, Segment, USERS_DB_FILE
+from metrics import metrics, MetricsServer
+from state import FileBackend, RedisBackend, RedisError
+
 # Mengambil token bot dari variabel lingkungan
 BOT_TOKEN = os.getenv("BOT_TOKEN")
+# Mode multi-bot: beberapa token (dipisah koma) dijalankan dalam satu proses; data tiap bot di TENANTS_DIR/<id bot>/
+BOT_TOKENS = [token.strip() for token in os.getenv("BOT_TOKENS", "").split(",") if token.strip()]
+TENANTS_DIR = os.getenv("TENANTS_DIR", "tenants")
+# Ukuran kolam koneksi HTTP yang dibagi semua bot di mode multi-bot
+TENANT_POOL_SIZE = int(os.getenv("TENANT_POOL_SIZE", "128"))
 
 # Validasi BOT_TOKEN
-if not BOT_TOKEN:
+if not BOT_TOKEN and not BOT_TOKENS:
     logging.error("❌ BOT_TOKEN tidak ditemukan di file .env. Pastikan Anda sudah mengisinya.")
     exit()
 
+# Mode menjalankan bot: "polling" (default) atau "webhook"
+RUN_MODE = os.getenv("RUN_MODE", "polling").strip().lower()
+WEBHOOK_LISTEN = os.getenv("WEBHOOK_LISTEN", "0.0.0.0")
+WEBHOOK_PORT = int(os.getenv("WEBHOOK_PORT", "8443"))
+WEBHOOK_PATH = os.getenv("WEBHOOK_PATH", "").strip("/")
+# URL publik yang didaftarkan ke Telegram, misalnya https://bot.domainanda.com (tanpa path)
+WEBHOOK_URL = os.getenv("WEBHOOK_URL", "").rstrip("/")
+WEBHOOK_SECRET = os.getenv("WEBHOOK_SECRET") or None
+WEBHOOK_MAX_CONNECTIONS = int(os.getenv("WEBHOOK_MAX_CONNECTIONS", "40"))
+
+# Endpoint metrik Prometheus (kosongkan METRICS_PORT untuk menonaktifkan)
+METRICS_HOST = os.getenv("METRICS_HOST", "127.0.0.1")
+METRICS_PORT = int(os.getenv("METRICS_PORT") or 0)
+
+# Backend state: "file" (bot_config.json + SQLite lokal, satu replika) atau "redis" (dibagi antar replika)
+STATE_BACKEND = os.getenv("STATE_BACKEND", "file").strip().lower()
+REDIS_URL = os.getenv("REDIS_URL", "redis://127.0.0.1:6379/0")
+REDIS_PREFIX = os.getenv("REDIS_PREFIX", "botfsub")
+# Seberapa sering (detik) perubahan konfigurasi dari replika lain diperiksa
+STATE_SYNC_INTERVAL = float(os.getenv("STATE_SYNC_INTERVAL", "5"))
+# Broadcast dibagi ke REPLICA_COUNT replika berdasarkan hash user_id; setiap replika punya REPLICA_INDEX unik
+REPLICA_COUNT = int(os.getenv("REPLICA_COUNT", "1"))
+REPLICA_INDEX = int(os.getenv("REPLICA_INDEX", "0"))
+
+if STATE_BACKEND not in ("file", "redis"):
+    logging.error(f"❌ STATE_BACKEND '{STATE_BACKEND}' tidak dikenal. Gunakan 'file' atau 'redis'.")
+    exit()
+if REPLICA_COUNT > 1 and STATE_BACKEND != "redis":
+    logging.error("❌ REPLICA_COUNT lebih dari 1 membutuhkan STATE_BACKEND=redis.")
+    exit()
+if not 0 <= REPLICA_INDEX < REPLICA_COUNT:
+    logging.error(f"❌ REPLICA_INDEX harus antara 0 dan {REPLICA_COUNT - 1}.")
+    exit()
+
+# Validasi konfigurasi webhook
+if RUN_MODE not in ("polling", "webhook"):
+    logging.error(f"❌ RUN_MODE '{RUN_MODE}' tidak dikenal. Gunakan 'polling' atau 'webhook'.")
+    exit()
+if RUN_MODE == "webhook" and not WEBHOOK_URL:
+    logging.error("❌ WEBHOOK_URL wajib diisi di file .env jika RUN_MODE=webhook.")
+    exit()
+if RUN_MODE == "webhook" and BOT_TOKENS:
+    logging.error("❌ Mode multi-bot (BOT_TOKENS) saat ini hanya mendukung RUN_MODE=polling.")
+    exit()
+
 # --- Fungsi dan Utilitas Konfigurasi ---
+CONFIG_FILE = "bot_config.json"
+# Jeda (detik) sebelum perubahan konfigurasi ditulis ke disk, agar perubahan beruntun digabung jadi satu tulisan
+CONFIG_FLUSH_DELAY = float(os.getenv("CONFIG_FLUSH_DELAY", "2"))
+
+DEFAULT_CONFIG = {
+    "admin_ids": [],
+    "fsub_channels": [],
+    "fsub_buttons": [],
+    "welcome_message": "❌ Anda belum bergabung ke channel kami.\n\nSilakan bergabung ke channel berikut untuk bisa menggunakan bot ini.",
+    "photo_id": None,
+    "videos": {},
+    "bundles": {}
+}
+
+class ConfigStore:
+    """Menyimpan konfigurasi di memori dan menuliskannya ke backend state secara tertunda (write-behind).
+
+    Dengan backend bersama, perubahan dari replika lain dimuat setiap backend.sync_interval detik.
+    """
+
+    def __init__(self, backend, flush_delay=CONFIG_FLUSH_DELAY):
+        self.backend = backend
+        self.flush_delay = flush_delay
+        self.data = self._with_defaults(backend.initial_config())
+        # Dipanggil setelah konfigurasi dimuat ulang dari replika lain, untuk membuang cache turunannya
+        self.on_reload = None
+        self._dirty = False
+        self._wakeup = None
+        self._lock = None
+        self._writer_task = None
+
+    @staticmethod
+    def _with_defaults(data):
+        for key, value in DEFAULT_CONFIG.items():
+            data.setdefault(key, copy.deepcopy(value))
+        return data
+
+    def _replace(self, data):
+        # Diganti di tempat: handler yang sedang memegang dict lama tetap melihat isi terbaru
+        data = self._with_defaults(data)
+        self.data.clear()
+        self.data.update(data)
+
+    def mark_dirty(self):
+        """Menandai konfigurasi telah berubah; penulisan dilakukan oleh task latar belakang."""
+        self._dirty = True
+        if self._wakeup is not None:
+            self._wakeup.set()
+
+    async def start(self):
+        """Memuat konfigurasi bersama (jika ada) dan menjalankan task penulis latar belakang."""
+        self._wakeup = asyncio.Event()
+        self._lock = asyncio.Lock()
+        remote = await self.backend.load_config()
+        if remote is None and self.backend.shared:
+            # Backend bersama masih kosong: isi lokal (bot_config.json lama) menjadi konfigurasi awal
+            remote = await self.backend.seed_config(self.data)
+        if remote:
+            self._replace(remote)
+        if self._dirty:
+            self._wakeup.set()
+        self._writer_task = asyncio.create_task(self._writer_loop())
+
+    async def stop(self):
+        """Menghentikan task penulis dan menyimpan perubahan yang tersisa."""
+        if self._writer_task:
+            self._writer_task.cancel()
+            try:
+                await self._writer_task
+            except asyncio.CancelledError:
+                pass
+            self._writer_task = None
+        await self.flush()
+
+    async def _writer_loop(self):
+        while True:
+            try:
+                await asyncio.wait_for(self._wakeup.wait(), timeout=self.backend.sync_interval)
+            except asyncio.TimeoutError:
+                await self.sync()
+                continue
+            # Tunggu sebentar agar perubahan beruntun ikut tertulis dalam satu kali simpan
+            await asyncio.sleep(self.flush_delay)
+            self._wakeup.clear()
+            await self.flush()
+
+    async def flush(self):
+        """Menulis konfigurasi ke backend jika ada perubahan."""
+        if self._lock is None:
+            self._lock = asyncio.Lock()
+        async with self._lock:
+            if not self._dirty:
+                return
+            self._dirty = False
+            try:
+                await self.backend.save_config(self.data)
+            except (OSError, RedisError) as e:
+                self._dirty = True
+                logging.error(f"Gagal menyimpan konfigurasi ke {self.backend.location}: {e}")
+
+    async def sync(self):
+        """Memuat konfigurasi yang diubah replika lain; kunci yang diubah lokal dan belum tersimpan tetap dipakai."""
+        async with self._lock:
+            try:
+                remote = await self.backend.fetch_config(self.data)
+            except (OSError, RedisError) as e:
+                logging.warning(f"Gagal memeriksa perubahan konfigurasi di {self.backend.location}: {e}")
+                return
+            if remote is None:
+                return
+            self._replace(remote)
+        logging.info("Konfigurasi dimuat ulang dari backend bersama.")
+        if self.on_reload:
+            self.on_reload()
+
+# Bot (tenant) yang sedang dilayani. Setiap bot di mode multi-bot berjalan dalam konteks asyncio-nya
+# sendiri, sehingga semua task turunannya (handler, broadcast, flusher) melihat state bot tersebut.
+current_tenant = contextvars.ContextVar("current_tenant")
+
+def tenant():
+    """Mengembalikan state (konfigurasi, penyimpanan, cache) milik bot yang sedang berjalan."""
+    return current_tenant.get()
+
 def get_config():
-    """Membaca konfigurasi bot dari bot_config.json."""
-    try:
-        with open("bot_config.json", "r") as f:
-            return json.load(f)
-    except (FileNotFoundError, json.JSONDecodeError):
-        # Buat konfigurasi default jika file tidak ada
-        return {
-            "admin_ids": [],
-            "fsub_channels": [],
-            "fsub_buttons": [],
-            "welcome_message": "❌ Anda belum bergabung ke channel kami.\n\nSilakan bergabung ke channel berikut untuk bisa menggunakan bot ini.",
-            "photo_id": None,
-            "videos": {},
-            "user_ids": []
-        }
+    """Mengembalikan konfigurasi bot yang tersimpan di memori."""
+    return tenant().config_store.data
 
 def save_config(config):
-    """Menyimpan konfigurasi bot ke bot_config.json. (SUDAH DIPERBAIKI)"""
-    with open("bot_config.json", "w") as f:
-        json.dump(config, f, indent=4)
+    """Menandai konfigurasi bot untuk disimpan ke backend state oleh penulis latar belakang."""
+    config_store = tenant().config_store
+    if config is not config_store.data:
+        config_store.data = config
+    config_store.mark_dirty()
+
+# --- Cache dan Pemutus Sirkuit untuk Pemeriksaan FSub ---
+# Batas waktu (detik) untuk satu panggilan get_chat_member
+FSUB_CHECK_TIMEOUT = float(os.getenv("FSUB_CHECK_TIMEOUT", "5"))
+# Masa berlaku cache (detik) untuk pengguna yang sudah bergabung / belum bergabung
+MEMBERSHIP_CACHE_TTL = float(os.getenv("MEMBERSHIP_CACHE_TTL", "300"))
+MEMBERSHIP_NEGATIVE_TTL = float(os.getenv("MEMBERSHIP_NEGATIVE_TTL", "5"))
+MEMBERSHIP_CACHE_SIZE = int(os.getenv("MEMBERSHIP_CACHE_SIZE", "100000"))
+# Jumlah kegagalan beruntun sebelum channel dilewati, dan lama jedanya (detik)
+CHANNEL_BREAKER_THRESHOLD = int(os.getenv("CHANNEL_BREAKER_THRESHOLD", "3"))
+CHANNEL_BREAKER_COOLDOWN = float(os.getenv("CHANNEL_BREAKER_COOLDOWN", "60"))
+# Usia maksimal (detik) entri indeks keanggotaan sebelum diperiksa ulang lewat get_chat_member
+MEMBERSHIP_INDEX_MAX_AGE = float(os.getenv("MEMBERSHIP_INDEX_MAX_AGE", str(7 * 24 * 3600)))
+
+MEMBER_STATUSES = (ChatMemberStatus.MEMBER, ChatMemberStatus.ADMINISTRATOR, ChatMemberStatus.OWNER)
+
+class TTLCache:
+    """Cache LRU berukuran terbatas dengan masa berlaku per entri."""
+
+    def __init__(self, maxsize):
+        self.maxsize = maxsize
+        self._data = OrderedDict()
+
+    def get(self, key, default=None):
+        item = self._data.get(key)
+        if item is None:
+            return default
+        value, expires_at = item
+        if expires_at < time.monotonic():
+            del self._data[key]
+            return default
+        self._data.move_to_end(key)
+        return value
+
+    def set(self, key, value, ttl):
+        self._data[key] = (value, time.monotonic() + ttl)
+        self._data.move_to_end(key)
+        if len(self._data) > self.maxsize:
+            self._data.popitem(last=False)
+
+    def pop(self, key, default=None):
+        item = self._data.pop(key, None)
+        return default if item is None else item[0]
+
+    def clear(self):
+        self._data.clear()
+
+    def __len__(self):
+        return len(self._data)
+
+class CircuitBreaker:
+    """Menghentikan sementara panggilan ke channel yang terus gagal (misalnya bot sudah dikeluarkan)."""
+
+    def __init__(self, threshold=CHANNEL_BREAKER_THRESHOLD, cooldown=CHANNEL_BREAKER_COOLDOWN):
+        self.threshold = threshold
+        self.cooldown = cooldown
+        self.failures = 0
+        self.open_until = 0.0
+
+    def allow(self):
+        """Setelah masa jeda habis, satu panggilan percobaan diizinkan lagi (half-open).
+
+        Panggilan lain tetap ditolak sampai percobaan itu berhasil atau gagal; jika hasilnya tidak
+        pernah tercatat (misalnya dibatalkan), percobaan berikutnya diizinkan setelah jeda lagi.
+        """
+        now = time.monotonic()
+        if now < self.open_until:
+            return False
+        if self.failures >= self.threshold:
+            self.open_until = now + self.cooldown
+        return True
+
+    def record_success(self):
+        self.failures = 0
+        self.open_until = 0.0
+
+    def record_failure(self):
+        """Mencatat kegagalan; mengembalikan True jika sirkuit baru saja dibuka."""
+        self.failures += 1
+        if self.failures >= self.threshold:
+            self.open_until = time.monotonic() + self.cooldown
+            return True
+        return False
+
+def cache_membership(channel_id: int, user_id: int, is_member: bool):
+    tenant().membership_cache.set((channel_id, user_id), is_member, MEMBERSHIP_CACHE_TTL if is_member else MEMBERSHIP_NEGATIVE_TTL)
+
+async def check_channel_membership(bot, channel_id: int, user_id: int):
+    """Memeriksa keanggotaan pengguna di satu channel, memakai cache dan pemutus sirkuit."""
+    state = tenant()
+    cache_key = (channel_id, user_id)
+    cached = state.membership_cache.get(cache_key)
+    if cached is not None:
+        return cached
+
+    breaker = state.channel_breakers.setdefault(channel_id, CircuitBreaker())
+    if not breaker.allow():
+        return False
+
+    try:
+        member: ChatMember = await asyncio.wait_for(
+            bot.get_chat_member(chat_id=channel_id, user_id=user_id),
+            timeout=FSUB_CHECK_TIMEOUT
+        )
+    except Exception as e:
+        if breaker.record_failure():
+            logging.error(f"Error checking subscription for channel {channel_id}: {e!r}. Channel dilewati selama {breaker.cooldown:.0f} detik.", extra={"channel_id": channel_id})
+        else:
+            logging.error(f"Error checking subscription for channel {channel_id}: {e!r}", extra={"aggregate": f"fsub_check:{channel_id}", "channel_id": channel_id})
+        return False
+
+    breaker.record_success()
+    is_member = member.status in MEMBER_STATUSES
+    cache_membership(channel_id, user_id, is_member)
+    if channel_id in state.tracked_channels:
+        state.membership_store.record(channel_id, user_id, is_member)
+    return is_member
 
 async def check_subscription(context: ContextTypes.DEFAULT_TYPE, user_id: int):
-    """Memeriksa apakah pengguna berlangganan ke saluran yang diperlukan."""
+    """Memeriksa apakah pengguna berlangganan ke saluran yang diperlukan.
+
+    Urutan sumber: cache di memori, indeks keanggotaan lokal (untuk channel yang dilacak lewat
+    update chat_member), lalu get_chat_member untuk channel yang sisanya, semuanya bersamaan.
+    """
+    state = tenant()
     config = get_config()
-    channels_to_check = config.get("fsub_channels", [])
-    
-    unsubscribed_channels = []
+    channels_to_check = list(config.get("fsub_channels", []))
 
+    results = {}
     for channel_id in channels_to_check:
-        try:
-            member: ChatMember = await context.bot.get_chat_member(chat_id=channel_id, user_id=user_id)
-            if member.status not in [ChatMemberStatus.MEMBER, ChatMemberStatus.ADMINISTRATOR, ChatMemberStatus.OWNER]:
-                unsubscribed_channels.append(channel_id)
-        except Exception as e:
-            logging.error(f"Error checking subscription for channel {channel_id}: {e}")
-            unsubscribed_channels.append(channel_id)
+        cached = state.membership_cache.get((channel_id, user_id))
+        if cached is not None:
+            results[channel_id] = cached
+    if results:
+        metrics.inc("membership_lookups_total", len(results), source="cache")
+
+    indexed_channels = [channel_id for channel_id in channels_to_check if channel_id not in results and channel_id in state.tracked_channels]
+    if indexed_channels:
+        known = await state.membership_store.lookup(user_id, indexed_channels, MEMBERSHIP_INDEX_MAX_AGE)
+        for channel_id, is_member in known.items():
+            results[channel_id] = is_member
+            cache_membership(channel_id, user_id, is_member)
+        if known:
+            metrics.inc("membership_lookups_total", len(known), source="index")
+
+    remaining_channels = [channel_id for channel_id in channels_to_check if channel_id not in results]
+    if remaining_channels:
+        metrics.inc("membership_lookups_total", len(remaining_channels), source="api")
+        checked = await asyncio.gather(
+            *(check_channel_membership(context.bot, channel_id, user_id) for channel_id in remaining_channels)
+        )
+        results.update(zip(remaining_channels, checked))
+
+    unsubscribed_channels = [channel_id for channel_id in channels_to_check if not results[channel_id]]
 
     return len(unsubscribed_channels) == 0, unsubscribed_channels
 
+async def refresh_tracked_channels(bot, channel_ids=None):
+    """Memeriksa di channel FSub mana bot menjadi admin (sehingga update chat_member diterima)."""
+    if tenant().backend.shared:
+        # Update chat_member hanya sampai ke satu replika; indeks lokal replika lain akan basi
+        return
+    if channel_ids is None:
+        channel_ids = list(get_config().get("fsub_channels", []))
+    results = await asyncio.gather(
+        *(bot.get_chat_member(chat_id=channel_id, user_id=bot.id) for channel_id in channel_ids),
+        return_exceptions=True
+    )
+    for channel_id, result in zip(channel_ids, results):
+        if not isinstance(result, Exception) and result.status in (ChatMemberStatus.ADMINISTRATOR, ChatMemberStatus.OWNER):
+            tenant().tracked_channels.add(channel_id)
+        else:
+            logging.warning(f"Bot bukan admin di channel {channel_id}; keanggotaan diperiksa lewat get_chat_member.")
+            await untrack_channel(channel_id)
+
+async def untrack_channel(channel_id: int):
+    """Berhenti mempercayai indeks channel ini dan membuang isinya."""
+    state = tenant()
+    state.tracked_channels.discard(channel_id)
+    await state.membership_store.forget_channel(channel_id)
+
+async def track_chat_member(update: Update, context: ContextTypes.DEFAULT_TYPE):
+    """Memperbarui indeks keanggotaan dari update chat_member (bergabung, keluar, dikeluarkan)."""
+    member_update = update.chat_member
+    channel_id = member_update.chat.id
+    state = tenant()
+    if channel_id not in state.tracked_channels:
+        return
+    user_id = member_update.new_chat_member.user.id
+    is_member = member_update.new_chat_member.status in MEMBER_STATUSES
+    state.membership_store.record(channel_id, user_id, is_member)
+    cache_membership(channel_id, user_id, is_member)
+
+async def track_my_chat_member(update: Update, context: ContextTypes.DEFAULT_TYPE):
+    """Memantau status bot sendiri di channel FSub; indeks hanya dipercaya selama bot menjadi admin."""
+    member_update = update.my_chat_member
+    channel_id = member_update.chat.id
+    if channel_id not in get_config().get("fsub_channels", []):
+        return
+    if member_update.new_chat_member.status in (ChatMemberStatus.ADMINISTRATOR, ChatMemberStatus.OWNER):
+        if tenant().backend.shared:
+            return
+        tracked_channels = tenant().tracked_channels
+        if channel_id not in tracked_channels:
+            logging.info(f"Bot menjadi admin di channel {channel_id}; keanggotaan mulai dilacak.")
+        tracked_channels.add(channel_id)
+    else:
+        logging.warning(f"Bot bukan lagi admin di channel {channel_id}; indeks keanggotaan dihapus.")
+        await untrack_channel(channel_id)
+
 async def check_is_admin(update: Update):
     """Memeriksa apakah pengguna yang menjalankan perintah adalah admin."""
     config = get_config()
     return update.effective_user.id in config.get("admin_ids", [])
 
+# Jumlah maksimal media dalam satu send_media_group
+MEDIA_GROUP_LIMIT = 10
+
+# --- Balasan FSub yang Sudah Dirender ---
+COBA_LAGI_TEXT = "🔄 𝐂𝐨𝐛𝐚 𝐋𝐚𝐠𝐢"
+
+class FsubReply:
+    """Caption, baris tombol FSub (pola 2-1-2-1) dan photo_id yang dibangun sekali dari konfigurasi."""
+
+    def __init__(self, config):
+        welcome_message = config.get('welcome_message', DEFAULT_CONFIG["welcome_message"])
+        self.text = (
+            f"<blockquote>{html.escape(welcome_message)}</blockquote>\n"
+            f"<blockquote>𝘗𝘰𝘸𝘦𝘳𝘦𝘥 𝘣𝘰𝘵 𝘣𝘺 𝕂𝕒𝕚𝕤𝕒𝕣 𝕌𝕕𝕚𝕟👑</blockquote>"
+        )
+        self.photo_id = config.get("photo_id")
+        self.rows = self._build_rows(config.get("fsub_buttons", []))
+
+    @staticmethod
+    def _build_rows(fsub_btns_list):
+        keyboard_buttons = []
+        i = 0
+        while i < len(fsub_btns_list):
+            
+            if (len(fsub_btns_list) - i >= 2) and (len(keyboard_buttons) % 2 == 0):
+                
+                btn1_data = fsub_btns_list[i]
+                btn2_data = fsub_btns_list[i+1]
+                
+                btn1 = InlineKeyboardButton(btn1_data.get("text"), url=btn1_data.get("url"))
+                btn2 = InlineKeyboardButton(btn2_data.get("text"), url=btn2_data.get("url"))
+                
+                keyboard_buttons.append((btn1, btn2))
+                i += 2
+            
+            else:
+                btn_data = fsub_btns_list[i]
+                btn = InlineKeyboardButton(btn_data.get("text"), url=btn_data.get("url"))
+                
+                keyboard_buttons.append((btn,))
+                i += 1
+        return tuple(keyboard_buttons)
+
+def get_fsub_reply():
+    """Mengembalikan balasan FSub dari cache; dibangun ulang hanya setelah konfigurasi berubah."""
+    state = tenant()
+    if state.fsub_reply is None:
+        state.fsub_reply = FsubReply(get_config())
+    return state.fsub_reply
+
+def invalidate_fsub_reply():
+    """Dipanggil oleh perintah admin yang mengubah tombol, pesan sambutan atau gambar FSub."""
+    tenant().fsub_reply = None
+
+# --- Perlindungan Flood per Pengguna ---
+# Laju isi ulang (update/detik) dan ledakan maksimal untuk /start dan tombol inline per pengguna
+FLOOD_RATE = float(os.getenv("FLOOD_RATE", "0.5"))
+FLOOD_BURST = float(os.getenv("FLOOD_BURST", "5"))
+FLOOD_CACHE_SIZE = int(os.getenv("FLOOD_CACHE_SIZE", "100000"))
+# "reply": kirim peringatan (paling sering sekali per FLOOD_NOTICE_INTERVAL detik), "silent": abaikan saja
+FLOOD_ACTION = os.getenv("FLOOD_ACTION", "reply").lower()
+FLOOD_NOTICE_INTERVAL = float(os.getenv("FLOOD_NOTICE_INTERVAL", "30"))
+FLOOD_NOTICE_TEXT = "⏳ Terlalu cepat! Tunggu sebentar sebelum mencoba lagi."
+
+if FLOOD_ACTION not in ("reply", "silent"):
+    logging.error("Error: FLOOD_ACTION harus 'reply' atau 'silent'.")
+    exit()
+
+metrics.describe("flood_dropped_total", "Jumlah update yang diabaikan karena pengguna mengirim terlalu cepat.")
+
+class FloodLimiter:
+    """Token bucket per pengguna yang disimpan di TTLCache agar memori tetap terbatas.
+
+    Entri kedaluwarsa setelah bucket-nya pasti penuh kembali, sehingga pengguna yang diam
+    tidak perlu disimpan sama sekali.
+    """
+
+    def __init__(self, rate=FLOOD_RATE, burst=FLOOD_BURST, maxsize=FLOOD_CACHE_SIZE):
+        self.rate = rate
+        self.burst = burst
+        self.buckets = TTLCache(maxsize)
+        self.notices = TTLCache(maxsize)
+
+    def allow(self, user_id):
+        now = time.monotonic()
+        tokens, updated = self.buckets.get(user_id, (self.burst, now))
+        tokens = min(self.burst, tokens + (now - updated) * self.rate)
+        allowed = tokens >= 1
+        if allowed:
+            tokens -= 1
+        self.buckets.set(user_id, (tokens, now), (self.burst - tokens) / self.rate)
+        return allowed
+
+    def should_notify(self, user_id):
+        """True paling sering sekali per FLOOD_NOTICE_INTERVAL untuk tiap pengguna."""
+        if self.notices.get(user_id):
+            return False
+        self.notices.set(user_id, True, FLOOD_NOTICE_INTERVAL)
+        return True
+
+def is_start_command(message, bot_username):
+    """True hanya untuk perintah /start atau /start@username_bot (bukan /startxyz atau /start_x)."""
+    entity = message.entities[0] if message.entities else None
+    if not entity or entity.type != MessageEntityType.BOT_COMMAND or entity.offset != 0:
+        return False
+    command, _, target = message.text[1:entity.length].partition("@")
+    return command == "start" and (not target or target.lower() == (bot_username or "").lower())
+
+async def flood_guard(update: Update, context: ContextTypes.DEFAULT_TYPE):
+    """Dijalankan sebelum semua handler lain; menghentikan /start dan callback dari pengguna yang spam."""
+    message = update.message
+    if update.callback_query:
+        kind = "callback"
+    elif message and is_start_command(message, context.bot.username):
+        kind = "start"
+    else:
+        return
+    user = update.effective_user
+    if user is None or user.id in get_config().get("admin_ids", []) or tenant().flood_limiter.allow(user.id):
+        return
+
+    metrics.inc("flood_dropped_total", kind=kind)
+    if FLOOD_ACTION == "reply" and tenant().flood_limiter.should_notify(user.id):
+        try:
+            if kind == "callback":
+                await update.callback_query.answer(FLOOD_NOTICE_TEXT)
+            else:
+                await message.reply_text(f"<blockquote>{FLOOD_NOTICE_TEXT}</blockquote>", parse_mode=ParseMode.HTML)
+        except Exception as e:
+            logging.warning(f"Gagal mengirim peringatan flood ke pengguna {user.id}: {e}", extra={"aggregate": "flood_notice"})
+    raise ApplicationHandlerStop
+
+# --- Statistik Link Video ---
+# Klik "Coba Lagi" dihitung sebagai konversi jika video terkirim dalam jendela ini (detik) setelah tertahan FSub
+FSUB_CONVERSION_WINDOW = float(os.getenv("FSUB_CONVERSION_WINDOW", str(24 * 3600)))
+CONVERSION_CACHE_SIZE = int(os.getenv("CONVERSION_CACHE_SIZE", "100000"))
+
+def record_video_click(user_id, parameter, is_subscribed):
+    state = tenant()
+    state.video_stats_store.incr(parameter, "clicks")
+    if not is_subscribed:
+        state.video_stats_store.incr(parameter, "fsub_blocked")
+        state.fsub_blocked_links.set((user_id, parameter), True, FSUB_CONVERSION_WINDOW)
+
+def record_video_delivery(user_id, parameter):
+    state = tenant()
+    state.video_stats_store.incr(parameter, "deliveries")
+    if state.fsub_blocked_links.pop((user_id, parameter)):
+        state.video_stats_store.incr(parameter, "conversions")
+
 # --- Handler Perintah Bot (Untuk Semua Pengguna) ---
 async def setup_command(update: Update, context: ContextTypes.DEFAULT_TYPE):
     """Menangani perintah /setup untuk mengatur admin pertama."""
@@ -97,62 +652,30 @@ async def start_command(update: Update, context: ContextTypes.DEFAULT_TYPE):
     if not config["admin_ids"]:
         await update.message.reply_text("<blockquote><u><b>HAO!</b> Bot ini dikembangkan oleh 𝕂𝕒𝕚𝕤𝕒𝕣 𝕌𝕕𝕚𝕟👑</u>\n\nKonfigurasi dulu botnya sebelum digunakan, dengan perintah /setup.</blockquote>", parse_mode=ParseMode.HTML)
         return
-        
-    user_ids = set(config.get("user_ids", []))
-    user_ids.add(update.effective_user.id)
-    config["user_ids"] = list(user_ids)
-    save_config(config)
 
     user_id = update.effective_user.id
     start_parameter = context.args[0] if context.args else None
+    is_video_link = bool(start_parameter) and (start_parameter in config.get("videos", {}) or start_parameter in config.get("bundles", {}))
+    if is_video_link:
+        tenant().video_open_store.record(user_id, start_parameter)
     
     is_subscribed, _ = await check_subscription(context, user_id)
+    tenant().user_store.touch(user_id, subscribed=is_subscribed)
+    if is_video_link:
+        record_video_click(user_id, start_parameter, is_subscribed)
     
     if not is_subscribed:
-        welcome_message = config.get('welcome_message', '❌ Anda belum bergabung ke channel kami.\n\nSilakan bergabung ke channel berikut untuk bisa menggunakan bot ini.')
-        
-        message_text = (
-            f"<blockquote>{html.escape(welcome_message)}</blockquote>\n"
-            f"<blockquote>𝘗𝘰𝘸𝘦𝘳𝘦𝘥 𝘣𝘰𝘵 𝘣𝘺 𝕂𝕒𝕚𝕤𝕒𝕣 𝕌𝕕𝕚𝕟👑</blockquote>"
-        )
-        
-        keyboard_buttons = []
-        fsub_btns_list = config.get("fsub_buttons", [])
+        fsub_reply = get_fsub_reply()
         
-        i = 0
-        while i < len(fsub_btns_list):
-            
-            if (len(fsub_btns_list) - i >= 2) and (len(keyboard_buttons) % 2 == 0):
-                
-                btn1_data = fsub_btns_list[i]
-                btn2_data = fsub_btns_list[i+1]
-                
-                btn1 = InlineKeyboardButton(btn1_data.get("text"), url=btn1_data.get("url"))
-                btn2 = InlineKeyboardButton(btn2_data.get("text"), url=btn2_data.get("url"))
-                
-                keyboard_buttons.append([btn1, btn2])
-                i += 2
-            
-            elif i < len(fsub_btns_list):
-                btn_data = fsub_btns_list[i]
-                btn = InlineKeyboardButton(btn_data.get("text"), url=btn_data.get("url"))
-                
-                keyboard_buttons.append([btn])
-                i += 1
-                
         start_parameter_val = start_parameter or ''
-        coba_lagi_text = "🔄 𝐂𝐨𝐛𝐚 𝐋𝐚𝐠𝐢" 
         coba_lagi_link = f"https://t.me/{context.bot.username}?start={start_parameter_val}"
         
-        keyboard_buttons.append([InlineKeyboardButton(coba_lagi_text, url=coba_lagi_link)]) 
-        
-        keyboard = InlineKeyboardMarkup(keyboard_buttons)
-        photo_id = config.get("photo_id")
+        keyboard = InlineKeyboardMarkup(fsub_reply.rows + ((InlineKeyboardButton(COBA_LAGI_TEXT, url=coba_lagi_link),),))
         
-        if photo_id:
-            await update.message.reply_photo(photo=photo_id, caption=message_text, reply_markup=keyboard, parse_mode=ParseMode.HTML)
+        if fsub_reply.photo_id:
+            await update.message.reply_photo(photo=fsub_reply.photo_id, caption=fsub_reply.text, reply_markup=keyboard, parse_mode=ParseMode.HTML)
         else:
-            await update.message.reply_text(message_text, reply_markup=keyboard, parse_mode=ParseMode.HTML)
+            await update.message.reply_text(fsub_reply.text, reply_markup=keyboard, parse_mode=ParseMode.HTML)
     else:
         video_list = config.get("videos", {})
         
@@ -161,15 +684,39 @@ async def start_command(update: Update, context: ContextTypes.DEFAULT_TYPE):
             return
 
         video_to_send = video_list.get(start_parameter)
+        bundle_to_send = config.get("bundles", {}).get(start_parameter)
+        caption_text = "Enjoy aja nontonnya☕\n\n<blockquote>𝘗𝘰𝘸𝘦𝘳𝘦𝘥 𝘣𝘰𝘵 𝘣𝘺 𝕂𝕒𝕚𝑠𝑎𝕣 𝕌𝕕𝕚𝕟👑</blockquote>"
 
         if video_to_send:
             try:
-                caption_text = "Enjoy aja nontonnya☕\n\n<blockquote>𝘗𝘰𝘸𝘦𝘳𝘦𝘥 𝘣𝘰𝘵 𝘣𝘺 𝕂𝕒𝕚𝑠𝑎𝕣 𝕌𝕕𝕚𝕟👑</blockquote>"
                 await update.message.reply_video(video=video_to_send, caption=caption_text, parse_mode=ParseMode.HTML, protect_content=True)
+                record_video_delivery(user_id, start_parameter)
+            except Exception as e:
+                await update.message.reply_text(f"<blockquote>❌ Terjadi kesalahan saat mengirim video: {html.escape(str(e))}</blockquote>", parse_mode=ParseMode.HTML)
+        elif bundle_to_send:
+            try:
+                await send_video_bundle(update, bundle_to_send, caption_text)
+                record_video_delivery(user_id, start_parameter)
             except Exception as e:
                 await update.message.reply_text(f"<blockquote>❌ Terjadi kesalahan saat mengirim video: {html.escape(str(e))}</blockquote>", parse_mode=ParseMode.HTML)
         else:
             await update.message.reply_text("<blockquote>✅ Anda sudah bergabung. Gunakan link yang dikirim admin.</blockquote>\n\n<blockquote>𝘗𝘰𝘸𝘦𝘳𝘦𝘥 𝘣𝘰𝘵 𝘣𝘺 𝕂𝕒𝕚𝕤𝕒𝕣 𝕌𝕕𝕚𝕟👑</blockquote>", parse_mode=ParseMode.HTML)
+
+async def send_video_bundle(update: Update, file_ids, caption_text):
+    """Mengirim kumpulan video dengan send_media_group, dipecah per 10 video (batas Telegram)."""
+    for i in range(0, len(file_ids), MEDIA_GROUP_LIMIT):
+        chunk = file_ids[i:i + MEDIA_GROUP_LIMIT]
+        # Caption hanya dipasang pada video pertama dari seluruh kumpulan
+        caption = caption_text if i == 0 else None
+        if len(chunk) == 1:
+            # Media group minimal berisi 2 item
+            await update.message.reply_video(video=chunk[0], caption=caption, parse_mode=ParseMode.HTML, protect_content=True)
+            continue
+        media = [
+            InputMediaVideo(file_id, caption=caption if j == 0 else None, parse_mode=ParseMode.HTML)
+            for j, file_id in enumerate(chunk)
+        ]
+        await update.message.reply_media_group(media=media, protect_content=True)
   
 # --- Deskripsi Perintah ---
 COMMAND_DESCRIPTIONS = {
@@ -178,15 +725,26 @@ COMMAND_DESCRIPTIONS = {
     "help": "Perintah ini berfungsi untuk menampilkan menu bantuan dan daftar perintah bot.",
     
     # Perintah Admin
-    "addfsubchannel": "Perintah ini berfungsi untuk menambahkan channel baru ke dalam Forceling Subscribe (Fsub). Gunakan format: /addfsubchannel -100123456789.",
-    "delfsubchannel": "Perintah ini berfungsi untuk menghapus channel dari daftar Fsub. Gunakan format: /delfsubchannel -100123456789.",
+    "addfsubchannel": "Perintah ini berfungsi untuk menambahkan channel baru ke dalam Forceling Subscribe (Fsub). Bisa beberapa channel sekaligus (ID, @username atau link t.me), atau teruskan pesan dari tiap channel ke bot lalu kirim /addfsubchannel. Bot memeriksa semua channel bersamaan (harus bisa dilihat bot dan bot harus admin) dan otomatis membuat tombol Fsub dari link channel. Gunakan format: /addfsubchannel -100123456789 -100987654321.",
+    "delfsubchannel": "Perintah ini berfungsi untuk menghapus channel dari daftar Fsub, bisa beberapa sekaligus. Tombol yang dibuat otomatis untuk channel tersebut ikut dihapus. Gunakan format: /delfsubchannel -100123456789 -100987654321.",
     "listfsub": "Perintah ini berfungsi untuk menampilkan semua channel dan tombol Fsub yang terdaftar.",
     "addfsubbutton": "Perintah ini berfungsi untuk menambahkan tombol baru pada pesan Fsub. Gunakan format: /addfsubbutton Gabung Channel https://t.me/udiens123.",
     "delfsubbutton": "Perintah ini berfungsi untuk menghapus tombol Fsub berdasarkan teks. Gunakan format: /delfsubbutton Gabung Channel.",
     "setwelcome": "Perintah ini berfungsi untuk mengatur pesan sambutan untuk pengguna yang belum bergabung. Balas pesan teks yang ingin dijadikan pesan sambutan.",
     "getprofil": "Perintah ini berfungsi untuk mengatur gambar sambutan untuk pengguna yang belum bergabung. Balas gambar yang ingin dijadikan gambar sambutan.",
     "addvideo": "Perintah ini berfungsi untuk menyimpan video dan membuat link unik untuk dibagikan. Balas video dengan format: /addvideo nama_video.",
-    "broadcast": "Perintah ini berfungsi untuk mengirim pesan broadcast ke semua pengguna bot. Balas pesan (teks/media) yang ingin di-broadcast.",
+    "addbundle": "Perintah ini berfungsi untuk membuat kumpulan video (dikirim sekaligus lewat satu link) atau menambahkan video ke kumpulan yang ada. Balas video dengan format: /addbundle nama_bundle.",
+    "delbundle": "Perintah ini berfungsi untuk menghapus kumpulan video, atau satu video di dalamnya berdasarkan nomor. Gunakan format: /delbundle nama_bundle atau /delbundle nama_bundle 2.",
+    "broadcast": "Perintah ini berfungsi untuk mengirim pesan broadcast ke semua pengguna bot. Balas pesan yang ingin di-broadcast; semua jenis pesan didukung (teks, foto, video, dokumen, audio, stiker, polling, album) karena pesan disalin apa adanya, jadi jangan hapus pesan sumber sebelum broadcast selesai. Tambahkan opsi untuk menargetkan segmen tertentu: aktif=30 (aktif 30 hari terakhir), langganan=ya/tidak (status FSub saat terakhir /start), video=nama_parameter (pernah membuka link video tersebut). Contoh: /broadcast aktif=30 langganan=ya.",
+    "cancelbroadcast": "Perintah ini berfungsi untuk membatalkan broadcast yang sedang berjalan.",
+    "retrybroadcast": "Perintah ini berfungsi untuk mengirim ulang broadcast hanya ke pengguna yang sebelumnya gagal. Gunakan format: /retrybroadcast 12.",
+    "delbroadcast": "Perintah ini berfungsi untuk menghapus pesan broadcast dari semua penerima. Gunakan format: /delbroadcast 12.",
+    "editbroadcast": "Perintah ini berfungsi untuk mengubah teks pesan broadcast di semua penerima. Balas pesan teks baru dengan format: /editbroadcast 12.",
+    "stats": "Perintah ini berfungsi untuk menampilkan statistik latensi handler, panggilan Bot API dan laju kirim pesan.",
+    "profile": "Perintah ini berfungsi untuk merekam profil handler (cProfile dan alokasi memori) selama N update berikutnya atau T detik, lalu mengirim hasilnya sebagai dokumen. Gunakan format: /profile 200 60, atau /profile stop untuk menghentikan lebih awal. Di mode multi-bot, profiling merekam seluruh proses (semua bot).",
+    "exportusers": "Perintah ini berfungsi untuk mengekspor semua pengguna bot (id, first_seen, last_seen, blocked) sebagai file CSV ber-gzip.",
+    "importusers": "Perintah ini berfungsi untuk mengimpor pengguna dari file hasil /exportusers tanpa duplikasi. Balas file .csv atau .csv.gz dengan perintah /importusers.",
+    "topvideos": "Perintah ini berfungsi untuk menampilkan link video yang paling sering diklik beserta jumlah video terkirim, yang tertahan FSub dan konversinya setelah Coba Lagi. Gunakan format: /topvideos 20.",
     "addbutton": "Perintah ini berfungsi untuk membuat tombol inline pada pesan. Balas pesan yang ingin ditambahkan tombol dengan format: /addbutton TeksTombol https://t.me/udiens123.",
     "setup": "Perintah ini berfungsi untuk mengkonfigurasi admin pada bot. Perintah ini hanya bisa digunakan sekali."
 }
@@ -231,7 +789,8 @@ async def help_menu_handler(update: Update, context: ContextTypes.DEFAULT_TYPE):
         admin_commands = [
             "addfsubchannel", "delfsubchannel", "listfsub", "addfsubbutton", 
             "delfsubbutton", "setwelcome", "getprofil", "addvideo", 
-            "broadcast", "addbutton", "setup"
+            "addbundle", "delbundle", "broadcast", "cancelbroadcast", "retrybroadcast", "delbroadcast",
+            "editbroadcast", "stats", "topvideos", "profile", "exportusers", "importusers", "addbutton", "setup"
         ]
 
         # Mengatur tata letak tombol menjadi 4x4
@@ -288,51 +847,195 @@ async def help_main_menu_handler(update: Update, context: ContextTypes.DEFAULT_T
     )
 
 
+# --- Validasi Channel FSub ---
+# Jumlah channel yang diperiksa bersamaan saat /addfsubchannel menerima banyak channel
+FSUB_CHECK_CONCURRENCY = 10
+# Lama (detik) channel dari pesan yang diteruskan admin diingat untuk /addfsubchannel dan /delfsubchannel
+FORWARDED_CHANNEL_TTL = 600
+FORWARDED_CHANNEL_CACHE_SIZE = 1000
+
+class ChannelCheck:
+    """Hasil pemeriksaan satu channel: bisa dilihat bot, bot admin, dan link untuk tombol FSub."""
+
+    def __init__(self, ref):
+        self.ref = ref
+        self.chat_id = None
+        self.title = None
+        self.url = None
+        self.error = None
+
+    @property
+    def label(self):
+        if not self.chat_id:
+            return html.escape(str(self.ref))
+        return f"{html.escape(self.title)} (<code>{self.chat_id}</code>)" if self.title else f"<code>{self.chat_id}</code>"
+
+def parse_channel_refs(update: Update, context: ContextTypes.DEFAULT_TYPE):
+    """Mengumpulkan channel dari argumen (ID, @username, link t.me), pesan terusan yang dibalas,
+    atau pesan terusan yang baru dikirim admin; mengembalikan (daftar_channel, argumen_tidak_valid).
+    """
+    refs, invalid = [], []
+    for token in " ".join(context.args or []).replace(",", " ").split():
+        if token.lstrip("-").isdigit():
+            refs.append(int(token))
+        elif token.startswith("@") and len(token) > 1:
+            refs.append(token)
+        elif token.startswith(("https://t.me/", "http://t.me/", "t.me/")) and "/+" not in token and "joinchat" not in token:
+            refs.append("@" + token.rsplit("t.me/", 1)[1].strip("/").split("/")[0])
+        else:
+            invalid.append(token)
+
+    reply_message = update.message.reply_to_message
+    forwarded = forwarded_channel_id(reply_message) if reply_message else None
+    if forwarded:
+        refs.append(forwarded)
+    elif not refs and not invalid:
+        refs.extend(tenant().forwarded_channels.pop(update.effective_user.id, None) or [])
+    return list(dict.fromkeys(refs)), invalid
+
+def forwarded_channel_id(message):
+    """ID channel asal pesan yang diteruskan, atau None."""
+    origin = message.forward_origin
+    if origin and origin.type == "channel":
+        return origin.chat.id
+    return None
+
+async def remember_forwarded_channel(update: Update, context: ContextTypes.DEFAULT_TYPE):
+    """Mencatat channel asal pesan yang diteruskan admin, agar bisa ditambahkan sekaligus dengan /addfsubchannel."""
+    message = update.message
+    channel_id = forwarded_channel_id(message) if message else None
+    if not channel_id or not await check_is_admin(update):
+        return
+    forwarded_channels = tenant().forwarded_channels
+    channel_ids = forwarded_channels.get(update.effective_user.id) or []
+    if channel_id not in channel_ids:
+        channel_ids.append(channel_id)
+    forwarded_channels.set(update.effective_user.id, channel_ids, FORWARDED_CHANNEL_TTL)
+
+async def check_fsub_channel(bot, ref, semaphore):
+    """Memastikan channel bisa dilihat bot (get_chat), bot admin di sana, dan mencari link untuk tombolnya."""
+    check = ChannelCheck(ref)
+    async with semaphore:
+        try:
+            chat = await bot.get_chat(chat_id=ref)
+            check.chat_id = chat.id
+            check.title = chat.title
+            if chat.type not in (ChatType.CHANNEL, ChatType.SUPERGROUP):
+                check.error = "bukan channel atau grup"
+                return check
+            member = await bot.get_chat_member(chat_id=chat.id, user_id=bot.id)
+            if member.status not in (ChatMemberStatus.ADMINISTRATOR, ChatMemberStatus.OWNER):
+                check.error = "bot belum menjadi admin"
+                return check
+            if chat.username:
+                check.url = f"https://t.me/{chat.username}"
+            elif chat.invite_link:
+                check.url = chat.invite_link
+            elif getattr(member, "can_invite_users", False):
+                check.url = await bot.export_chat_invite_link(chat_id=chat.id)
+        except TelegramError as e:
+            check.error = f"tidak bisa diakses bot ({e.message})"
+    return check
+
+async def check_fsub_channels(bot, refs):
+    """Memeriksa semua channel secara bersamaan; urutan hasil sama dengan `refs`."""
+    semaphore = asyncio.Semaphore(FSUB_CHECK_CONCURRENCY)
+    return await asyncio.gather(*(check_fsub_channel(bot, ref, semaphore) for ref in refs))
+
+async def resolve_channel_ids(bot, refs):
+    """Mengubah @username menjadi ID channel (bersamaan); mengembalikan daftar (ref, chat_id atau None)."""
+    usernames = [ref for ref in refs if isinstance(ref, str)]
+    results = await asyncio.gather(*(bot.get_chat(chat_id=ref) for ref in usernames), return_exceptions=True)
+    resolved = {ref: None if isinstance(result, Exception) else result.id for ref, result in zip(usernames, results)}
+    return [(ref, resolved[ref] if isinstance(ref, str) else ref) for ref in refs]
+
 # --- Handler Admin (Perintah khusus Admin) ---
 async def add_fsub_channel(update: Update, context: ContextTypes.DEFAULT_TYPE):
-    """Menambah channel untuk FSub."""
-    config = get_config()
+    """Menambah satu atau banyak channel FSub setelah divalidasi, lengkap dengan tombolnya."""
     if not await check_is_admin(update):
         await update.message.reply_text("<blockquote>❌ Perintah ini hanya untuk admin.</blockquote>", parse_mode=ParseMode.HTML)
         return
-    if not context.args:
-        await update.message.reply_text("<blockquote>❌ Mohon sertakan ID channel. Contoh:\n<code>/addfsubchannel -100123456789</code></blockquote>", parse_mode=ParseMode.HTML)
+    refs, invalid = parse_channel_refs(update, context)
+    if not refs and not invalid:
+        await update.message.reply_text("<blockquote>❌ Mohon sertakan ID channel (boleh lebih dari satu), atau teruskan pesan dari tiap channel ke bot lalu kirim perintah ini. Contoh:\n<code>/addfsubchannel -100123456789 -100987654321 @channelku</code></blockquote>", parse_mode=ParseMode.HTML)
         return
-    
-    channel_id_str = context.args[0]
-    try:
-        channel_id = int(channel_id_str)
-        if channel_id in config.get("fsub_channels", []):
-            await update.message.reply_text("<blockquote>✅ Channel sudah ada di daftar FSub.</blockquote>", parse_mode=ParseMode.HTML)
-            return
 
-        config["fsub_channels"].append(channel_id)
+    checks = await check_fsub_channels(context.bot, refs)
+
+    # Konfigurasi diambil setelah pemeriksaan agar perubahan dari replika lain tidak tertimpa
+    config = get_config()
+    lines = [f"❌ {html.escape(token)} — ID channel tidak valid" for token in invalid]
+    added = []
+    button_urls = {btn.get("url") for btn in config.get("fsub_buttons", [])}
+    for check in checks:
+        if check.error:
+            lines.append(f"❌ {check.label} — {check.error}")
+            continue
+        if check.chat_id in config["fsub_channels"] or check.chat_id in added:
+            lines.append(f"⚠️ {check.label} — sudah ada di daftar FSub")
+            continue
+        config["fsub_channels"].append(check.chat_id)
+        added.append(check.chat_id)
+        if not check.url:
+            lines.append(f"✅ {check.label} — ditambahkan, tanpa tombol (bot tidak bisa membuat link undangan)")
+        elif check.url in button_urls:
+            lines.append(f"✅ {check.label} — ditambahkan, tombol dengan link ini sudah ada")
+        else:
+            config["fsub_buttons"].append({"text": check.title or str(check.chat_id), "url": check.url, "channel_id": check.chat_id})
+            button_urls.add(check.url)
+            lines.append(f"✅ {check.label} — ditambahkan beserta tombolnya")
+
+    if added:
         save_config(config)
-        await update.message.reply_text(f"<blockquote>✅ Channel dengan ID {channel_id} berhasil ditambahkan ke daftar FSub.</blockquote>", parse_mode=ParseMode.HTML)
-    except ValueError:
-        await update.message.reply_text("<blockquote>❌ ID channel tidak valid. Pastikan itu adalah angka.</blockquote>", parse_mode=ParseMode.HTML)
+        invalidate_fsub_reply()
+        state = tenant()
+        for channel_id in added:
+            state.channel_breakers.pop(channel_id, None)
+            # Bot sudah dipastikan admin, jadi update chat_member dari channel ini akan diterima
+            if not state.backend.shared:
+                state.tracked_channels.add(channel_id)
+
+    summary = f"📋 {len(added)} dari {len(refs) + len(invalid)} channel ditambahkan ke daftar FSub."
+    await update.message.reply_text(f"<blockquote>{summary}\n\n" + "\n".join(lines) + "</blockquote>", parse_mode=ParseMode.HTML)
 
 async def del_fsub_channel(update: Update, context: ContextTypes.DEFAULT_TYPE):
-    """Menghapus channel dari FSub."""
-    config = get_config()
+    """Menghapus satu atau banyak channel dari FSub beserta tombol yang dibuat otomatis untuknya."""
     if not await check_is_admin(update):
         await update.message.reply_text("<blockquote>❌ Perintah ini hanya untuk admin.</blockquote>", parse_mode=ParseMode.HTML)
         return
-    if not context.args:
-        await update.message.reply_text("<blockquote>❌ Mohon sertakan ID channel yang ingin dihapus. Contoh:\n<code>/delfsubchannel -100123456789</code></blockquote>", parse_mode=ParseMode.HTML)
+    refs, invalid = parse_channel_refs(update, context)
+    if not refs and not invalid:
+        await update.message.reply_text("<blockquote>❌ Mohon sertakan ID channel yang ingin dihapus (boleh lebih dari satu). Contoh:\n<code>/delfsubchannel -100123456789 -100987654321</code></blockquote>", parse_mode=ParseMode.HTML)
         return
 
-    channel_id_str = context.args[0]
-    try:
-        channel_id = int(channel_id_str)
-        if channel_id in config.get("fsub_channels", []):
+    resolved = await resolve_channel_ids(context.bot, refs)
+
+    config = get_config()
+    lines = [f"❌ {html.escape(token)} — ID channel tidak valid" for token in invalid]
+    removed = []
+    for ref, channel_id in resolved:
+        if channel_id is None:
+            lines.append(f"❌ {html.escape(ref)} — channel tidak ditemukan")
+        elif channel_id in config.get("fsub_channels", []):
             config["fsub_channels"].remove(channel_id)
-            save_config(config)
-            await update.message.reply_text(f"<blockquote>✅ Channel dengan ID {channel_id} berhasil dihapus dari daftar FSub.</blockquote>", parse_mode=ParseMode.HTML)
-        else:
-            await update.message.reply_text("<blockquote>❌ Channel tidak ditemukan di daftar FSub.</blockquote>", parse_mode=ParseMode.HTML)
-    except ValueError:
-        await update.message.reply_text("<blockquote>❌ ID channel tidak valid. Pastikan itu adalah angka.</blockquote>", parse_mode=ParseMode.HTML)
+            removed.append(channel_id)
+            lines.append(f"✅ <code>{channel_id}</code> — dihapus")
+        elif channel_id not in removed:
+            lines.append(f"⚠️ <code>{channel_id}</code> — tidak ada di daftar FSub")
+
+    if removed:
+        buttons = config.get("fsub_buttons", [])
+        config["fsub_buttons"] = [btn for btn in buttons if btn.get("channel_id") not in removed]
+        save_config(config)
+        if len(config["fsub_buttons"]) < len(buttons):
+            invalidate_fsub_reply()
+        state = tenant()
+        for channel_id in removed:
+            state.channel_breakers.pop(channel_id, None)
+            await untrack_channel(channel_id)
+
+    summary = f"📋 {len(removed)} channel dihapus dari daftar FSub."
+    await update.message.reply_text(f"<blockquote>{summary}\n\n" + "\n".join(lines) + "</blockquote>", parse_mode=ParseMode.HTML)
 
 async def list_fsub(update: Update, context: ContextTypes.DEFAULT_TYPE):
     """Menampilkan daftar channel dan tombol FSub."""
@@ -362,6 +1065,7 @@ async def add_fsub_button(update: Update, context: ContextTypes.DEFAULT_TYPE):
 
     config["fsub_buttons"].append({"text": button_text, "url": button_url})
     save_config(config)
+    invalidate_fsub_reply()
 
     await update.message.reply_text(f"<blockquote>✅ Tombol FSub '{html.escape(button_text)}' berhasil ditambahkan.</blockquote>", parse_mode=ParseMode.HTML)
 
@@ -385,6 +1089,7 @@ async def del_fsub_button(update: Update, context: ContextTypes.DEFAULT_TYPE):
     
     if len(config["fsub_buttons"]) < initial_count:
         save_config(config)
+        invalidate_fsub_reply()
         await update.message.reply_text(f"<blockquote>✅ Tombol FSub '{html.escape(button_text_to_delete)}' berhasil dihapus.</blockquote>", parse_mode=ParseMode.HTML)
     else:
         await update.message.reply_text("<blockquote>❌ Tombol FSub '{html.escape(button_text_to_delete)}' tidak ditemukan.</blockquote>", parse_mode=ParseMode.HTML)
@@ -404,6 +1109,7 @@ async def set_welcome_message_handler(update: Update, context: ContextTypes.DEFA
     new_message = reply_message.text
     config["welcome_message"] = new_message
     save_config(config)
+    invalidate_fsub_reply()
 
     await update.message.reply_text(f"<blockquote>✅ Pesan sambutan berhasil diubah menjadi:\n\n{html.escape(new_message)}</blockquote>", parse_mode=ParseMode.HTML)
 
@@ -421,6 +1127,7 @@ async def set_profile_photo_handler(update: Update, context: ContextTypes.DEFAUL
     file_id = reply_message.photo[-1].file_id
     config["photo_id"] = file_id
     save_config(config)
+    invalidate_fsub_reply()
     caption_text = "<blockquote>✅ Gambar sambutan berhasil diatur!</blockquote>"
     await update.message.reply_photo(photo=file_id, caption=caption_text, parse_mode=ParseMode.HTML)
 
@@ -439,6 +1146,9 @@ async def add_video_handler(update: Update, context: ContextTypes.DEFAULT_TYPE):
         await update.message.reply_text("<blockquote>⚙️ Mohon berikan nama untuk video ini. Contoh: <code>/addvideo video_utama</code></blockquote>", parse_mode=ParseMode.HTML)
         return
     parameter_name = context.args[0]
+    if parameter_name in config.get("bundles", {}):
+        await update.message.reply_text(f"<blockquote>❌ Nama <code>{html.escape(parameter_name)}</code> sudah dipakai oleh kumpulan video.</blockquote>", parse_mode=ParseMode.HTML)
+        return
     file_id = reply_message.video.file_id
     config["videos"][parameter_name] = file_id
     save_config(config)
@@ -448,91 +1158,931 @@ async def add_video_handler(update: Update, context: ContextTypes.DEFAULT_TYPE):
     message_text = f"<blockquote>✅ Video <code>{html.escape(parameter_name)}</code> telah disimpan!\nBagikan dengan link: <code>https://t.me/{html.escape(bot_username)}?start={html.escape(parameter_name)}</code></blockquote>"
     await update.message.reply_text(message_text, parse_mode=ParseMode.HTML)
 
-async def broadcast_command(update: Update, context: ContextTypes.DEFAULT_TYPE):
-    """Mengirim broadcast ke semua pengguna."""
+async def add_bundle_handler(update: Update, context: ContextTypes.DEFAULT_TYPE):
+    """Menangani perintah /addbundle: membuat kumpulan video atau menambahkan video ke kumpulan yang ada."""
     config = get_config()
     if not await check_is_admin(update):
         await update.message.reply_text("<blockquote>❌ Perintah ini hanya untuk admin.</blockquote>", parse_mode=ParseMode.HTML)
         return
 
     reply_message = update.message.reply_to_message
-    if not reply_message:
-        await update.message.reply_text("<blockquote>⚙️ Mohon balas pesan yang ingin Anda broadcast.</blockquote>", parse_mode=ParseMode.HTML)
+    if not reply_message or not reply_message.video:
+        await update.message.reply_text("<blockquote>⚙️ Mohon balas video dengan perintah /addbundle &lt;nama_bundle&gt;.</blockquote>", parse_mode=ParseMode.HTML)
+        return
+    if not context.args:
+        await update.message.reply_text("<blockquote>⚙️ Mohon berikan nama untuk kumpulan video ini. Contoh: <code>/addbundle series_1</code></blockquote>", parse_mode=ParseMode.HTML)
+        return
+    parameter_name = context.args[0]
+    if parameter_name in config.get("videos", {}):
+        await update.message.reply_text(f"<blockquote>❌ Nama <code>{html.escape(parameter_name)}</code> sudah dipakai oleh video tunggal.</blockquote>", parse_mode=ParseMode.HTML)
         return
 
-    user_ids = set(config.get("user_ids", []))
-    sent_count = 0
-    blocked_count = 0
-    
-    logging.info(f"Memulai broadcast ke {len(user_ids)} pengguna...")
-
-    broadcast_parse_mode = getattr(reply_message, 'parse_mode', ParseMode.HTML)
-
-    for user_id in list(user_ids):
-        try:
-            if reply_message.text:
-                await context.bot.send_message(
-                    chat_id=user_id,
-                    text=reply_message.text,
-                    parse_mode=broadcast_parse_mode
-                )
-            elif reply_message.photo:
-                await context.bot.send_photo(
-                    chat_id=user_id,
-                    photo=reply_message.photo[-1].file_id,
-                    caption=reply_message.caption,
-                    parse_mode=broadcast_parse_mode
-                )
-            # Tambahkan elif untuk jenis media lain (video, audio, dll.) jika diperlukan
-            sent_count += 1
-        except Forbidden:
-            logging.info(f"Pengguna {user_id} telah memblokir bot. Menghapus dari daftar.")
-            user_ids.remove(user_id)
-            blocked_count += 1
-        except Exception as e:
-            logging.error(f"Gagal mengirim pesan ke pengguna {user_id}: {e}")
-
-    config["user_ids"] = list(user_ids)
+    bundle = config.setdefault("bundles", {}).setdefault(parameter_name, [])
+    bundle.append(reply_message.video.file_id)
     save_config(config)
-    
-    await update.message.reply_text(f"<blockquote>✅ 𝐁𝐫𝐨𝐚𝐝𝐜𝐚𝐬𝐭 𝐬𝐞𝐥𝐞𝐬𝐚𝐢!\n\n📢 𝐏𝐞𝐬𝐚𝐧 𝐭𝐞𝐫𝐤𝐢𝐫𝐢𝐦: {sent_count}\n💣 𝐏𝐞𝐧𝐠𝐠𝐮𝐧𝐚 𝐲𝐚𝐧𝐠 𝐦𝐞𝐦𝐛𝐥𝐨𝐤𝐢𝐫: {blocked_count}\n\n👤𝐉𝐮𝐦𝐥𝐚𝐡 𝐩𝐞𝐧𝐠𝐠𝐮𝐧𝐚 𝐚𝐤𝐭𝐢𝐟 𝐬𝐚𝐚𝐭 𝐢𝐧𝐢: {len(user_ids)}</blockquote>", parse_mode=ParseMode.HTML)
 
-async def add_button_handler(update: Update, context: ContextTypes.DEFAULT_TYPE):
-    """Menambahkan tombol inline pada pesan yang dibalas."""
+    message_text = f"<blockquote>✅ Video ke-{len(bundle)} ditambahkan ke kumpulan <code>{html.escape(parameter_name)}</code>!\nBagikan dengan link: <code>https://t.me/{html.escape(context.bot.username)}?start={html.escape(parameter_name)}</code></blockquote>"
+    await update.message.reply_text(message_text, parse_mode=ParseMode.HTML)
+
+async def del_bundle_handler(update: Update, context: ContextTypes.DEFAULT_TYPE):
+    """Menangani perintah /delbundle: menghapus satu video (berdasarkan nomor) atau seluruh kumpulan."""
     config = get_config()
     if not await check_is_admin(update):
         await update.message.reply_text("<blockquote>❌ Perintah ini hanya untuk admin.</blockquote>", parse_mode=ParseMode.HTML)
         return
+    if not context.args:
+        await update.message.reply_text("<blockquote>❌ Mohon sertakan nama kumpulan video. Contoh:\n<code>/delbundle series_1</code> atau <code>/delbundle series_1 2</code></blockquote>", parse_mode=ParseMode.HTML)
+        return
 
-    reply_message = update.message.reply_to_message
-    if not reply_message:
-        await update.message.reply_text("<blockquote>⚙️ Mohon balas pesan yang ingin Anda tambahkan tombol.</blockquote>", parse_mode=ParseMode.HTML)
+    parameter_name = context.args[0]
+    bundles = config.setdefault("bundles", {})
+    if parameter_name not in bundles:
+        await update.message.reply_text("<blockquote>❌ Kumpulan video tidak ditemukan.</blockquote>", parse_mode=ParseMode.HTML)
         return
-        
+
     if len(context.args) < 2:
-        await update.message.reply_text("<blockquote>⚙️ Mohon sertakan teks dan URL tombol. Contoh:\n<code>/addbutton Kunjungi Website https://google.com</code></blockquote>", parse_mode=ParseMode.HTML)
+        del bundles[parameter_name]
+        save_config(config)
+        await update.message.reply_text(f"<blockquote>✅ Kumpulan video <code>{html.escape(parameter_name)}</code> berhasil dihapus.</blockquote>", parse_mode=ParseMode.HTML)
         return
 
-    button_text = " ".join(context.args[:-1])
-    button_url = context.args[-1]
-    
-    keyboard = InlineKeyboardMarkup([[InlineKeyboardButton(button_text, url=button_url)]])
-    
-    message_parse_mode = getattr(reply_message, 'parse_mode', ParseMode.HTML)
+    try:
+        index = int(context.args[1])
+        if not 1 <= index <= len(bundles[parameter_name]):
+            raise ValueError
+    except ValueError:
+        await update.message.reply_text(f"<blockquote>❌ Nomor video tidak valid. Pilih antara 1 dan {len(bundles[parameter_name])}.</blockquote>", parse_mode=ParseMode.HTML)
+        return
+
+    bundles[parameter_name].pop(index - 1)
+    if not bundles[parameter_name]:
+        del bundles[parameter_name]
+    save_config(config)
+    await update.message.reply_text(f"<blockquote>✅ Video ke-{index} berhasil dihapus dari kumpulan <code>{html.escape(parameter_name)}</code>.</blockquote>", parse_mode=ParseMode.HTML)
 
+async def top_videos_handler(update: Update, context: ContextTypes.DEFAULT_TYPE):
+    """Menangani perintah /topvideos: parameter video yang paling sering diklik beserta konversinya."""
+    config = get_config()
+    if not await check_is_admin(update):
+        await update.message.reply_text("<blockquote>❌ Perintah ini hanya untuk admin.</blockquote>", parse_mode=ParseMode.HTML)
+        return
     try:
-        if reply_message.text:
-            await update.message.reply_text(
-                text=reply_message.text,
-                reply_markup=keyboard,
-                parse_mode=message_parse_mode
-            )
-        elif reply_message.photo:
-            await update.message.reply_photo(
-                photo=reply_message.photo[-1].file_id,
-                caption=reply_message.caption or "",
-                reply_markup=keyboard,
-                parse_mode=message_parse_mode
+        limit = int(context.args[0]) if context.args else 10
+    except ValueError:
+        limit = 0
+    if limit < 1:
+        await update.message.reply_text("<blockquote>❌ Jumlah harus berupa angka 1 sampai 50. Contoh:\n<code>/topvideos 20</code></blockquote>", parse_mode=ParseMode.HTML)
+        return
+    limit = min(limit, 50)
+
+    video_stats_store = tenant().video_stats_store
+    await video_stats_store.flush()
+    rows = await video_stats_store.top(limit)
+    if not rows:
+        await update.message.reply_text("<blockquote>📊 Belum ada link video yang diklik.</blockquote>", parse_mode=ParseMode.HTML)
+        return
+
+    lines = []
+    for i, row in enumerate(rows, 1):
+        conversion = f"{row['conversions'] / row['fsub_blocked'] * 100:.0f}%" if row['fsub_blocked'] else "-"
+        lines.append(
+            f"{i}. <code>{html.escape(row['parameter'])}</code>: 👆 {row['clicks']} | 🎬 {row['deliveries']} | "
+            f"🔒 {row['fsub_blocked']} | 🔄 {row['conversions']} ({conversion})"
+        )
+    configured = set(config.get("videos", {})) | set(config.get("bundles", {}))
+    unused = len(configured - await video_stats_store.clicked_parameters())
+    rows_text = "\n".join(lines)
+    message = (
+        f"<b>🔥 Link Video Teratas</b>\n\n{rows_text}\n\n"
+        f"👆 klik | 🎬 terkirim | 🔒 tertahan FSub | 🔄 konversi setelah Coba Lagi\n"
+        f"📭 {unused} dari {len(configured)} parameter belum pernah diklik."
+    )
+    await update.message.reply_text(f"<blockquote>{message}</blockquote>", parse_mode=ParseMode.HTML)
+
+# --- Ekspor dan Impor Pengguna ---
+USER_EXPORT_BATCH = int(os.getenv("USER_EXPORT_BATCH", "5000"))
+# Bot API hanya mengizinkan bot mengunduh file hingga 20 MB
+USER_IMPORT_MAX_BYTES = 20 * 1024 * 1024
+
+class UserCsvReader:
+    """Membaca file CSV pengguna (boleh di-gzip) per batch; dipanggil dari thread agar event loop tidak tertahan.
+
+    Baris pertama boleh berupa header (urutan kolom bebas, minimal user_id); tanpa header kolom dianggap
+    berurutan user_id, first_seen, last_seen, blocked. Baris tidak valid dilewati dan dihitung.
+    """
+
+    def __init__(self, path, columns):
+        with open(path, "rb") as f:
+            is_gzip = f.read(2) == b"\x1f\x8b"
+        self._file = gzip.open(path, "rt", newline="") if is_gzip else open(path, "r", newline="")
+        self._reader = csv.reader(self._file)
+        self.columns = columns
+        self._index = None
+        self.read = 0
+        self.skipped = 0
+
+    def close(self):
+        self._file.close()
+
+    def _detect_header(self, row):
+        if row and not row[0].strip().isdigit():
+            names = [name.strip().lower() for name in row]
+            if "user_id" not in names:
+                raise ValueError("Header CSV harus memiliki kolom user_id.")
+            self._index = {column: names.index(column) for column in self.columns if column in names}
+            return True
+        self._index = {column: i for i, column in enumerate(self.columns)}
+        return False
+
+    def _parse(self, row, now):
+        values = {}
+        for column, i in self._index.items():
+            if i < len(row) and row[i].strip():
+                values[column] = row[i].strip()
+        user_id = int(values["user_id"])
+        if user_id <= 0:
+            raise ValueError(user_id)
+        last_seen = int(values.get("last_seen", values.get("first_seen", now)))
+        first_seen = int(values.get("first_seen", last_seen))
+        blocked = int(values.get("blocked", "0").lower() in ("1", "true", "ya"))
+        return user_id, first_seen, last_seen, blocked
+
+    def read_batch(self, size):
+        """Mengembalikan sampai `size` baris unik per user_id; daftar kosong berarti file sudah habis."""
+        now = int(time.time())
+        merged = {}
+        for row in self._reader:
+            if self._index is None and self._detect_header(row):
+                continue
+            self.read += 1
+            try:
+                user_id, first_seen, last_seen, blocked = self._parse(row, now)
+            except (KeyError, ValueError):
+                self.skipped += 1
+                continue
+            previous = merged.get(user_id)
+            if previous:
+                # user_id ganda di dalam file digabung seperti saat impor ke database
+                if previous[2] > last_seen:
+                    blocked = previous[3]
+                first_seen, last_seen = min(first_seen, previous[1]), max(last_seen, previous[2])
+            merged[user_id] = (user_id, first_seen, last_seen, blocked)
+            if len(merged) >= size:
+                break
+        return list(merged.values())
+
+async def export_users_command(update: Update, context: ContextTypes.DEFAULT_TYPE):
+    """Mengirim semua pengguna sebagai dokumen CSV ber-gzip yang ditulis bertahap per batch."""
+    if not await check_is_admin(update):
+        await update.message.reply_text("<blockquote>❌ Perintah ini hanya untuk admin.</blockquote>", parse_mode=ParseMode.HTML)
+        return
+
+    user_store = tenant().user_store
+    await user_store.flush()
+    status_message = await update.message.reply_text("<blockquote>⏳ Menyiapkan file ekspor pengguna...</blockquote>", parse_mode=ParseMode.HTML)
+    total = 0
+    # File sementara di disk: memori hanya menampung satu batch, bukan seluruh daftar pengguna
+    with tempfile.TemporaryFile() as tmp:
+        text = io.TextIOWrapper(gzip.GzipFile(fileobj=tmp, mode="wb"), encoding="utf-8", newline="")
+        writer = csv.writer(text)
+        writer.writerow(user_store.EXPORT_COLUMNS)
+        async for rows in user_store.iter_rows(USER_EXPORT_BATCH):
+            await asyncio.to_thread(writer.writerows, rows)
+            total += len(rows)
+        await asyncio.to_thread(text.close)
+        tmp.seek(0)
+        await context.bot.send_document(
+            chat_id=update.effective_chat.id,
+            document=tmp,
+            filename=f"users-{context.bot.id}-{datetime.datetime.now():%Y%m%d-%H%M%S}.csv.gz",
+            caption=f"<blockquote>📦 Ekspor pengguna: {total} baris.\nBalas file ini dengan /importusers di bot lain untuk memindahkannya.</blockquote>",
+            parse_mode=ParseMode.HTML,
+            write_timeout=120
+        )
+    await status_message.delete()
+
+async def import_users_command(update: Update, context: ContextTypes.DEFAULT_TYPE):
+    """Mengimpor pengguna dari dokumen CSV (hasil /exportusers) per batch, tanpa duplikasi."""
+    if not await check_is_admin(update):
+        await update.message.reply_text("<blockquote>❌ Perintah ini hanya untuk admin.</blockquote>", parse_mode=ParseMode.HTML)
+        return
+
+    reply_message = update.message.reply_to_message
+    document = reply_message.document if reply_message else None
+    if not document:
+        await update.message.reply_text("<blockquote>⚙️ Mohon balas file CSV (.csv atau .csv.gz) hasil /exportusers dengan perintah /importusers.</blockquote>", parse_mode=ParseMode.HTML)
+        return
+    if document.file_size and document.file_size > USER_IMPORT_MAX_BYTES:
+        await update.message.reply_text("<blockquote>❌ File terlalu besar. Bot hanya bisa mengunduh file hingga 20 MB; gunakan .csv.gz atau bagi filenya.</blockquote>", parse_mode=ParseMode.HTML)
+        return
+
+    user_store = tenant().user_store
+    status_message = await update.message.reply_text("<blockquote>⏳ Mengunduh dan mengimpor pengguna...</blockquote>", parse_mode=ParseMode.HTML)
+    await user_store.flush()
+    before = await user_store.count(include_blocked=True)
+    fd, path = tempfile.mkstemp(suffix=".csv")
+    os.close(fd)
+    reader = None
+    try:
+        telegram_file = await context.bot.get_file(document.file_id)
+        await telegram_file.download_to_drive(path)
+        reader = await asyncio.to_thread(UserCsvReader, path, user_store.EXPORT_COLUMNS)
+        while True:
+            rows = await asyncio.to_thread(reader.read_batch, USER_EXPORT_BATCH)
+            if not rows:
+                break
+            await user_store.import_rows(rows)
+    except (ValueError, OSError, csv.Error, EOFError) as e:
+        # gzip.BadGzipFile adalah turunan OSError; batch yang sudah masuk tetap tersimpan
+        await status_message.edit_text(f"<blockquote>❌ Impor berhenti: {html.escape(str(e))}\n\nBaris terbaca: {reader.read if reader else 0}</blockquote>", parse_mode=ParseMode.HTML)
+        return
+    finally:
+        if reader:
+            reader.close()
+        os.remove(path)
+
+    added = await user_store.count(include_blocked=True) - before
+    await status_message.edit_text(
+        f"<blockquote>✅ Impor pengguna selesai!\n\n📄 Baris terbaca: {reader.read}\n👤 Pengguna baru: {added}\n"
+        f"🔁 Sudah ada atau ganda (digabung): {reader.read - reader.skipped - added}\n⚠️ Baris tidak valid: {reader.skipped}</blockquote>",
+        parse_mode=ParseMode.HTML
+    )
+
+# --- Mesin Broadcast ---
+# Jumlah pengiriman paralel dan laju broadcast (pesan/detik); sisa batas global dipakai balasan interaktif
+BROADCAST_CONCURRENCY = int(os.getenv("BROADCAST_CONCURRENCY", "20"))
+BROADCAST_RATE = float(os.getenv("BROADCAST_RATE", "25"))
+BROADCAST_MAX_RETRIES = int(os.getenv("BROADCAST_MAX_RETRIES", "3"))
+# Interval (detik) pembaruan pesan status broadcast ke admin
+BROADCAST_PROGRESS_INTERVAL = float(os.getenv("BROADCAST_PROGRESS_INTERVAL", "10"))
+# Semua panggilan Bot API milik broadcast dijadwalkan di jalur "bulk" (lihat OutboundScheduler)
+BULK_LANE = {"lane": "bulk"}
+# Lama (detik) message_id album kiriman admin diingat untuk /broadcast
+MEDIA_GROUP_TTL = float(os.getenv("MEDIA_GROUP_TTL", str(24 * 3600)))
+MEDIA_GROUP_CACHE_SIZE = 1000
+# Seberapa sering (detik) replika memeriksa pengumuman broadcast dari replika lain
+BROADCAST_SYNC_INTERVAL = float(os.getenv("BROADCAST_SYNC_INTERVAL", "2"))
+
+def replica_label():
+    """Penanda bagian broadcast milik replika ini di pesan status (kosong jika hanya satu replika)."""
+    return f"\n🧩 Replika: {REPLICA_INDEX + 1}/{REPLICA_COUNT}" if REPLICA_COUNT > 1 else ""
+
+def retry_after_seconds(error: RetryAfter):
+    """Mengambil lama jeda RetryAfter dalam detik (int atau timedelta, tergantung versi PTB)."""
+    retry_after = error.retry_after
+    if isinstance(retry_after, datetime.timedelta):
+        return retry_after.total_seconds()
+    return float(retry_after)
+
+class TokenBucket:
+    """Pembatas laju: paling banyak `rate` token per detik dengan ledakan hingga `capacity`.
+
+    Peminta yang harus menunggu dilayani menurut prioritas (angka kecil didahulukan), lalu urutan datang.
+    """
+
+    def __init__(self, rate, capacity=None):
+        self.rate = rate
+        self.capacity = capacity or max(1.0, rate)
+        self._tokens = self.capacity
+        self._updated = time.monotonic()
+        self._paused_until = 0.0
+        self._waiters = []
+        self._sequence = itertools.count()
+        self._dispatcher = None
+
+    def pause(self, seconds):
+        """Menahan semua pengambilan token, misalnya setelah menerima RetryAfter."""
+        self._paused_until = max(self._paused_until, time.monotonic() + seconds)
+
+    def depth(self):
+        """Jumlah peminta yang sedang menunggu token."""
+        return sum(1 for _, _, future in self._waiters if not future.done())
+
+    def _wait_time(self):
+        """Lama (detik) sampai satu token tersedia; 0 jika token bisa langsung diambil."""
+        now = time.monotonic()
+        if now < self._paused_until:
+            return self._paused_until - now
+        self._tokens = min(self.capacity, self._tokens + (now - self._updated) * self.rate)
+        self._updated = now
+        if self._tokens >= 1:
+            return 0.0
+        return (1 - self._tokens) / self.rate
+
+    async def acquire(self, priority=0):
+        if not self._waiters and self._wait_time() == 0:
+            self._tokens -= 1
+            return
+        future = asyncio.get_running_loop().create_future()
+        heapq.heappush(self._waiters, (priority, next(self._sequence), future))
+        if self._dispatcher is None or self._dispatcher.done():
+            self._dispatcher = asyncio.create_task(self._dispatch())
+        await future
+
+    async def _dispatch(self):
+        while self._waiters:
+            future = self._waiters[0][2]
+            if future.done():
+                # Peminta yang dibatalkan tidak memakai token
+                heapq.heappop(self._waiters)
+                continue
+            wait = self._wait_time()
+            if wait > 0:
+                await asyncio.sleep(wait)
+                continue
+            heapq.heappop(self._waiters)
+            self._tokens -= 1
+            future.set_result(None)
+
+class BroadcastJob:
+    """Broadcast yang berjalan di latar belakang dengan konkurensi terbatas dan jurnal per penerima.
+
+    Laju kirim diatur oleh OutboundScheduler melalui jalur "bulk".
+    """
+
+    # Status penerima yang diproses oleh job ini
+    target_status = BroadcastLedger.PENDING
+    title_running = "📢 𝐁𝐫𝐨𝐚𝐝𝐜𝐚𝐬𝐭 𝐬𝐞𝐝𝐚𝐧𝐠 𝐛𝐞𝐫𝐣𝐚𝐥𝐚𝐧..."
+    title_done = "✅ 𝐁𝐫𝐨𝐚𝐝𝐜𝐚𝐬𝐭 𝐬𝐞𝐥𝐞𝐬𝐚𝐢!"
+    title_cancelled = "⛔ 𝐁𝐫𝐨𝐚𝐝𝐜𝐚𝐬𝐭 𝐝𝐢𝐛𝐚𝐭𝐚𝐥𝐤𝐚𝐧!"
+
+    def __init__(self, bot, broadcast_id, source_message, status_chat_id, status_message_id, total, counts=None, album=None):
+        counts = counts or {}
+        self.bot = bot
+        self.tenant = tenant()
+        self.broadcast_id = broadcast_id
+        self.source_message = source_message
+        self.status_chat_id = status_chat_id
+        self.status_message_id = status_message_id
+        self.total = total
+        self.sent = counts.get(BroadcastLedger.SENT, 0)
+        self.failed = counts.get(BroadcastLedger.FAILED, 0)
+        self.blocked = counts.get(BroadcastLedger.BLOCKED, 0)
+        self.cancelled = False
+        self.interrupted = False
+        self.started_at = time.monotonic()
+        self._done_at_start = self.done
+        # message_id semua pesan album sumber; None jika sumbernya pesan tunggal
+        self.album = album
+        self._copy_kwargs = self._copy_arguments()
+        self._blocked_ids = []
+        # ID broadcast lintas replika (lihat announce_broadcast); None untuk broadcast satu replika
+        self.shared_uid = None
+        self.task = None
+
+    @property
+    def done(self):
+        return self.sent + self.failed + self.blocked
+
+    def start(self):
+        self.task = asyncio.create_task(self.run())
+        return self.task
+
+    def cancel(self):
+        """Dibatalkan oleh admin; penerima yang tersisa tidak akan dikirimi."""
+        self.cancelled = True
+        if self.task:
+            self.task.cancel()
+
+    def interrupt(self):
+        """Dihentikan karena bot berhenti; broadcast dilanjutkan saat bot dijalankan lagi."""
+        self.interrupted = True
+        if self.task:
+            self.task.cancel()
+
+    async def run(self):
+        logging.info(f"Memulai broadcast #{self.broadcast_id} ke {self.total - self.done} pengguna...")
+        progress_task = asyncio.create_task(self._progress_loop())
+        try:
+            queue = asyncio.Queue(maxsize=BROADCAST_CONCURRENCY * 2)
+            workers = [asyncio.create_task(self._worker(queue)) for _ in range(BROADCAST_CONCURRENCY)]
+            try:
+                async for rows in self.tenant.broadcast_ledger.iter_recipients(self.broadcast_id, self.target_status):
+                    for user_id, message_id in rows:
+                        await queue.put((user_id, message_id))
+                await queue.join()
+            finally:
+                for worker in workers:
+                    worker.cancel()
+                await asyncio.gather(*workers, return_exceptions=True)
+        except asyncio.CancelledError:
+            logging.info(f"Broadcast #{self.broadcast_id} dihentikan setelah {self.done} dari {self.total} pengguna.")
+        except Exception as e:
+            logging.error(f"Broadcast #{self.broadcast_id} berhenti karena kesalahan: {e}")
+        finally:
+            progress_task.cancel()
+            await self.tenant.broadcast_ledger.flush()
+            await self._flush_blocked()
+            await self._finish()
+
+    async def _finish(self):
+        if self.interrupted:
+            await self._edit_status(self._progress_text("⏸ 𝐁𝐫𝐨𝐚𝐝𝐜𝐚𝐬𝐭 𝐝𝐢𝐣𝐞𝐝𝐚, 𝐚𝐤𝐚𝐧 𝐝𝐢𝐥𝐚𝐧𝐣𝐮𝐭𝐤𝐚𝐧 𝐬𝐚𝐚𝐭 𝐛𝐨𝐭 𝐡𝐢𝐝𝐮𝐩 𝐥𝐚𝐠𝐢."))
+            return
+        await self.tenant.broadcast_ledger.set_status(self.broadcast_id, "cancelled" if self.cancelled else "completed")
+        await self._edit_status(await self._final_text())
+
+    async def _worker(self, queue):
+        while True:
+            user_id, message_id = await queue.get()
+            try:
+                await self._deliver(user_id, message_id)
+            finally:
+                queue.task_done()
+
+    def _copy_arguments(self):
+        """Argumen copy_message/copy_messages, dibangun sekali per broadcast; per penerima hanya chat_id yang berubah.
+
+        Menyalin pesan sumber berlaku untuk semua jenis konten (teks, foto, video, dokumen, audio, album,
+        dll.) dan mempertahankan format/entities tanpa perlu diurai ulang.
+        """
+        kwargs = {"from_chat_id": self.source_message.chat_id, "rate_limit_args": BULK_LANE}
+        if self.album:
+            kwargs["message_ids"] = self.album
+        else:
+            kwargs["message_id"] = self.source_message.message_id
+            if self.source_message.reply_markup:
+                kwargs["reply_markup"] = self.source_message.reply_markup
+        return kwargs
+
+    async def _process(self, user_id, message_id):
+        """Menyalin pesan broadcast ke satu pengguna; mengembalikan MessageId yang terkirim (tuple untuk album)."""
+        if self.album:
+            return await self.bot.copy_messages(chat_id=user_id, **self._copy_kwargs)
+        return await self.bot.copy_message(chat_id=user_id, **self._copy_kwargs)
+
+    def _record(self, user_id, status, result=None, error=None):
+        """Mencatat hasil ke jurnal; mengembalikan True jika jurnal perlu di-flush."""
+        message_id = message_ids = None
+        if isinstance(result, tuple):
+            # Telegram tidak menjamin message_id album berurutan, jadi semuanya dicatat
+            message_ids = [copied.message_id for copied in result]
+            message_id = message_ids[0] if message_ids else None
+        elif result:
+            message_id = result.message_id
+        return self.tenant.broadcast_ledger.record(
+            self.broadcast_id, user_id, status, message_id=message_id, error=error, message_ids=message_ids
+        )
+
+    async def _deliver(self, user_id, message_id):
+        for _ in range(BROADCAST_MAX_RETRIES + 1):
+            try:
+                result = await self._process(user_id, message_id)
+                self.sent += 1
+                should_flush = self._record(user_id, BroadcastLedger.SENT, result)
+                break
+            except RetryAfter as e:
+                delay = retry_after_seconds(e)
+                # Penjadwal menahan semua panggilan Bot API (termasuk edit/hapus) sampai jeda ini habis,
+                # jadi percobaan berikutnya otomatis menunggu
+                logging.warning(f"Flood control saat broadcast, menunggu {delay:.0f} detik.", extra={"aggregate": "broadcast_retry_after", "broadcast_id": self.broadcast_id})
+            except Forbidden:
+                logging.info(f"Pengguna {user_id} memblokir bot.", extra={"aggregate": "broadcast_blocked", "user_id": user_id, "broadcast_id": self.broadcast_id})
+                self._blocked_ids.append(user_id)
+                self.blocked += 1
+                should_flush = self._record(user_id, BroadcastLedger.BLOCKED)
+                break
+            except Exception as e:
+                logging.error(f"Gagal mengirim pesan ke pengguna {user_id}: {e}", extra={"aggregate": "broadcast_failed", "user_id": user_id, "broadcast_id": self.broadcast_id})
+                self.failed += 1
+                should_flush = self._record(user_id, BroadcastLedger.FAILED, error=str(e))
+                break
+        else:
+            self.failed += 1
+            should_flush = self._record(user_id, BroadcastLedger.FAILED, error="RetryAfter")
+        if should_flush:
+            await self.tenant.broadcast_ledger.flush()
+
+    async def _flush_blocked(self):
+        blocked_ids, self._blocked_ids = self._blocked_ids, []
+        await self.tenant.user_store.mark_blocked(blocked_ids)
+
+    async def _progress_loop(self):
+        while True:
+            await asyncio.sleep(BROADCAST_PROGRESS_INTERVAL)
+            await self.tenant.broadcast_ledger.flush()
+            await self._flush_blocked()
+            await self._edit_status(self._progress_text(self.title_running))
+
+    def _progress_text(self, title):
+        elapsed = time.monotonic() - self.started_at
+        processed = self.done - self._done_at_start
+        remaining = max(self.total - self.done, 0)
+        eta = remaining / (processed / elapsed) if processed and elapsed else 0
+        return (
+            f"<blockquote>{title}\n🆔 ID: <code>{self.broadcast_id}</code>{replica_label()}\n\n"
+            f"✅ Terkirim: {self.sent}\n❌ Gagal: {self.failed}\n💣 Memblokir: {self.blocked}\n"
+            f"⏳ Progres: {self.done}/{self.total}\n🕒 Perkiraan selesai: {int(eta // 60)}m {int(eta % 60)}s\n\n"
+            f"Gunakan /cancelbroadcast untuk membatalkan.</blockquote>"
+        )
+
+    async def _final_text(self):
+        active_users = await self.tenant.user_store.count()
+        title = self.title_cancelled if self.cancelled else self.title_done
+        return f"<blockquote>{title}\n🆔 ID: <code>{self.broadcast_id}</code>{replica_label()}\n\n📢 𝐏𝐞𝐬𝐚𝐧 𝐭𝐞𝐫𝐤𝐢𝐫𝐢𝐦: {self.sent}\n❌ 𝐆𝐚𝐠𝐚𝐥: {self.failed}\n💣 𝐏𝐞𝐧𝐠𝐠𝐮𝐧𝐚 𝐲𝐚𝐧𝐠 𝐦𝐞𝐦𝐛𝐥𝐨𝐤𝐢𝐫: {self.blocked}\n\n👤𝐉𝐮𝐦𝐥𝐚𝐡 𝐩𝐞𝐧𝐠𝐠𝐮𝐧𝐚 𝐚𝐤𝐭𝐢𝐟 𝐬𝐚𝐚𝐭 𝐢𝐧𝐢: {active_users}</blockquote>"
+
+    async def _edit_status(self, text):
+        if not self.status_chat_id:
+            return
+        try:
+            await self.bot.edit_message_text(text, chat_id=self.status_chat_id, message_id=self.status_message_id, parse_mode=ParseMode.HTML)
+        except Exception as e:
+            logging.warning(f"Gagal memperbarui status broadcast: {e}")
+
+class BroadcastDeleteJob(BroadcastJob):
+    """Menghapus pesan broadcast yang sudah terkirim, memakai message_id dari jurnal."""
+
+    target_status = BroadcastLedger.SENT
+    title_running = "🗑 𝐌𝐞𝐧𝐠𝐡𝐚𝐩𝐮𝐬 𝐛𝐫𝐨𝐚𝐝𝐜𝐚𝐬𝐭..."
+    title_done = "✅ 𝐏𝐞𝐬𝐚𝐧 𝐛𝐫𝐨𝐚𝐝𝐜𝐚𝐬𝐭 𝐭𝐞𝐥𝐚𝐡 𝐝𝐢𝐡𝐚𝐩𝐮𝐬!"
+    title_cancelled = "⛔ 𝐏𝐞𝐧𝐠𝐡𝐚𝐩𝐮𝐬𝐚𝐧 𝐝𝐢𝐛𝐚𝐭𝐚𝐥𝐤𝐚𝐧!"
+
+    async def _process(self, user_id, message_id):
+        if not message_id:
+            return
+        if isinstance(message_id, list):
+            # Album: message_id berisi semua pesan yang tercatat saat dikirim
+            await self.bot.delete_messages(chat_id=user_id, message_ids=message_id, rate_limit_args=BULK_LANE)
+        else:
+            await self.bot.delete_message(chat_id=user_id, message_id=message_id, rate_limit_args=BULK_LANE)
+
+    def _record(self, user_id, status, result=None, error=None):
+        # Hanya penghapusan yang berhasil dicatat; penerima yang gagal tetap berstatus 'sent'
+        if status != BroadcastLedger.SENT:
+            return False
+        return self.tenant.broadcast_ledger.record(self.broadcast_id, user_id, BroadcastLedger.DELETED)
+
+    async def _finish(self):
+        # Status broadcast asli tidak diubah oleh penghapusan
+        if not self.interrupted:
+            await self._edit_status(await self._final_text())
+
+class BroadcastEditJob(BroadcastDeleteJob):
+    """Mengubah teks/caption pesan broadcast yang sudah terkirim."""
+
+    title_running = "✏️ 𝐌𝐞𝐧𝐠𝐮𝐛𝐚𝐡 𝐛𝐫𝐨𝐚𝐝𝐜𝐚𝐬𝐭..."
+    title_done = "✅ 𝐏𝐞𝐬𝐚𝐧 𝐛𝐫𝐨𝐚𝐝𝐜𝐚𝐬𝐭 𝐭𝐞𝐥𝐚𝐡 𝐝𝐢𝐮𝐛𝐚𝐡!"
+    title_cancelled = "⛔ 𝐏𝐞𝐧𝐠𝐮𝐛𝐚𝐡𝐚𝐧 𝐝𝐢𝐛𝐚𝐭𝐚𝐥𝐤𝐚𝐧!"
+
+    def __init__(self, *args, new_text, as_caption, **kwargs):
+        super().__init__(*args, **kwargs)
+        self.new_text = new_text
+        self.as_caption = as_caption
+
+    async def _process(self, user_id, message_id):
+        if not message_id:
+            return
+        if isinstance(message_id, list):
+            # Caption album ada di pesan pertamanya
+            message_id = message_id[0]
+        if self.as_caption:
+            await self.bot.edit_message_caption(chat_id=user_id, message_id=message_id, caption=self.new_text, rate_limit_args=BULK_LANE)
+        else:
+            await self.bot.edit_message_text(self.new_text, chat_id=user_id, message_id=message_id, rate_limit_args=BULK_LANE)
+
+    def _record(self, user_id, status, result=None, error=None):
+        # Pengubahan tidak mengubah status penerima di jurnal
+        return False
+
+def get_active_job(context):
+    """Mengembalikan job broadcast yang sedang berjalan, jika ada (menerima context atau Application)."""
+    job = context.bot_data.get("broadcast_job")
+    if job and job.task and not job.task.done():
+        return job
+    return None
+
+async def resume_broadcast(application: Application):
+    """Melanjutkan broadcast yang terputus karena bot mati atau crash."""
+    record = await tenant().broadcast_ledger.latest_running()
+    if not record:
+        return
+    source_message = Message.de_json(json.loads(record["source"]), application.bot)
+    counts = await tenant().broadcast_ledger.counts(record["broadcast_id"])
+    job = BroadcastJob(
+        application.bot, record["broadcast_id"], source_message,
+        record["status_chat_id"], record["status_message_id"], sum(counts.values()), counts, album=record["album"]
+    )
+    application.bot_data["broadcast_job"] = job
+    logging.info(f"Melanjutkan broadcast #{record['broadcast_id']} ({counts.get(BroadcastLedger.PENDING, 0)} penerima tersisa).")
+    job.start()
+
+def exclusive_broadcast_command(callback):
+    """Update diproses paralel: perintah yang memulai job broadcast dijalankan satu per satu per bot,
+    agar dua admin tidak memulai job bersamaan (cek job aktif dan start tidak atomik)."""
+    @functools.wraps(callback)
+    async def wrapper(update, context):
+        async with tenant().broadcast_lock:
+            return await callback(update, context)
+    return wrapper
+
+async def remember_media_group(update: Update, context: ContextTypes.DEFAULT_TYPE):
+    """Mencatat message_id pesan album yang dikirim admin, agar /broadcast bisa menyalin seluruh album."""
+    message = update.message
+    if not message or not message.media_group_id or not await check_is_admin(update):
+        return
+    key = (message.chat_id, message.media_group_id)
+    media_groups = tenant().media_groups
+    message_ids = media_groups.get(key) or []
+    message_ids.append(message.message_id)
+    media_groups.set(key, message_ids, MEDIA_GROUP_TTL)
+
+def album_message_ids(message):
+    """message_id semua pesan album tempat `message` berada (terurut), atau None untuk pesan tunggal."""
+    if not message.media_group_id:
+        return None
+    message_ids = tenant().media_groups.get((message.chat_id, message.media_group_id))
+    if not message_ids:
+        # Album terkirim sebelum bot dijalankan ulang atau sudah kedaluwarsa dari cache
+        return None
+    return sorted(set(message_ids))
+
+def parse_segment(args):
+    """Membaca opsi target broadcast (aktif=<hari>, langganan=ya|tidak, video=<parameter>); ValueError jika salah."""
+    segment = Segment()
+    for arg in args:
+        key, _, value = arg.partition("=")
+        key = key.lower()
+        if not value:
+            raise ValueError(f"Opsi <code>{html.escape(arg)}</code> harus berbentuk nama=nilai.")
+        if key == "aktif":
+            if not value.isdigit() or int(value) <= 0:
+                raise ValueError("Nilai <code>aktif</code> harus jumlah hari, misalnya <code>aktif=30</code>.")
+            segment.active_days = int(value)
+        elif key == "langganan":
+            if value.lower() not in ("ya", "tidak"):
+                raise ValueError("Nilai <code>langganan</code> harus <code>ya</code> atau <code>tidak</code>.")
+            segment.subscribed = value.lower() == "ya"
+        elif key == "video":
+            segment.video = value
+        else:
+            raise ValueError(f"Opsi <code>{html.escape(key)}</code> tidak dikenal.")
+    return segment
+
+def describe_segment(segment):
+    """Ringkasan target broadcast untuk pesan status."""
+    parts = []
+    if segment.active_days is not None:
+        parts.append(f"aktif {segment.active_days} hari terakhir")
+    if segment.subscribed is not None:
+        parts.append("sudah bergabung di channel FSub" if segment.subscribed else "belum bergabung di channel FSub")
+    if segment.video is not None:
+        parts.append(f"pernah membuka <code>{html.escape(segment.video)}</code>")
+    return ", ".join(parts) or "semua pengguna"
+
+@exclusive_broadcast_command
+async def broadcast_command(update: Update, context: ContextTypes.DEFAULT_TYPE):
+    """Mengirim broadcast ke semua pengguna (atau segmen tertentu) di latar belakang."""
+    if not await check_is_admin(update):
+        await update.message.reply_text("<blockquote>❌ Perintah ini hanya untuk admin.</blockquote>", parse_mode=ParseMode.HTML)
+        return
+
+    reply_message = update.message.reply_to_message
+    if not reply_message:
+        await update.message.reply_text("<blockquote>⚙️ Mohon balas pesan yang ingin Anda broadcast.</blockquote>", parse_mode=ParseMode.HTML)
+        return
+
+    if get_active_job(context):
+        await update.message.reply_text("<blockquote>❌ Masih ada broadcast yang berjalan. Gunakan /cancelbroadcast untuk membatalkannya.</blockquote>", parse_mode=ParseMode.HTML)
+        return
+
+    try:
+        segment = parse_segment(context.args or [])
+    except ValueError as e:
+        await update.message.reply_text(f"<blockquote>❌ {e}\n\nContoh: <code>/broadcast aktif=30 langganan=ya video=nama_parameter</code></blockquote>", parse_mode=ParseMode.HTML)
+        return
+
+    # Pastikan pengguna yang baru saja /start ikut menerima broadcast
+    state = tenant()
+    await state.user_store.flush()
+    await state.video_open_store.flush()
+    total_users = await state.user_store.count(segment=segment)
+    if not total_users:
+        await update.message.reply_text(f"<blockquote>❌ Tidak ada pengguna yang cocok dengan target: {describe_segment(segment)}.</blockquote>", parse_mode=ParseMode.HTML)
+        return
+
+    album = album_message_ids(reply_message)
+    if reply_message.media_group_id and not album:
+        # Tanpa daftar pesan albumnya, broadcast hanya akan menyalin satu media
+        await update.message.reply_text("<blockquote>❌ Isi album ini tidak lagi diketahui bot (album terkirim sebelum bot dijalankan ulang atau sudah terlalu lama). Kirim ulang albumnya, lalu balas album yang baru dengan /broadcast.</blockquote>", parse_mode=ParseMode.HTML)
+        return
+    replicas = f"\n🧩 Dibagi ke {REPLICA_COUNT} replika" if REPLICA_COUNT > 1 else ""
+    media = f"\n🖼 Album: {len(album)} media" if album else ""
+    status_message = await update.message.reply_text(f"<blockquote>📢 𝐁𝐫𝐨𝐚𝐝𝐜𝐚𝐬𝐭 𝐝𝐢𝐦𝐮𝐥𝐚𝐢 𝐤𝐞 {total_users} 𝐩𝐞𝐧𝐠𝐠𝐮𝐧𝐚...\n🎯 Target: {describe_segment(segment)}{replicas}{media}</blockquote>", parse_mode=ParseMode.HTML)
+
+    shared_uid = await announce_broadcast(reply_message, status_message.chat_id, segment, album)
+    job = await create_broadcast_job(context.bot, reply_message, status_message.chat_id, status_message.message_id, segment, shared_uid, album)
+    context.bot_data["broadcast_job"] = job
+    job.start()
+
+async def create_broadcast_job(bot, source_message, status_chat_id, status_message_id, segment, shared_uid=None, album=None):
+    """Mengisi jurnal dengan penerima milik replika ini (shard hash user_id) lalu membuat job broadcast-nya."""
+    state = tenant()
+    if REPLICA_COUNT > 1:
+        segment.shard = (REPLICA_INDEX, REPLICA_COUNT)
+    # Penyimpanan pengguna bersama tidak ada di SQLite lokal, sehingga penerimanya dialirkan ke jurnal
+    recipients = state.user_store.iter_user_ids(segment=segment) if state.backend.shared else None
+    broadcast_id, total = await state.broadcast_ledger.create(source_message.to_json(), status_chat_id, status_message_id, segment, recipients, album)
+    job = BroadcastJob(bot, broadcast_id, source_message, status_chat_id, status_message_id, total, album=album)
+    job.shared_uid = shared_uid
+    return job
+
+async def announce_broadcast(source_message, status_chat_id, segment, album=None):
+    """Memberi tahu replika lain agar mengirim bagiannya; mengembalikan ID broadcast lintas replika."""
+    if REPLICA_COUNT == 1:
+        return None
+    shared_uid = uuid.uuid4().hex[:12]
+    await tenant().backend.announce({
+        "action": "start",
+        "uid": shared_uid,
+        "replica": REPLICA_INDEX,
+        "source": source_message.to_json(),
+        "status_chat_id": status_chat_id,
+        "segment": {"active_days": segment.active_days, "subscribed": segment.subscribed, "video": segment.video},
+        "album": album,
+    })
+    return shared_uid
+
+async def follow_broadcasts(application: Application):
+    """Menjalankan bagian replika ini dari broadcast (atau pembatalan) yang diumumkan replika lain."""
+    state = tenant()
+    while True:
+        await asyncio.sleep(BROADCAST_SYNC_INTERVAL)
+        try:
+            announcements = await state.backend.poll_announcements()
+        except (OSError, RedisError) as e:
+            logging.warning(f"Gagal memeriksa pengumuman broadcast: {e}")
+            continue
+        for announcement in announcements:
+            if announcement["replica"] == REPLICA_INDEX:
+                continue
+            try:
+                await apply_broadcast_announcement(application, announcement)
+            except Exception as e:
+                logging.error(f"Gagal menjalankan pengumuman broadcast {announcement['uid']}: {e}")
+
+async def apply_broadcast_announcement(application: Application, announcement):
+    job = get_active_job(application)
+    if announcement["action"] == "cancel":
+        if job and job.shared_uid == announcement["uid"]:
+            job.cancel()
+        return
+    async with tenant().broadcast_lock:
+        if get_active_job(application):
+            logging.warning(f"Bagian broadcast {announcement['uid']} dilewati: replika ini masih menjalankan broadcast lain.")
+            return
+        source_message = Message.de_json(json.loads(announcement["source"]), application.bot)
+        status_message = await application.bot.send_message(
+            announcement["status_chat_id"],
+            f"<blockquote>📢 𝐁𝐫𝐨𝐚𝐝𝐜𝐚𝐬𝐭 𝐝𝐢𝐦𝐮𝐥𝐚𝐢 𝐝𝐢 𝐫𝐞𝐩𝐥𝐢𝐤𝐚 {REPLICA_INDEX + 1}/{REPLICA_COUNT}...</blockquote>",
+            parse_mode=ParseMode.HTML
+        )
+        job = await create_broadcast_job(
+            application.bot, source_message, status_message.chat_id, status_message.message_id,
+            Segment(**announcement["segment"]), announcement["uid"], announcement.get("album")
+        )
+        application.bot_data["broadcast_job"] = job
+        job.start()
+
+async def cancel_broadcast_command(update: Update, context: ContextTypes.DEFAULT_TYPE):
+    """Membatalkan broadcast yang sedang berjalan."""
+    if not await check_is_admin(update):
+        await update.message.reply_text("<blockquote>❌ Perintah ini hanya untuk admin.</blockquote>", parse_mode=ParseMode.HTML)
+        return
+
+    job = get_active_job(context)
+    if not job:
+        await update.message.reply_text("<blockquote>❌ Tidak ada broadcast yang sedang berjalan.</blockquote>", parse_mode=ParseMode.HTML)
+        return
+
+    job.cancel()
+    if job.shared_uid:
+        await tenant().backend.announce({"action": "cancel", "uid": job.shared_uid, "replica": REPLICA_INDEX})
+    await update.message.reply_text("<blockquote>⛔ Broadcast sedang dibatalkan...</blockquote>", parse_mode=ParseMode.HTML)
+
+async def get_broadcast_record(update: Update, context: ContextTypes.DEFAULT_TYPE, usage: str):
+    """Validasi umum untuk perintah yang bekerja pada broadcast tersimpan; mengembalikan record atau None."""
+    if not await check_is_admin(update):
+        await update.message.reply_text("<blockquote>❌ Perintah ini hanya untuk admin.</blockquote>", parse_mode=ParseMode.HTML)
+        return None
+    if not context.args:
+        await update.message.reply_text(f"<blockquote>❌ Mohon sertakan ID broadcast. Contoh:\n<code>{usage}</code></blockquote>", parse_mode=ParseMode.HTML)
+        return None
+    try:
+        broadcast_id = int(context.args[0])
+    except ValueError:
+        await update.message.reply_text("<blockquote>❌ ID broadcast tidak valid. Pastikan itu adalah angka.</blockquote>", parse_mode=ParseMode.HTML)
+        return None
+    if get_active_job(context):
+        await update.message.reply_text("<blockquote>❌ Masih ada broadcast yang berjalan. Gunakan /cancelbroadcast untuk membatalkannya.</blockquote>", parse_mode=ParseMode.HTML)
+        return None
+    record = await tenant().broadcast_ledger.get(broadcast_id)
+    if not record:
+        await update.message.reply_text("<blockquote>❌ Broadcast tidak ditemukan.</blockquote>", parse_mode=ParseMode.HTML)
+        return None
+    return record
+
+@exclusive_broadcast_command
+async def retry_broadcast_command(update: Update, context: ContextTypes.DEFAULT_TYPE):
+    """Mengirim ulang broadcast hanya ke penerima yang sebelumnya gagal."""
+    record = await get_broadcast_record(update, context, "/retrybroadcast 12")
+    if not record:
+        return
+    # Job memproses semua penerima 'pending': pada broadcast yang dibatalkan atau belum selesai,
+    # itu termasuk penerima yang belum pernah dicoba, bukan hanya yang gagal
+    if record["status"] != "completed":
+        await update.message.reply_text(f"<blockquote>❌ Hanya broadcast yang sudah selesai yang bisa dikirim ulang (status broadcast #{record['broadcast_id']}: {record['status']}).</blockquote>", parse_mode=ParseMode.HTML)
+        return
+
+    retried = await tenant().broadcast_ledger.reset_failed(record["broadcast_id"])
+    if not retried:
+        await update.message.reply_text("<blockquote>✅ Tidak ada penerima yang gagal pada broadcast ini.</blockquote>", parse_mode=ParseMode.HTML)
+        return
+
+    status_message = await update.message.reply_text(f"<blockquote>🔄 Mengirim ulang broadcast #{record['broadcast_id']} ke {retried} pengguna...</blockquote>", parse_mode=ParseMode.HTML)
+    await tenant().broadcast_ledger.set_status(record["broadcast_id"], "running")
+    counts = await tenant().broadcast_ledger.counts(record["broadcast_id"])
+    source_message = Message.de_json(json.loads(record["source"]), context.bot)
+    job = BroadcastJob(context.bot, record["broadcast_id"], source_message, status_message.chat_id, status_message.message_id, sum(counts.values()), counts, album=record["album"])
+    context.bot_data["broadcast_job"] = job
+    job.start()
+
+@exclusive_broadcast_command
+async def delete_broadcast_command(update: Update, context: ContextTypes.DEFAULT_TYPE):
+    """Menghapus pesan broadcast dari semua penerima."""
+    record = await get_broadcast_record(update, context, "/delbroadcast 12")
+    if not record:
+        return
+
+    counts = await tenant().broadcast_ledger.counts(record["broadcast_id"])
+    total = counts.get(BroadcastLedger.SENT, 0)
+    status_message = await update.message.reply_text(f"<blockquote>🗑 Menghapus broadcast #{record['broadcast_id']} dari {total} pengguna...</blockquote>", parse_mode=ParseMode.HTML)
+    source_message = Message.de_json(json.loads(record["source"]), context.bot)
+    job = BroadcastDeleteJob(context.bot, record["broadcast_id"], source_message, status_message.chat_id, status_message.message_id, total, album=record["album"])
+    context.bot_data["broadcast_job"] = job
+    job.start()
+
+@exclusive_broadcast_command
+async def edit_broadcast_command(update: Update, context: ContextTypes.DEFAULT_TYPE):
+    """Mengubah teks/caption pesan broadcast di semua penerima."""
+    reply_message = update.message.reply_to_message
+    if not reply_message or not reply_message.text:
+        if await check_is_admin(update):
+            await update.message.reply_text("<blockquote>⚙️ Mohon balas pesan teks baru dengan perintah /editbroadcast &lt;id&gt;.</blockquote>", parse_mode=ParseMode.HTML)
+        else:
+            await update.message.reply_text("<blockquote>❌ Perintah ini hanya untuk admin.</blockquote>", parse_mode=ParseMode.HTML)
+        return
+
+    record = await get_broadcast_record(update, context, "/editbroadcast 12")
+    if not record:
+        return
+
+    source_message = Message.de_json(json.loads(record["source"]), context.bot)
+    counts = await tenant().broadcast_ledger.counts(record["broadcast_id"])
+    total = counts.get(BroadcastLedger.SENT, 0)
+    status_message = await update.message.reply_text(f"<blockquote>✏️ Mengubah broadcast #{record['broadcast_id']} di {total} pengguna...</blockquote>", parse_mode=ParseMode.HTML)
+    job = BroadcastEditJob(
+        context.bot, record["broadcast_id"], source_message, status_message.chat_id, status_message.message_id, total,
+        album=record["album"], new_text=reply_message.text, as_caption=not source_message.text
+    )
+    context.bot_data["broadcast_job"] = job
+    job.start()
+
+async def add_button_handler(update: Update, context: ContextTypes.DEFAULT_TYPE):
+    """Menambahkan tombol inline pada pesan yang dibalas."""
+    config = get_config()
+    if not await check_is_admin(update):
+        await update.message.reply_text("<blockquote>❌ Perintah ini hanya untuk admin.</blockquote>", parse_mode=ParseMode.HTML)
+        return
+
+    reply_message = update.message.reply_to_message
+    if not reply_message:
+        await update.message.reply_text("<blockquote>⚙️ Mohon balas pesan yang ingin Anda tambahkan tombol.</blockquote>", parse_mode=ParseMode.HTML)
+        return
+        
+    if len(context.args) < 2:
+        await update.message.reply_text("<blockquote>⚙️ Mohon sertakan teks dan URL tombol. Contoh:\n<code>/addbutton Kunjungi Website https://google.com</code></blockquote>", parse_mode=ParseMode.HTML)
+        return
+
+    button_text = " ".join(context.args[:-1])
+    button_url = context.args[-1]
+    
+    keyboard = InlineKeyboardMarkup([[InlineKeyboardButton(button_text, url=button_url)]])
+    
+    message_parse_mode = getattr(reply_message, 'parse_mode', ParseMode.HTML)
+
+    try:
+        if reply_message.text:
+            await update.message.reply_text(
+                text=reply_message.text,
+                reply_markup=keyboard,
+                parse_mode=message_parse_mode
+            )
+        elif reply_message.photo:
+            await update.message.reply_photo(
+                photo=reply_message.photo[-1].file_id,
+                caption=reply_message.caption or "",
+                reply_markup=keyboard,
+                parse_mode=message_parse_mode
             )
         elif reply_message.video:
             await update.message.reply_video(
@@ -547,12 +2097,608 @@ async def add_button_handler(update: Update, context: ContextTypes.DEFAULT_TYPE)
         logging.error(f"Gagal mengirim pesan dengan tombol: {e}")
         await update.message.reply_text(f"<blockquote>❌ Terjadi kesalahan saat mengirim pesan dengan tombol: {html.escape(str(e))}</blockquote>", parse_mode=ParseMode.HTML)
 
+# --- Metrik dan Statistik ---
+# Batas kirim pesan bot Telegram (pesan/detik) sebagai pembanding di /stats
+TELEGRAM_SEND_LIMIT = 30
+
+metrics.describe("handler_latency_seconds", "Latensi handler update dalam detik.")
+metrics.describe("handler_errors_total", "Jumlah error yang dilempar handler update.")
+metrics.describe("api_latency_seconds", "Latensi panggilan Bot API dalam detik.")
+metrics.describe("api_errors_total", "Jumlah panggilan Bot API yang gagal per jenis error.")
+
+metrics_server = MetricsServer(metrics, METRICS_HOST, METRICS_PORT) if METRICS_PORT else None
+
+class InstrumentedRateLimiter(BaseRateLimiter):
+    """Tidak membatasi apa pun; hanya mengukur setiap panggilan Bot API (method, latensi, jenis error)."""
+
+    async def initialize(self):
+        pass
+
+    async def shutdown(self):
+        pass
+
+    async def process_request(self, callback, args, kwargs, endpoint, data, rate_limit_args):
+        started = time.perf_counter()
+        error = None
+        try:
+            return await callback(*args, **kwargs)
+        except asyncio.CancelledError:
+            error = "Cancelled"
+            raise
+        except Exception as e:
+            error = type(e).__name__
+            raise
+        finally:
+            metrics.observe("api_latency_seconds", time.perf_counter() - started, method=endpoint)
+            if error:
+                metrics.inc("api_errors_total", method=endpoint, error=error)
+            if endpoint.startswith(("send", "copy", "forward")):
+                metrics.rate("api_sends").mark()
+
+
+# --- Profiling Sesuai Permintaan ---
+# Batas default dan maksimal sesi /profile, serta kedalaman stack yang direkam tracemalloc
+PROFILE_DEFAULT_UPDATES = int(os.getenv("PROFILE_DEFAULT_UPDATES", "100"))
+PROFILE_DEFAULT_SECONDS = float(os.getenv("PROFILE_DEFAULT_SECONDS", "60"))
+PROFILE_MAX_SECONDS = float(os.getenv("PROFILE_MAX_SECONDS", "600"))
+PROFILE_TRACEMALLOC_FRAMES = int(os.getenv("PROFILE_TRACEMALLOC_FRAMES", "10"))
+PROFILE_TOP_ENTRIES = 30
+
+class HandlerProfiler:
+    """Menjalankan cProfile dan tracemalloc selama N update atau T detik, lalu mengirim ringkasannya ke admin.
+
+    Saat tidak aktif, biayanya hanya satu pengecekan atribut `active` per handler dan per update.
+    cProfile dan tracemalloc berlaku untuk seluruh proses, jadi di mode multi-bot satu sesi merekam
+    update semua bot; hanya bot yang memulai sesi (`owner`) yang boleh menghentikannya.
+    """
+
+    def __init__(self):
+        self.active = False
+        self.owner = None
+        self._timer = None
+
+    def start(self, bot, chat_id, max_updates, duration, owner=None):
+        profile = cProfile.Profile()
+        profile.enable()
+        self.owner = owner
+        self.bot = bot
+        self.chat_id = chat_id
+        self.max_updates = max_updates
+        self.duration = duration
+        self.updates = 0
+        # nama handler -> [jumlah panggilan, total detik, detik terlama]
+        self.handler_times = {}
+        self.started_tracemalloc = not tracemalloc.is_tracing()
+        if self.started_tracemalloc:
+            tracemalloc.start(PROFILE_TRACEMALLOC_FRAMES)
+        self.baseline = tracemalloc.take_snapshot()
+        self.profile = profile
+        self.started_at = time.perf_counter()
+        self.active = True
+        self._timer = asyncio.create_task(self._expire(duration))
+
+    async def _expire(self, duration):
+        await asyncio.sleep(duration)
+        self.stop()
+
+    def record_handler(self, name, elapsed):
+        stats = self.handler_times.setdefault(name, [0, 0.0, 0.0])
+        stats[0] += 1
+        stats[1] += elapsed
+        stats[2] = max(stats[2], elapsed)
+
+    def record_update(self):
+        self.updates += 1
+        if self.updates >= self.max_updates:
+            self.stop()
+
+    def stop(self):
+        """Menghentikan sesi dan mengirim laporan di latar belakang; aman dipanggil berkali-kali."""
+        if not self.active:
+            return
+        self.active = False
+        self.profile.disable()
+        snapshot = tracemalloc.take_snapshot()
+        if self.started_tracemalloc:
+            tracemalloc.stop()
+        if self._timer is not asyncio.current_task():
+            self._timer.cancel()
+        # Laporan dibangun di thread lain; data sesi disalin agar sesi baru bisa langsung dimulai
+        session = (self.profile, self.baseline, snapshot, self.updates, time.perf_counter() - self.started_at, self.handler_times)
+        self.profile = self.baseline = None
+        asyncio.create_task(self._send(self.bot, self.chat_id, session))
+
+    @staticmethod
+    def _report(profile, baseline, snapshot, updates, elapsed, handler_times):
+        lines = [f"Sesi profiling: {updates} update dalam {elapsed:.1f} detik", ""]
+
+        lines.append("== Handler (waktu nyata) ==")
+        for name, (count, total, longest) in sorted(handler_times.items(), key=lambda item: -item[1][1]):
+            lines.append(f"{name:<32} {count:>6}x  rata-rata {total / count * 1000:8.1f} ms  terlama {longest * 1000:8.1f} ms")
+        lines.append("")
+
+        lines.append(f"== {PROFILE_TOP_ENTRIES} fungsi teratas menurut waktu kumulatif (cProfile) ==")
+        output = io.StringIO()
+        pstats.Stats(profile, stream=output).sort_stats("cumulative").print_stats(PROFILE_TOP_ENTRIES)
+        lines.append(output.getvalue())
+
+        lines.append(f"== {PROFILE_TOP_ENTRIES} lokasi alokasi memori teratas (tracemalloc) ==")
+        ignored = (tracemalloc.Filter(False, tracemalloc.__file__), tracemalloc.Filter(False, "<frozen importlib._bootstrap*>"))
+        differences = snapshot.filter_traces(ignored).compare_to(baseline.filter_traces(ignored), "traceback")
+        for difference in differences[:PROFILE_TOP_ENTRIES]:
+            lines.append(f"{difference.size_diff / 1024:+.1f} KiB ({difference.count_diff:+d} blok), total {difference.size / 1024:.1f} KiB")
+            lines.extend(f"    {line}" for line in difference.traceback.format()[-6:])
+        return "\n".join(lines)
+
+    async def _send(self, bot, chat_id, session):
+        try:
+            # pstats dan perbandingan snapshot tracemalloc bisa makan waktu; jangan tahan event loop
+            report = await asyncio.to_thread(self._report, *session)
+            await bot.send_document(
+                chat_id=chat_id,
+                document=io.BytesIO(report.encode("utf-8")),
+                filename=f"profile-{datetime.datetime.now():%Y%m%d-%H%M%S}.txt",
+                caption=f"<blockquote>🩺 Hasil profiling: {session[3]} update.</blockquote>",
+                parse_mode=ParseMode.HTML
+            )
+        except Exception as e:
+            logging.error(f"Gagal mengirim hasil profiling: {e}")
+
+handler_profiler = HandlerProfiler()
+
+def instrument_handler(callback):
+    """Membungkus callback handler untuk mencatat latensi dan error-nya."""
+    name = callback.__name__
+
+    @functools.wraps(callback)
+    async def wrapper(update, context):
+        started = time.perf_counter()
+        user = getattr(update, "effective_user", None)
+        chat = getattr(update, "effective_chat", None)
+        token = log_context.set({
+            "handler": name,
+            "user_id": user.id if user else None,
+            "chat_id": chat.id if chat else None,
+        })
+        try:
+            return await callback(update, context)
+        except ApplicationHandlerStop:
+            # Bukan error: handler sengaja menghentikan pemrosesan update
+            raise
+        except Exception as e:
+            metrics.inc("handler_errors_total", handler=name, error=type(e).__name__)
+            raise
+        finally:
+            elapsed = time.perf_counter() - started
+            metrics.observe("handler_latency_seconds", elapsed, handler=name)
+            if handler_profiler.active:
+                handler_profiler.record_handler(name, elapsed)
+            log_context.reset(token)
+    return wrapper
+
+def instrument_handlers(application: Application):
+    """Memasang instrumentasi pada semua handler yang sudah didaftarkan."""
+    for handlers in application.handlers.values():
+        for handler in handlers:
+            handler.callback = instrument_handler(handler.callback)
+
+def format_latency_rows(histogram_name, label, error_counter):
+    """Baris ringkasan per handler/method: jumlah panggilan, p50, p99 dan jumlah error."""
+    errors = {}
+    for labels, value in metrics.counter_series(error_counter):
+        errors.setdefault(labels[label], []).append((labels["error"], int(value)))
+    rows = []
+    for labels, histogram in metrics.histogram_series(histogram_name):
+        name = labels[label]
+        error_list = errors.get(name, [])
+        error_text = ", ".join(f"{error} {count}" for error, count in sorted(error_list, key=lambda item: -item[1])[:3])
+        rows.append(
+            f"• <code>{html.escape(name)}</code>: {histogram.count}x | p50 {histogram.quantile(0.5) * 1000:.0f}ms | "
+            f"p99 {histogram.quantile(0.99) * 1000:.0f}ms" + (f" | ❌ {html.escape(error_text)}" if error_text else "")
+        )
+    return rows
+
+async def stats_command(update: Update, context: ContextTypes.DEFAULT_TYPE):
+    """Menampilkan statistik latensi handler dan panggilan Bot API."""
+    if not await check_is_admin(update):
+        await update.message.reply_text("<blockquote>❌ Perintah ini hanya untuk admin.</blockquote>", parse_mode=ParseMode.HTML)
+        return
+
+    uptime = int(time.time() - metrics.started_at)
+    send_rate = metrics.rate("api_sends")
+    handler_rows = format_latency_rows("handler_latency_seconds", "handler", "handler_errors_total")
+    api_rows = format_latency_rows("api_latency_seconds", "method", "api_errors_total")
+    handler_text = "\n".join(handler_rows) or "Belum ada data."
+    api_text = "\n".join(api_rows) or "Belum ada data."
+    queue_text = ", ".join(
+        f"{lane} {int(metrics.gauge('outbound_queue_depth', lane=lane))} menunggu / "
+        f"{int(metrics.gauge('outbound_in_flight', lane=lane))} berjalan"
+        for lane in OUTBOUND_LANES
+    )
+
+    message = (
+        f"<b>📊 Statistik Bot</b> (uptime {uptime // 3600}j {uptime % 3600 // 60}m)\n\n"
+        f"<b>⚙️ Handler:</b>\n{handler_text}\n\n"
+        f"<b>📡 Bot API:</b>\n{api_text}\n\n"
+        f"<b>🚦 Laju kirim:</b> {send_rate.per_second(10):.1f} pesan/detik (puncak {send_rate.peak()}/detik, batas ±{TELEGRAM_SEND_LIMIT}/detik)\n"
+        f"<b>📥 Antrean keluar:</b> {queue_text}"
+    )
+    await update.message.reply_text(f"<blockquote>{message}</blockquote>", parse_mode=ParseMode.HTML)
+
+async def profile_command(update: Update, context: ContextTypes.DEFAULT_TYPE):
+    """Menangani perintah /profile: merekam profil handler untuk N update berikutnya atau T detik."""
+    if not await check_is_admin(update):
+        await update.message.reply_text("<blockquote>❌ Perintah ini hanya untuk admin.</blockquote>", parse_mode=ParseMode.HTML)
+        return
+
+    if context.args and context.args[0].lower() == "stop":
+        if not handler_profiler.active:
+            await update.message.reply_text("<blockquote>❌ Tidak ada sesi profiling yang berjalan.</blockquote>", parse_mode=ParseMode.HTML)
+            return
+        if handler_profiler.owner != tenant().name:
+            await update.message.reply_text("<blockquote>❌ Sesi profiling ini dimulai oleh bot lain di proses yang sama.</blockquote>", parse_mode=ParseMode.HTML)
+            return
+        handler_profiler.stop()
+        await update.message.reply_text("<blockquote>⏹ Profiling dihentikan, hasil sedang dikirim...</blockquote>", parse_mode=ParseMode.HTML)
+        return
+
+    if handler_profiler.active:
+        await update.message.reply_text("<blockquote>❌ Sesi profiling masih berjalan. Gunakan <code>/profile stop</code> untuk menghentikannya.</blockquote>", parse_mode=ParseMode.HTML)
+        return
+
+    try:
+        max_updates = int(context.args[0]) if context.args else PROFILE_DEFAULT_UPDATES
+        duration = float(context.args[1]) if len(context.args) > 1 else PROFILE_DEFAULT_SECONDS
+        if max_updates <= 0 or duration <= 0:
+            raise ValueError
+    except ValueError:
+        await update.message.reply_text("<blockquote>❌ Format salah. Contoh:\n<code>/profile 200 60</code> (200 update atau 60 detik)</blockquote>", parse_mode=ParseMode.HTML)
+        return
+    duration = min(duration, PROFILE_MAX_SECONDS)
+
+    try:
+        handler_profiler.start(context.bot, update.effective_chat.id, max_updates, duration, owner=tenant().name)
+    except ValueError as e:
+        # Misalnya profiler lain sudah aktif di proses ini
+        await update.message.reply_text(f"<blockquote>❌ Profiling tidak bisa dimulai: {html.escape(str(e))}</blockquote>", parse_mode=ParseMode.HTML)
+        return
+    await update.message.reply_text(f"<blockquote>🩺 Profiling aktif untuk {max_updates} update berikutnya atau {duration:.0f} detik. Hasilnya akan dikirim sebagai dokumen.</blockquote>", parse_mode=ParseMode.HTML)
+
+# --- Penjadwal Permintaan Keluar ---
+# Batas laju global pengiriman pesan bot (pesan/detik) yang dibagi semua jalur
+OUTBOUND_GLOBAL_RATE = float(os.getenv("OUTBOUND_GLOBAL_RATE", str(TELEGRAM_SEND_LIMIT)))
+# Batas per chat: ±1 pesan/detik di chat pribadi, 20 pesan/menit di grup/channel
+PRIVATE_CHAT_RATE = float(os.getenv("PRIVATE_CHAT_RATE", "1"))
+PRIVATE_CHAT_BURST = float(os.getenv("PRIVATE_CHAT_BURST", "3"))
+GROUP_CHAT_RATE = float(os.getenv("GROUP_CHAT_RATE", str(20 / 60)))
+GROUP_CHAT_BURST = float(os.getenv("GROUP_CHAT_BURST", "20"))
+CHAT_BUCKET_CACHE_SIZE = int(os.getenv("CHAT_BUCKET_CACHE_SIZE", "10000"))
+# Jumlah koneksi HTTP yang boleh dipakai bersamaan oleh tiap jalur
+INTERACTIVE_POOL_SIZE = int(os.getenv("INTERACTIVE_POOL_SIZE", "64"))
+BULK_POOL_SIZE = int(os.getenv("BULK_POOL_SIZE", str(BROADCAST_CONCURRENCY)))
+# Balasan interaktif yang terkena RetryAfter dicoba sekali lagi jika jedanya tidak lebih dari ini (detik)
+INTERACTIVE_RETRY_MAX_DELAY = float(os.getenv("INTERACTIVE_RETRY_MAX_DELAY", "5"))
+
+OUTBOUND_LANES = {"interactive": 0, "bulk": 1}
+SEND_ENDPOINT_PREFIXES = ("send", "copy", "forward")
+
+metrics.describe("outbound_queue_depth", "Jumlah panggilan Bot API yang menunggu giliran per jalur.")
+metrics.describe("outbound_in_flight", "Jumlah panggilan Bot API yang sedang berjalan per jalur.")
+metrics.describe("outbound_wait_seconds", "Lama panggilan Bot API menunggu di penjadwal per jalur.")
+
+class OutboundScheduler(InstrumentedRateLimiter):
+    """Menjadwalkan panggilan Bot API dalam dua jalur: "interactive" (default) dan "bulk" (broadcast).
+
+    Jalur interactive selalu didahulukan saat berebut batas laju global, sehingga balasan /start dan
+    pengecekan keanggotaan tidak mengantre di belakang ribuan pesan broadcast. Setiap jalur punya
+    jatah koneksi sendiri dan tiap chat tujuan dibatasi sesuai aturan Telegram.
+    """
+
+    def __init__(self):
+        self.global_bucket = TokenBucket(OUTBOUND_GLOBAL_RATE)
+        self.bulk_bucket = TokenBucket(BROADCAST_RATE)
+        self.chat_buckets = TTLCache(CHAT_BUCKET_CACHE_SIZE)
+        self.slots = {"interactive": asyncio.Semaphore(INTERACTIVE_POOL_SIZE), "bulk": asyncio.Semaphore(BULK_POOL_SIZE)}
+        self.waiting = dict.fromkeys(OUTBOUND_LANES, 0)
+        self.in_flight = dict.fromkeys(OUTBOUND_LANES, 0)
+        # Batas waktu (monotonic) jeda flood control; ditunggu oleh semua endpoint di semua jalur
+        self.flood_until = 0.0
+
+    def _chat_bucket(self, chat_id):
+        """Token bucket untuk satu chat tujuan; dibuang dari cache setelah satu menit tidak dipakai."""
+        bucket = self.chat_buckets.get(chat_id)
+        if bucket is None:
+            is_private = isinstance(chat_id, int) and chat_id > 0
+            if is_private:
+                bucket = TokenBucket(PRIVATE_CHAT_RATE, PRIVATE_CHAT_BURST)
+            else:
+                bucket = TokenBucket(GROUP_CHAT_RATE, GROUP_CHAT_BURST)
+        self.chat_buckets.set(chat_id, bucket, 60)
+        return bucket
+
+    def _update_gauges(self, lane):
+        metrics.set_gauge("outbound_queue_depth", self.waiting[lane], lane=lane)
+        metrics.set_gauge("outbound_in_flight", self.in_flight[lane], lane=lane)
+
+    async def _wait_for_flood(self):
+        # Jeda bisa diperpanjang oleh RetryAfter lain selama menunggu
+        while (delay := self.flood_until - time.monotonic()) > 0:
+            await asyncio.sleep(delay)
+
+    async def _acquire(self, lane, endpoint, data):
+        priority = OUTBOUND_LANES[lane]
+        # Juga untuk edit, hapus dan get*: bukan hanya pengiriman pesan yang kena flood control
+        await self._wait_for_flood()
+        if lane == "bulk":
+            await self.bulk_bucket.acquire()
+        if endpoint.startswith(SEND_ENDPOINT_PREFIXES):
+            chat_id = data.get("chat_id")
+            if chat_id is not None:
+                await self._chat_bucket(chat_id).acquire(priority)
+            await self.global_bucket.acquire(priority)
+
+    async def process_request(self, callback, args, kwargs, endpoint, data, rate_limit_args):
+        lane = (rate_limit_args or {}).get("lane", "interactive")
+        if lane not in OUTBOUND_LANES:
+            lane = "interactive"
+        retried = False
+        while True:
+            started = time.perf_counter()
+            self.waiting[lane] += 1
+            self._update_gauges(lane)
+            try:
+                await self._acquire(lane, endpoint, data)
+                await self.slots[lane].acquire()
+            finally:
+                self.waiting[lane] -= 1
+                self._update_gauges(lane)
+            metrics.observe("outbound_wait_seconds", time.perf_counter() - started, lane=lane)
+
+            self.in_flight[lane] += 1
+            self._update_gauges(lane)
+            try:
+                return await super().process_request(callback, args, kwargs, endpoint, data, rate_limit_args)
+            except RetryAfter as e:
+                # Flood control berlaku untuk seluruh bot: tahan semua jalur selama jeda
+                delay = retry_after_seconds(e)
+                self.flood_until = max(self.flood_until, time.monotonic() + delay)
+                self.global_bucket.pause(delay)
+                if lane != "interactive" or retried or delay > INTERACTIVE_RETRY_MAX_DELAY:
+                    raise
+                retried = True
+            finally:
+                self.slots[lane].release()
+                self.in_flight[lane] -= 1
+                self._update_gauges(lane)
+
+# --- Pemrosesan Update Paralel ---
+# Jumlah update yang diproses bersamaan, dan jumlah update yang boleh menunggu giliran
+UPDATE_CONCURRENCY = int(os.getenv("UPDATE_CONCURRENCY", "64"))
+UPDATE_QUEUE_SIZE = int(os.getenv("UPDATE_QUEUE_SIZE", "4096"))
+
+class OrderedUpdateProcessor(BaseUpdateProcessor):
+    """Memproses update dari pengguna berbeda secara paralel; update dari pengguna yang sama tetap berurutan.
+
+    Update menunggu giliran penggunanya lebih dulu, baru kemudian mengambil slot paralel, sehingga
+    satu pengguna yang spam tidak menghabiskan slot milik pengguna lain.
+    """
+
+    def __init__(self, max_concurrent_updates=UPDATE_CONCURRENCY, max_queued_updates=UPDATE_QUEUE_SIZE):
+        super().__init__(max(max_concurrent_updates, max_queued_updates))
+        self._running = asyncio.Semaphore(max_concurrent_updates)
+        # kunci urutan -> [Lock, jumlah update yang memakai/menunggu kunci]
+        self._locks = {}
+
+    @staticmethod
+    def ordering_key(update):
+        if isinstance(update, Update):
+            if update.effective_user:
+                return update.effective_user.id
+            if update.effective_chat:
+                return update.effective_chat.id
+        return None
+
+    async def do_process_update(self, update, coroutine):
+        key = self.ordering_key(update)
+        if key is None:
+            async with self._running:
+                await coroutine
+            if handler_profiler.active:
+                handler_profiler.record_update()
+            return
+
+        entry = self._locks.get(key)
+        if entry is None:
+            entry = self._locks[key] = [asyncio.Lock(), 0]
+        entry[1] += 1
+        try:
+            async with entry[0]:
+                async with self._running:
+                    await coroutine
+        finally:
+            entry[1] -= 1
+            if not entry[1]:
+                del self._locks[key]
+            if handler_profiler.active:
+                handler_profiler.record_update()
+
+    async def initialize(self):
+        pass
+
+    async def shutdown(self):
+        pass
+
+# --- Tenant (Satu Set State per Bot) ---
+class Tenant:
+    """Semua state milik satu bot: konfigurasi, penyimpanan, cache dan kunci.
+
+    Mode biasa memakai satu tenant dengan file di direktori kerja; mode multi-bot membuat satu
+    tenant per token dengan direktori datanya sendiri di TENANTS_DIR.
+    """
+
+    def __init__(self, name, token, config_path, db_path):
+        self.name = name
+        self.token = token
+        self.backend = create_state_backend(token, config_path)
+        self.config_store = ConfigStore(self.backend)
+        self.config_store.on_reload = self._config_reloaded
+        self.database = SQLiteDatabase(db_path)
+        # Pengguna dan riwayat pembukaan video ikut backend state; jurnal broadcast dan statistik tetap lokal
+        self.user_store = self.backend.user_store(self.database)
+        self.broadcast_ledger = BroadcastLedger(self.database)
+        self.membership_store = MembershipStore(self.database)
+        self.video_open_store = self.backend.video_open_store(self.database)
+        self.video_stats_store = VideoStatsStore(self.database)
+        self.membership_cache = TTLCache(MEMBERSHIP_CACHE_SIZE)
+        self.channel_breakers = {}
+        # Channel FSub tempat bot menjadi admin sehingga menerima update chat_member; indeksnya bisa dipercaya
+        self.tracked_channels = set()
+        self.fsub_reply = None
+        # (user_id, parameter) yang baru saja tertahan FSub; hanya di memori
+        self.fsub_blocked_links = TTLCache(CONVERSION_CACHE_SIZE)
+        self.flood_limiter = FloodLimiter()
+        self.broadcast_lock = asyncio.Lock()
+        # (chat_id, media_group_id) -> message_id pesan album kiriman admin
+        self.media_groups = TTLCache(MEDIA_GROUP_CACHE_SIZE)
+        # user_id admin -> ID channel dari pesan yang baru diteruskan admin tersebut
+        self.forwarded_channels = TTLCache(FORWARDED_CHANNEL_CACHE_SIZE)
+
+    @classmethod
+    def from_token(cls, token, base_dir=TENANTS_DIR):
+        """Tenant untuk mode multi-bot; datanya disimpan di <base_dir>/<id bot>/."""
+        name = token.split(":", 1)[0]
+        directory = os.path.join(base_dir, name)
+        os.makedirs(directory, exist_ok=True)
+        return cls(name, token, os.path.join(directory, CONFIG_FILE), os.path.join(directory, USERS_DB_FILE))
+
+    def _config_reloaded(self):
+        self.fsub_reply = None
+
+    async def start(self):
+        """Membuka penyimpanan dan menjalankan penulis latar belakang milik bot ini."""
+        await self.backend.start()
+        await self.config_store.start()
+        await self.user_store.start()
+        # Migrasi satu kali dari daftar user_ids lama di bot_config.json
+        if "user_ids" in self.config_store.data:
+            await self.user_store.migrate_from_config(self.config_store.data)
+            self.config_store.mark_dirty()
+        await self.membership_store.start()
+        await self.video_open_store.start()
+        await self.video_stats_store.start()
+        self.broadcast_ledger.open()
+
+    async def stop(self):
+        """Menulis semua perubahan yang tertunda."""
+        await self.membership_store.stop()
+        await self.video_open_store.stop()
+        await self.video_stats_store.stop()
+        await self.user_store.stop()
+        await self.config_store.stop()
+        await self.backend.stop()
+
+def create_state_backend(token, config_path):
+    """Backend state sesuai STATE_BACKEND; data Redis tiap bot dipisah dengan awalan <REDIS_PREFIX>:<id bot>."""
+    if STATE_BACKEND == "redis":
+        namespace = f"{REDIS_PREFIX}:{token.split(':', 1)[0]}"
+        return RedisBackend(REDIS_URL, namespace, seed_path=config_path, sync_interval=STATE_SYNC_INTERVAL)
+    return FileBackend(config_path)
+
+def tenant_labels():
+    """Label metrik untuk bot yang sedang berjalan (hanya dipakai di mode multi-bot)."""
+    state = current_tenant.get(None)
+    return {"bot": state.name} if state else {}
+
+if BOT_TOKENS:
+    metrics.context_labels = tenant_labels
+    log_pipeline.context_fields = tenant_labels
+else:
+    # Mode satu bot: tenant default berlaku untuk seluruh proses
+    current_tenant.set(Tenant("default", BOT_TOKEN, CONFIG_FILE, os.getenv("USERS_DB_FILE", USERS_DB_FILE)))
+
+class SharedRequest(BaseRequest):
+    """Kolam koneksi HTTP yang dipakai bersama oleh beberapa bot; dibuka sekali dan ditutup oleh bot terakhir."""
+
+    def __init__(self, request: BaseRequest):
+        self._request = request
+        self._users = 0
+
+    @property
+    def read_timeout(self):
+        return self._request.read_timeout
+
+    async def initialize(self):
+        if not self._users:
+            await self._request.initialize()
+        self._users += 1
+
+    async def shutdown(self):
+        self._users -= 1
+        if not self._users:
+            await self._request.shutdown()
+
+    async def do_request(self, url, method, request_data=None, read_timeout=BaseRequest.DEFAULT_NONE,
+                         write_timeout=BaseRequest.DEFAULT_NONE, connect_timeout=BaseRequest.DEFAULT_NONE,
+                         pool_timeout=BaseRequest.DEFAULT_NONE):
+        return await self._request.do_request(
+            url, method, request_data,
+            read_timeout=read_timeout, write_timeout=write_timeout,
+            connect_timeout=connect_timeout, pool_timeout=pool_timeout
+        )
+
 # --- Fungsi Utama ---
-def main():
-    """Memulai bot."""
-    application = Application.builder().token(BOT_TOKEN).build()
+async def on_startup(application: Application):
+    """Dijalankan sekali setelah bot diinisialisasi."""
+    await tenant().start()
+    # Di mode multi-bot, endpoint metrik dijalankan sekali oleh run_tenants()
+    if metrics_server and not BOT_TOKENS:
+        await metrics_server.start()
+    await refresh_tracked_channels(application.bot)
+    await resume_broadcast(application)
+    if REPLICA_COUNT > 1:
+        application.bot_data["broadcast_follower"] = asyncio.create_task(follow_broadcasts(application))
+
+async def on_stop(application: Application):
+    """Dijalankan saat bot berhenti menerima update; menghentikan broadcast yang masih berjalan."""
+    follower = application.bot_data.pop("broadcast_follower", None)
+    if follower:
+        follower.cancel()
+        await asyncio.gather(follower, return_exceptions=True)
+    job = application.bot_data.get("broadcast_job")
+    if job and job.task and not job.task.done():
+        # Broadcast tetap berstatus 'running' di jurnal dan dilanjutkan saat bot hidup lagi
+        job.interrupt()
+        await asyncio.gather(job.task, return_exceptions=True)
+
+async def on_shutdown(application: Application):
+    """Dijalankan saat bot berhenti; memastikan semua perubahan tersimpan."""
+    if metrics_server and not BOT_TOKENS:
+        await metrics_server.stop()
+    await tenant().stop()
+
+def build_application(token, request=None, get_updates_request=None):
+    """Membangun Application beserta semua handler-nya."""
+    builder = (
+        Application.builder()
+        .token(token)
+        .post_init(on_startup)
+        .post_stop(on_stop)
+        .post_shutdown(on_shutdown)
+        .rate_limiter(OutboundScheduler())
+        .concurrent_updates(OrderedUpdateProcessor())
+    )
+    if request is not None:
+        builder = builder.request(request)
+    else:
+        # Kolam koneksi HTTP dibagi ke jalur interactive dan bulk oleh OutboundScheduler
+        builder = builder.connection_pool_size(INTERACTIVE_POOL_SIZE + BULK_POOL_SIZE)
+    if get_updates_request is not None:
+        builder = builder.get_updates_request(get_updates_request)
+    application = builder.build()
     
     # Menambahkan semua handler perintah
+    # Grup -1 dijalankan sebelum semua handler lain
+    application.add_handler(TypeHandler(Update, flood_guard), group=-1)
     application.add_handler(CommandHandler("setup", setup_command))
     application.add_handler(CommandHandler("start", start_command))
     
@@ -570,11 +2716,100 @@ def main():
     application.add_handler(CommandHandler("setwelcome", set_welcome_message_handler))
     application.add_handler(CommandHandler("getprofil", set_profile_photo_handler))
     application.add_handler(CommandHandler("addvideo", add_video_handler))
+    application.add_handler(CommandHandler("addbundle", add_bundle_handler))
+    application.add_handler(CommandHandler("delbundle", del_bundle_handler))
     application.add_handler(CommandHandler("broadcast", broadcast_command))
+    application.add_handler(CommandHandler("cancelbroadcast", cancel_broadcast_command))
+    application.add_handler(CommandHandler("retrybroadcast", retry_broadcast_command))
+    application.add_handler(CommandHandler("delbroadcast", delete_broadcast_command))
+    application.add_handler(CommandHandler("editbroadcast", edit_broadcast_command))
     application.add_handler(CommandHandler("addbutton", add_button_handler))
+    application.add_handler(CommandHandler("stats", stats_command))
+    application.add_handler(CommandHandler("topvideos", top_videos_handler))
+    application.add_handler(CommandHandler("profile", profile_command))
+    application.add_handler(CommandHandler("exportusers", export_users_command))
+    application.add_handler(CommandHandler("importusers", import_users_command))
+
+    # Album kiriman admin dicatat di grup terpisah agar tidak menghalangi handler lain
+    application.add_handler(MessageHandler(filters.ChatType.PRIVATE & filters.ATTACHMENT, remember_media_group), group=1)
+    application.add_handler(MessageHandler(filters.ChatType.PRIVATE & filters.FORWARDED, remember_forwarded_channel), group=2)
+
+    # Pelacakan keanggotaan channel FSub (bot harus menjadi admin di channel)
+    application.add_handler(ChatMemberHandler(track_chat_member, ChatMemberHandler.CHAT_MEMBER))
+    application.add_handler(ChatMemberHandler(track_my_chat_member, ChatMemberHandler.MY_CHAT_MEMBER))
+
+    instrument_handlers(application)
+    return application
+
+async def run_tenant(state: Tenant, request, get_updates_request, stop_event: asyncio.Event):
+    """Menjalankan satu bot (polling) di dalam konteks tenant-nya sampai stop_event di-set."""
+    # Task ini punya salinan konteks sendiri; semua task turunannya ikut memakai tenant ini
+    current_tenant.set(state)
+    application = build_application(state.token, request=request, get_updates_request=get_updates_request)
+    try:
+        await application.initialize()
+        await on_startup(application)
+        await application.updater.start_polling(poll_interval=1, allowed_updates=Update.ALL_TYPES)
+        await application.start()
+        logging.info(f"🚀 Bot @{application.bot.username} berjalan (tenant {state.name}).")
+        await stop_event.wait()
+        await application.updater.stop()
+        await application.stop()
+        await on_stop(application)
+    finally:
+        await application.shutdown()
+        await on_shutdown(application)
+
+async def run_tenants(tokens):
+    """Mode multi-bot: semua token berjalan di satu event loop dengan kolam koneksi HTTP bersama."""
+    request = SharedRequest(HTTPXRequest(connection_pool_size=TENANT_POOL_SIZE))
+    # Setiap bot menahan satu koneksi untuk long polling getUpdates
+    get_updates_request = SharedRequest(HTTPXRequest(connection_pool_size=len(tokens) + 1))
+    stop_event = asyncio.Event()
+    loop = asyncio.get_running_loop()
+    for sig in (signal.SIGINT, signal.SIGTERM):
+        loop.add_signal_handler(sig, stop_event.set)
+
+    if metrics_server:
+        await metrics_server.start()
+    try:
+        tenants = [Tenant.from_token(token) for token in tokens]
+        results = await asyncio.gather(
+            *(run_tenant(state, request, get_updates_request, stop_event) for state in tenants),
+            return_exceptions=True
+        )
+        for state, result in zip(tenants, results):
+            if isinstance(result, Exception):
+                logging.error(f"Bot tenant {state.name} berhenti dengan error: {result!r}")
+    finally:
+        if metrics_server:
+            await metrics_server.stop()
+
+def main():
+    """Memulai bot."""
+    if BOT_TOKENS:
+        logging.info(f"🚀 Menjalankan {len(BOT_TOKENS)} bot dalam satu proses...")
+        asyncio.run(run_tenants(BOT_TOKENS))
+        return
+
+    application = build_application(BOT_TOKEN)
     
-    logging.info("🚀 Bot sedang berjalan...")
-    application.run_polling(poll_interval=1)
+    if RUN_MODE == "webhook":
+        webhook_url = f"{WEBHOOK_URL}/{WEBHOOK_PATH}" if WEBHOOK_PATH else WEBHOOK_URL
+        logging.info(f"🚀 Bot sedang berjalan (webhook di {WEBHOOK_LISTEN}:{WEBHOOK_PORT}/{WEBHOOK_PATH})...")
+        application.run_webhook(
+            listen=WEBHOOK_LISTEN,
+            port=WEBHOOK_PORT,
+            url_path=WEBHOOK_PATH,
+            webhook_url=webhook_url,
+            secret_token=WEBHOOK_SECRET,
+            max_connections=WEBHOOK_MAX_CONNECTIONS,
+            allowed_updates=Update.ALL_TYPES
+        )
+    else:
+        logging.info("🚀 Bot sedang berjalan...")
+        # chat_member tidak dikirim Telegram kecuali diminta secara eksplisit
+        application.run_polling(poll_interval=1, allowed_updates=Update.ALL_TYPES)
 
 if __name__ == "__main__":
     main()
@@ -0,0 +1,225 @@
+# Copyright (c) 2025 @hacker.mbrebed
+# This script is licensed under the MIT License.
+# See the LICENSE file for details.
+import time
+import asyncio
+import logging
+from collections import defaultdict
+
+# --- Metrik In-Process (Counter, Gauge, Histogram) ---
+LATENCY_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+
+class Histogram:
+    """Histogram latensi dengan bucket tetap (format Prometheus)."""
+
+    __slots__ = ("buckets", "counts", "sum", "count")
+
+    def __init__(self, buckets=LATENCY_BUCKETS):
+        self.buckets = buckets
+        self.counts = [0] * (len(buckets) + 1)
+        self.sum = 0.0
+        self.count = 0
+
+    def observe(self, value):
+        self.sum += value
+        self.count += 1
+        for i, bound in enumerate(self.buckets):
+            if value <= bound:
+                self.counts[i] += 1
+                return
+        self.counts[-1] += 1
+
+    def quantile(self, q):
+        """Perkiraan kuantil dengan interpolasi linear di dalam bucket."""
+        if not self.count:
+            return 0.0
+        target = q * self.count
+        cumulative = 0
+        lower = 0.0
+        for i, bound in enumerate(self.buckets):
+            if cumulative + self.counts[i] >= target:
+                fraction = (target - cumulative) / self.counts[i] if self.counts[i] else 0
+                return lower + (bound - lower) * fraction
+            cumulative += self.counts[i]
+            lower = bound
+        return self.buckets[-1]
+
+class RateMeter:
+    """Menghitung kejadian per detik untuk 60 detik terakhir."""
+
+    def __init__(self, window=60):
+        self.window = window
+        self._slots = [0] * window
+        self._seconds = [0] * window
+
+    def mark(self, n=1):
+        now = int(time.monotonic())
+        index = now % self.window
+        if self._seconds[index] != now:
+            self._seconds[index] = now
+            self._slots[index] = 0
+        self._slots[index] += n
+
+    def per_second(self, seconds=10):
+        """Rata-rata per detik selama `seconds` detik terakhir (detik berjalan tidak dihitung)."""
+        now = int(time.monotonic())
+        total = sum(
+            self._slots[(now - i) % self.window]
+            for i in range(1, seconds + 1)
+            if self._seconds[(now - i) % self.window] == now - i
+        )
+        return total / seconds
+
+    def peak(self):
+        now = int(time.monotonic())
+        return max(
+            (self._slots[i] for i in range(self.window) if now - self._seconds[i] < self.window),
+            default=0
+        )
+
+def _labels_key(labels):
+    return tuple(sorted(labels.items()))
+
+def _escape_label(value):
+    return str(value).replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n")
+
+def _format_labels(key):
+    if not key:
+        return ""
+    return "{" + ",".join(f'{name}="{_escape_label(value)}"' for name, value in key) + "}"
+
+class Metrics:
+    """Registry metrik sederhana tanpa dependensi, bisa dirender ke format teks Prometheus."""
+
+    def __init__(self, prefix="botfsub"):
+        self.prefix = prefix
+        self.started_at = time.time()
+        self.counters = defaultdict(lambda: defaultdict(float))
+        self.gauges = defaultdict(dict)
+        self.histograms = defaultdict(dict)
+        self.rates = defaultdict(RateMeter)
+        self.help = {}
+        # Fungsi opsional yang mengembalikan label tambahan untuk setiap seri, misalnya {"bot": "123"}
+        self.context_labels = None
+
+    def _key(self, labels):
+        if self.context_labels:
+            labels = {**self.context_labels(), **labels}
+        return _labels_key(labels)
+
+    def _matches(self, key):
+        """True jika seri milik konteks yang sedang aktif (semua seri cocok bila tanpa context_labels)."""
+        if not self.context_labels:
+            return True
+        return set(self.context_labels().items()) <= set(key)
+
+    def inc(self, name, value=1, **labels):
+        self.counters[name][self._key(labels)] += value
+
+    def set_gauge(self, name, value, **labels):
+        self.gauges[name][self._key(labels)] = value
+
+    def gauge(self, name, **labels):
+        return self.gauges.get(name, {}).get(self._key(labels), 0)
+
+    def observe(self, name, value, **labels):
+        key = self._key(labels)
+        histogram = self.histograms[name].get(key)
+        if histogram is None:
+            histogram = self.histograms[name][key] = Histogram()
+        histogram.observe(value)
+
+    def rate(self, name):
+        """RateMeter untuk satu nama, terpisah per konteks (lihat context_labels)."""
+        return self.rates[(name, self._key({}))]
+
+    def histogram_series(self, name):
+        """Daftar (label, histogram) untuk satu nama metrik milik konteks yang sedang aktif."""
+        return [(dict(key), histogram) for key, histogram in sorted(self.histograms.get(name, {}).items()) if self._matches(key)]
+
+    def counter_series(self, name):
+        return [(dict(key), value) for key, value in sorted(self.counters.get(name, {}).items()) if self._matches(key)]
+
+    def describe(self, name, text):
+        self.help[name] = text
+
+    def render_prometheus(self):
+        """Mengembalikan semua metrik dalam format teks Prometheus (versi 0.0.4)."""
+        lines = []
+        for kind, family in (("counter", self.counters), ("gauge", self.gauges)):
+            for name, series in sorted(family.items()):
+                if not series:
+                    continue
+                full_name = f"{self.prefix}_{name}"
+                if name in self.help:
+                    lines.append(f"# HELP {full_name} {self.help[name]}")
+                lines.append(f"# TYPE {full_name} {kind}")
+                for key, value in sorted(series.items()):
+                    lines.append(f"{full_name}{_format_labels(key)} {value}")
+        for name, series in sorted(self.histograms.items()):
+            if not series:
+                continue
+            full_name = f"{self.prefix}_{name}"
+            if name in self.help:
+                lines.append(f"# HELP {full_name} {self.help[name]}")
+            lines.append(f"# TYPE {full_name} histogram")
+            for key, histogram in sorted(series.items()):
+                cumulative = 0
+                for bound, count in zip(histogram.buckets, histogram.counts):
+                    cumulative += count
+                    lines.append(f"{full_name}_bucket{_format_labels(key + (('le', bound),))} {cumulative}")
+                lines.append(f"{full_name}_bucket{_format_labels(key + (('le', '+Inf'),))} {histogram.count}")
+                lines.append(f"{full_name}_sum{_format_labels(key)} {histogram.sum}")
+                lines.append(f"{full_name}_count{_format_labels(key)} {histogram.count}")
+        lines.append(f"# TYPE {self.prefix}_uptime_seconds gauge")
+        lines.append(f"{self.prefix}_uptime_seconds {time.time() - self.started_at:.0f}")
+        return "\n".join(lines) + "\n"
+
+metrics = Metrics()
+
+# --- Endpoint Prometheus ---
+class MetricsServer:
+    """Server HTTP minimal yang melayani GET /metrics dalam format teks Prometheus."""
+
+    def __init__(self, registry: Metrics, host, port):
+        self.registry = registry
+        self.host = host
+        self.port = port
+        self._server = None
+
+    async def start(self):
+        self._server = await asyncio.start_server(self._handle, self.host, self.port)
+        logging.info(f"Endpoint metrik Prometheus aktif di http://{self.host}:{self.port}/metrics")
+
+    async def stop(self):
+        if self._server:
+            self._server.close()
+            await self._server.wait_closed()
+            self._server = None
+
+    async def _handle(self, reader, writer):
+        try:
+            request_line = await asyncio.wait_for(reader.readline(), timeout=5)
+            # Abaikan header permintaan
+            while True:
+                line = await asyncio.wait_for(reader.readline(), timeout=5)
+                if line in (b"\r\n", b"\n", b""):
+                    break
+            parts = request_line.decode("latin-1").split()
+            if len(parts) >= 2 and parts[0] == "GET" and parts[1].split("?")[0] in ("/metrics", "/"):
+                body = self.registry.render_prometheus().encode("utf-8")
+                status = "200 OK"
+                content_type = "text/plain; version=0.0.4; charset=utf-8"
+            else:
+                body = b"Not Found\n"
+                status = "404 Not Found"
+                content_type = "text/plain; charset=utf-8"
+            writer.write(
+                f"HTTP/1.1 {status}\r\nContent-Type: {content_type}\r\nContent-Length: {len(body)}\r\nConnection: close\r\n\r\n".encode("latin-1")
+                + body
+            )
+            await writer.drain()
+        except (asyncio.TimeoutError, ConnectionError):
+            pass
+        finally:
+            writer.close()
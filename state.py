@@ -0,0 +1,486 @@
+# Copyright (c) 2025 @hacker.mbrebed
+# This script is licensed under the MIT License.
+# See the LICENSE file for details.
+import os
+import json
+import time
+import asyncio
+from collections import defaultdict
+from urllib.parse import urlsplit, unquote
+
+from store import UserStore, VideoOpenStore, Segment, shard_of
+
+# --- Klien Redis Minimal (Protokol RESP) ---
+class RedisError(Exception):
+    """Balasan error dari server Redis."""
+
+
+def _encode_command(args):
+    parts = [b"*%d\r\n" % len(args)]
+    for arg in args:
+        data = arg if isinstance(arg, bytes) else str(arg).encode("utf-8")
+        parts.append(b"$%d\r\n%s\r\n" % (len(data), data))
+    return b"".join(parts)
+
+
+class RedisClient:
+    """Klien asyncio tanpa dependensi untuk server yang berbicara protokol Redis (Redis, Valkey, KeyDB, dll.).
+
+    Satu koneksi dipakai bergantian; beberapa perintah dikirim sekaligus lewat pipeline().
+    """
+
+    def __init__(self, url):
+        parsed = urlsplit(url)
+        self.host = parsed.hostname or "127.0.0.1"
+        self.port = parsed.port or 6379
+        self.password = unquote(parsed.password) if parsed.password else None
+        self.db = int(parsed.path.strip("/") or 0)
+        self.address = f"{self.host}:{self.port}/{self.db}"
+        self._reader = None
+        self._writer = None
+        self._lock = asyncio.Lock()
+
+    async def _connect(self):
+        self._reader, self._writer = await asyncio.open_connection(self.host, self.port)
+        setup = []
+        if self.password:
+            setup.append(("AUTH", self.password))
+        if self.db:
+            setup.append(("SELECT", self.db))
+        for reply in await self._roundtrip(setup):
+            if isinstance(reply, RedisError):
+                raise reply
+
+    def _drop(self):
+        if self._writer is not None:
+            self._writer.close()
+        self._reader = self._writer = None
+
+    async def close(self):
+        async with self._lock:
+            self._drop()
+
+    async def _read_reply(self):
+        line = await self._reader.readline()
+        if not line.endswith(b"\r\n"):
+            raise ConnectionError("Koneksi ke server Redis terputus")
+        prefix, rest = line[:1], line[1:-2]
+        if prefix == b"+":
+            return rest.decode("utf-8")
+        if prefix == b"-":
+            # Dikembalikan, bukan dilempar, agar sisa balasan pipeline tetap terbaca
+            return RedisError(rest.decode("utf-8"))
+        if prefix == b":":
+            return int(rest)
+        if prefix == b"$":
+            length = int(rest)
+            if length < 0:
+                return None
+            return (await self._reader.readexactly(length + 2))[:-2].decode("utf-8")
+        if prefix == b"*":
+            length = int(rest)
+            if length < 0:
+                return None
+            return [await self._read_reply() for _ in range(length)]
+        raise ConnectionError(f"Balasan Redis tidak dikenal: {line!r}")
+
+    async def _roundtrip(self, commands):
+        if not commands:
+            return []
+        self._writer.write(b"".join(_encode_command(command) for command in commands))
+        await self._writer.drain()
+        return [await self._read_reply() for _ in commands]
+
+    async def pipeline(self, commands):
+        """Mengirim banyak perintah dalam satu perjalanan jaringan; mengembalikan daftar balasan."""
+        async with self._lock:
+            for attempt in range(2):
+                try:
+                    if self._writer is None:
+                        await self._connect()
+                    replies = await self._roundtrip(commands)
+                    break
+                except (OSError, EOFError):
+                    # Koneksi putus (misalnya server restart): sambung ulang dan coba sekali lagi
+                    self._drop()
+                    if attempt:
+                        raise
+                except BaseException:
+                    # Misalnya task dibatalkan di tengah perjalanan: balasan yang belum terbaca akan
+                    # tertukar dengan perintah berikutnya, jadi koneksinya harus dibuang
+                    self._drop()
+                    raise
+        for reply in replies:
+            if isinstance(reply, RedisError):
+                raise reply
+        return replies
+
+    async def execute(self, *args):
+        return (await self.pipeline([args]))[0]
+
+    async def transaction(self, commands):
+        """Menjalankan perintah secara atomik (MULTI/EXEC); mengembalikan daftar hasilnya."""
+        results = (await self.pipeline([("MULTI",), *commands, ("EXEC",)]))[-1]
+        if results is None:
+            raise RedisError("Transaksi Redis dibatalkan")
+        for result in results:
+            if isinstance(result, RedisError):
+                raise result
+        return results
+
+
+# --- Backend State: File Lokal ---
+class FileBackend:
+    """Perilaku bawaan: konfigurasi di bot_config.json dan pengguna di SQLite lokal (satu replika saja)."""
+
+    shared = False
+    # Tidak ada replika lain yang perlu diikuti perubahannya
+    sync_interval = None
+
+    def __init__(self, path):
+        self.path = path
+        self.location = path
+
+    def initial_config(self):
+        """Membaca konfigurasi dari disk satu kali saat bot dijalankan."""
+        try:
+            with open(self.path, "r") as f:
+                return json.load(f)
+        except (FileNotFoundError, json.JSONDecodeError):
+            return {}
+
+    async def start(self):
+        pass
+
+    async def stop(self):
+        pass
+
+    async def load_config(self):
+        # Sudah dibaca oleh initial_config()
+        return None
+
+    async def fetch_config(self, local):
+        return None
+
+    async def save_config(self, data):
+        text = json.dumps(data, indent=4)
+        await asyncio.to_thread(self._write_atomic, text)
+
+    def _write_atomic(self, text):
+        """Menulis ke file sementara lalu mengganti file lama, agar file tidak pernah setengah tertulis."""
+        tmp_path = f"{self.path}.tmp"
+        with open(tmp_path, "w") as f:
+            f.write(text)
+            f.flush()
+            os.fsync(f.fileno())
+        os.replace(tmp_path, self.path)
+
+    def user_store(self, db):
+        return UserStore(db)
+
+    def video_open_store(self, db):
+        return VideoOpenStore(db)
+
+    async def announce(self, message):
+        pass
+
+    async def poll_announcements(self):
+        return []
+
+
+# --- Backend State: Redis (Dibagi Antar Replika) ---
+class RedisBackend:
+    """Konfigurasi, daftar pengguna dan pengumuman broadcast disimpan di Redis agar bisa dipakai banyak replika.
+
+    Konfigurasi disimpan sebagai hash per kunci tingkat atas (nilai JSON) beserta nomor versi. Replika
+    hanya menulis kunci yang ia ubah, sehingga perubahan replika lain pada kunci berbeda tidak tertimpa;
+    perubahan dari replika lain dimuat ulang saat nomor versinya berubah.
+    """
+
+    shared = True
+    # Jumlah pengumuman broadcast terakhir yang disimpan; yang lebih lama dibuang dari Redis
+    ANNOUNCEMENT_KEEP = 100
+
+    def __init__(self, url, namespace, seed_path=None, sync_interval=5.0):
+        self.client = RedisClient(url)
+        self.namespace = namespace
+        self.location = f"redis://{self.client.address} ({namespace})"
+        # bot_config.json lama dipakai sebagai isi awal jika Redis belum punya konfigurasi
+        self.seed_path = seed_path
+        self.sync_interval = sync_interval
+        self._synced = {}
+        self._version = None
+        # Jumlah pengumuman (sepanjang masa) yang sudah dilihat replika ini
+        self._announcements_seen = 0
+
+    def key(self, *parts):
+        return ":".join((self.namespace, *parts))
+
+    def initial_config(self):
+        return FileBackend(self.seed_path).initial_config() if self.seed_path else {}
+
+    async def start(self):
+        # Pengumuman yang dibuat sebelum replika ini hidup tidak diproses ulang
+        self._announcements_seen = int(await self.client.execute("GET", self.key("broadcasts", "total")) or 0)
+
+    async def stop(self):
+        await self.client.close()
+
+    async def load_config(self):
+        """Membaca seluruh konfigurasi bersama; None jika Redis belum punya konfigurasi."""
+        version, fields = await self.client.pipeline([
+            ("GET", self.key("config", "version")),
+            ("HGETALL", self.key("config")),
+        ])
+        self._version = int(version or 0)
+        self._synced = dict(zip(fields[::2], fields[1::2]))
+        if not self._synced:
+            return None
+        return {key: json.loads(value) for key, value in self._synced.items()}
+
+    async def fetch_config(self, local):
+        """Konfigurasi terbaru jika replika lain mengubahnya sejak sinkronisasi terakhir; selain itu None.
+
+        Kunci di `local` yang berbeda dari sinkronisasi terakhir (perubahan lokal yang belum tersimpan)
+        dipertahankan, sehingga penulisan berikutnya hanya membawa kunci tersebut.
+        """
+        version = int(await self.client.execute("GET", self.key("config", "version")) or 0)
+        if version == self._version:
+            return None
+        previous = self._synced
+        remote = await self.load_config()
+        if remote is None:
+            # Hash konfigurasi hilang (misalnya Redis dikosongkan): isi ulang dari salinan lokal,
+            # jangan dianggap kosong karena semua kunci (termasuk admin_ids) akan kembali ke default
+            return await self.seed_config(local)
+        for key, value in local.items():
+            if json.dumps(value) != previous.get(key):
+                remote[key] = value
+        return remote
+
+    async def seed_config(self, data):
+        """Mengisi konfigurasi awal tanpa menimpa kunci yang sudah ditulis replika lain; mengembalikan isi terbaru."""
+        commands = [("HSETNX", self.key("config"), key, json.dumps(value)) for key, value in data.items()]
+        commands.append(("INCR", self.key("config", "version")))
+        await self.client.pipeline(commands)
+        return await self.load_config()
+
+    async def save_config(self, data):
+        """Menulis hanya kunci tingkat atas yang berubah sejak sinkronisasi terakhir."""
+        encoded = {key: json.dumps(value) for key, value in data.items()}
+        changed = [item for pair in encoded.items() if self._synced.get(pair[0]) != pair[1] for item in pair]
+        removed = [key for key in self._synced if key not in encoded]
+        if not changed and not removed:
+            return
+        commands = []
+        if changed:
+            commands.append(("HSET", self.key("config"), *changed))
+        if removed:
+            commands.append(("HDEL", self.key("config"), *removed))
+        commands.append(("INCR", self.key("config", "version")))
+        version = (await self.client.pipeline(commands))[-1]
+        self._synced = encoded
+        # Versi melompat berarti replika lain juga menulis; muat ulang pada sinkronisasi berikutnya
+        self._version = version if self._version is not None and version == self._version + 1 else None
+
+    def user_store(self, db):
+        return RedisUserStore(self)
+
+    def video_open_store(self, db):
+        return RedisVideoOpenStore(self)
+
+    async def announce(self, message):
+        """Mengumumkan kejadian broadcast (mulai/batal) ke semua replika."""
+        # Daftar dipangkas ke ANNOUNCEMENT_KEEP terakhir; penghitung total menjaga posisi tiap replika
+        await self.client.transaction([
+            ("RPUSH", self.key("broadcasts"), json.dumps(message)),
+            ("LTRIM", self.key("broadcasts"), -self.ANNOUNCEMENT_KEEP, -1),
+            ("INCR", self.key("broadcasts", "total")),
+        ])
+
+    async def poll_announcements(self):
+        """Pengumuman baru sejak pemanggilan terakhir."""
+        total = int(await self.client.execute("GET", self.key("broadcasts", "total")) or 0)
+        if total <= self._announcements_seen:
+            # Lebih kecil berarti data Redis dihapus; mulai menghitung lagi dari posisi sekarang
+            self._announcements_seen = total
+            return []
+        items, total = await self.client.transaction([
+            ("LRANGE", self.key("broadcasts"), 0, -1),
+            ("GET", self.key("broadcasts", "total")),
+        ])
+        total = int(total or 0)
+        # items[i] adalah pengumuman ke-(total - len(items) + i); yang terlewat karena dipangkas hilang
+        new_items = items[max(0, self._announcements_seen - (total - len(items))):]
+        self._announcements_seen = total
+        return [json.loads(item) for item in new_items]
+
+
+class RedisUserStore(UserStore):
+    """Daftar pengguna bersama di Redis dengan antarmuka yang sama seperti UserStore (SQLite).
+
+    Sorted set `users` (skor = user_id) dipakai untuk keyset pagination; last_seen, first_seen dan
+    status langganan disimpan di hash terpisah, pengguna yang memblokir bot di sebuah set.
+    """
+
+    write_errors = (RedisError, OSError)
+
+    def __init__(self, backend: RedisBackend, flush_interval=2.0, batch_size=500):
+        super().__init__(None, flush_interval, batch_size)
+        self.backend = backend
+        self.client = backend.client
+        self.users_key = backend.key("users")
+        self.first_seen_key = backend.key("users", "first_seen")
+        self.last_seen_key = backend.key("users", "last_seen")
+        self.subscribed_key = backend.key("users", "subscribed")
+        self.blocked_key = backend.key("users", "blocked")
+
+    @property
+    def location(self):
+        return self.backend.location
+
+    def open(self):
+        pass
+
+    async def _write(self, pending):
+        members = [item for user_id in pending for item in (user_id, user_id)]
+        commands = [
+            ("ZADD", self.users_key, *members),
+            ("HSET", self.last_seen_key, *(item for user_id, (seen, _) in pending.items() for item in (user_id, seen))),
+            ("SREM", self.blocked_key, *pending),
+        ]
+        commands += [("HSETNX", self.first_seen_key, user_id, seen) for user_id, (seen, _) in pending.items()]
+        subscribed = [item for user_id, (_, value) in pending.items() if value is not None for item in (user_id, int(value))]
+        if subscribed:
+            commands.append(("HSET", self.subscribed_key, *subscribed))
+        await self.client.pipeline(commands)
+
+    async def add_many(self, user_ids, seen=None):
+        seen = seen or int(time.time())
+        user_ids = [int(user_id) for user_id in user_ids]
+        for i in range(0, len(user_ids), 10000):
+            chunk = user_ids[i:i + 10000]
+            commands = [("ZADD", self.users_key, "NX", *(item for user_id in chunk for item in (user_id, user_id)))]
+            for user_id in chunk:
+                commands.append(("HSETNX", self.first_seen_key, user_id, seen))
+                commands.append(("HSETNX", self.last_seen_key, user_id, seen))
+            await self.client.pipeline(commands)
+        return len(user_ids)
+
+    async def mark_blocked(self, user_ids):
+        user_ids = [int(user_id) for user_id in user_ids]
+        if user_ids:
+            await self.client.execute("SADD", self.blocked_key, *user_ids)
+
+    async def count(self, include_blocked=False, segment=None):
+        if include_blocked:
+            return await self.client.execute("ZCARD", self.users_key)
+        if segment is None or segment.is_everyone:
+            total, blocked = await self.client.pipeline([("ZCARD", self.users_key), ("SCARD", self.blocked_key)])
+            return total - blocked
+        return sum([len(batch) async for batch in self.iter_user_ids(segment=segment)])
+
+    async def iter_user_ids(self, batch_size=1000, segment=None):
+        """Mengalirkan user_id aktif (dan cocok dengan segmen) per batch lewat keyset pagination."""
+        segment = segment or Segment()
+        min_last_seen = segment.min_last_seen() if segment.active_days is not None else None
+        lower = "-inf"
+        while True:
+            user_ids = await self.client.execute("ZRANGEBYSCORE", self.users_key, lower, "+inf", "LIMIT", 0, batch_size)
+            if not user_ids:
+                return
+            lower = f"({user_ids[-1]}"
+            commands = [("SMISMEMBER", self.blocked_key, *user_ids)]
+            if min_last_seen is not None:
+                commands.append(("HMGET", self.last_seen_key, *user_ids))
+            if segment.subscribed is not None:
+                commands.append(("HMGET", self.subscribed_key, *user_ids))
+            if segment.video is not None:
+                commands.append(("SMISMEMBER", self.backend.key("opens", segment.video), *user_ids))
+            replies = iter(await self.client.pipeline(commands))
+            keep = [not blocked for blocked in next(replies)]
+            if min_last_seen is not None:
+                keep = [k and int(seen or 0) >= min_last_seen for k, seen in zip(keep, next(replies))]
+            if segment.subscribed is not None:
+                wanted = str(int(segment.subscribed))
+                keep = [k and value == wanted for k, value in zip(keep, next(replies))]
+            if segment.video is not None:
+                keep = [k and bool(opened) for k, opened in zip(keep, next(replies))]
+            batch = [int(user_id) for user_id, k in zip(user_ids, keep) if k]
+            if segment.shard is not None:
+                index, count = segment.shard
+                batch = [user_id for user_id in batch if shard_of(user_id, count) == index]
+            if batch:
+                yield batch
+
+    async def iter_rows(self, batch_size=5000):
+        lower = "-inf"
+        while True:
+            user_ids = await self.client.execute("ZRANGEBYSCORE", self.users_key, lower, "+inf", "LIMIT", 0, batch_size)
+            if not user_ids:
+                return
+            lower = f"({user_ids[-1]}"
+            first_seen, last_seen, blocked = await self.client.pipeline([
+                ("HMGET", self.first_seen_key, *user_ids),
+                ("HMGET", self.last_seen_key, *user_ids),
+                ("SMISMEMBER", self.blocked_key, *user_ids),
+            ])
+            yield [
+                (int(user_id), int(first or 0), int(last or 0), int(is_blocked))
+                for user_id, first, last, is_blocked in zip(user_ids, first_seen, last_seen, blocked)
+            ]
+
+    async def import_rows(self, rows):
+        """Sama seperti UserStore.import_rows; penggabungan dihitung dari data yang sudah ada di Redis.
+
+        `rows` tidak boleh berisi user_id ganda (lihat UserCsvReader).
+        """
+        if not rows:
+            return
+        user_ids = [row[0] for row in rows]
+        current_first, current_last = await self.client.pipeline([
+            ("HMGET", self.first_seen_key, *user_ids),
+            ("HMGET", self.last_seen_key, *user_ids),
+        ])
+        first_seen, last_seen, blocked, unblocked = [], [], [], []
+        for (user_id, first, last, is_blocked), old_first, old_last in zip(rows, current_first, current_last):
+            first_seen += (user_id, min(first, int(old_first)) if old_first is not None else first)
+            last_seen += (user_id, max(last, int(old_last)) if old_last is not None else last)
+            if old_last is None or last > int(old_last):
+                (blocked if is_blocked else unblocked).append(user_id)
+        commands = [
+            ("ZADD", self.users_key, *(item for user_id in user_ids for item in (user_id, user_id))),
+            ("HSET", self.first_seen_key, *first_seen),
+            ("HSET", self.last_seen_key, *last_seen),
+        ]
+        if blocked:
+            commands.append(("SADD", self.blocked_key, *blocked))
+        if unblocked:
+            commands.append(("SREM", self.blocked_key, *unblocked))
+        await self.client.pipeline(commands)
+
+
+class RedisVideoOpenStore(VideoOpenStore):
+    """Pembuka parameter video disimpan sebagai set per parameter, untuk segmen broadcast video=<parameter>."""
+
+    write_errors = (RedisError, OSError)
+
+    def __init__(self, backend: RedisBackend, flush_interval=2.0, batch_size=500):
+        super().__init__(None, flush_interval, batch_size)
+        self.backend = backend
+        self.client = backend.client
+
+    @property
+    def location(self):
+        return self.backend.location
+
+    def open(self):
+        pass
+
+    async def _write(self, pending):
+        by_parameter = defaultdict(list)
+        for parameter, user_id in pending:
+            by_parameter[parameter].append(user_id)
+        await self.client.pipeline([
+            ("SADD", self.backend.key("opens", parameter), *user_ids) for parameter, user_ids in by_parameter.items()
+        ])
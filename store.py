@@ -0,0 +1,613 @@
+# Copyright (c) 2025 @hacker.mbrebed
+# This script is licensed under the MIT License.
+# See the LICENSE file for details.
+import json
+import time
+import asyncio
+import sqlite3
+import logging
+import threading
+
+# --- Penyimpanan Pengguna (SQLite) ---
+USERS_DB_FILE = "bot_users.db"
+
+class SQLiteDatabase:
+    """Koneksi SQLite tunggal yang dipakai bersama; semua query dijalankan di thread terpisah."""
+
+    def __init__(self, path):
+        self.path = path
+        self._conn = None
+        self._lock = threading.Lock()
+
+    def open(self):
+        if self._conn is not None:
+            return
+        self._conn = sqlite3.connect(self.path, check_same_thread=False, isolation_level=None)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute("PRAGMA synchronous=NORMAL")
+
+    def close(self):
+        if self._conn is not None:
+            self._conn.close()
+            self._conn = None
+
+    def execute_sync(self, sql, params=()):
+        with self._lock:
+            return self._conn.execute(sql, params).fetchall()
+
+    def executemany_sync(self, sql, rows):
+        """Menjalankan banyak baris dalam satu transaksi."""
+        with self._lock:
+            with self._conn:
+                self._conn.execute("BEGIN")
+                self._conn.executemany(sql, rows)
+
+    def executescript_sync(self, script):
+        with self._lock:
+            self._conn.executescript(script)
+
+    def run_sync(self, fn, *args):
+        """Menjalankan fungsi `fn(conn, *args)` di dalam satu transaksi."""
+        with self._lock:
+            with self._conn:
+                self._conn.execute("BEGIN")
+                return fn(self._conn, *args)
+
+    async def run(self, fn, *args):
+        return await asyncio.to_thread(self.run_sync, fn, *args)
+
+    async def execute(self, sql, params=()):
+        return await asyncio.to_thread(self.execute_sync, sql, params)
+
+    async def executemany(self, sql, rows):
+        await asyncio.to_thread(self.executemany_sync, sql, rows)
+
+
+class BufferedStore:
+    """Dasar untuk tabel yang ditulis secara batch: perubahan dikumpulkan di memori lalu di-flush berkala."""
+
+    SCHEMA = ""
+    # Kesalahan penulisan yang membuat data dikembalikan ke buffer untuk dicoba lagi
+    write_errors = (sqlite3.Error,)
+
+    def __init__(self, db: SQLiteDatabase, flush_interval=2.0, batch_size=500):
+        self.db = db
+        self.flush_interval = flush_interval
+        self.batch_size = batch_size
+        self._pending = {}
+        self._wakeup = None
+        self._flusher_task = None
+
+    @property
+    def location(self):
+        return self.db.path
+
+    def open(self):
+        self.db.open()
+        self.db.executescript_sync(self.SCHEMA)
+
+    def _put(self, key, value):
+        self._pending[key] = value
+        if len(self._pending) >= self.batch_size and self._wakeup is not None:
+            self._wakeup.set()
+
+    async def start(self):
+        """Membuka database dan menjalankan flusher latar belakang."""
+        self.open()
+        self._wakeup = asyncio.Event()
+        self._flusher_task = asyncio.create_task(self._flusher_loop())
+
+    async def stop(self):
+        """Menghentikan flusher dan menulis sisa data yang tertunda."""
+        if self._flusher_task:
+            self._flusher_task.cancel()
+            try:
+                await self._flusher_task
+            except asyncio.CancelledError:
+                pass
+            self._flusher_task = None
+        await self.flush()
+
+    async def _flusher_loop(self):
+        while True:
+            try:
+                await asyncio.wait_for(self._wakeup.wait(), timeout=self.flush_interval)
+            except asyncio.TimeoutError:
+                pass
+            self._wakeup.clear()
+            await self.flush()
+
+    async def flush(self):
+        """Menulis semua perubahan yang tertunda dalam satu transaksi."""
+        if not self._pending:
+            return
+        pending, self._pending = self._pending, {}
+        try:
+            await self._write(pending)
+        except self.write_errors as e:
+            logging.error(f"Gagal menyimpan {len(pending)} baris ke {self.location}: {e}")
+            # Kembalikan data agar dicoba lagi pada flush berikutnya
+            self._restore(pending)
+
+    def _restore(self, pending):
+        """Menggabungkan data yang gagal ditulis; nilai yang lebih baru di buffer diutamakan."""
+        for key, value in pending.items():
+            self._pending.setdefault(key, value)
+
+    async def _write(self, pending):
+        raise NotImplementedError
+
+
+# Hash perkalian (langkah MINSTD) agar pembagian pengguna ke replika merata
+SHARD_MODULUS = 2147483647
+SHARD_MULTIPLIER = 48271
+
+def shard_of(user_id: int, count: int):
+    """Nomor shard (0..count-1) milik pengguna; sama di semua replika."""
+    return (user_id % SHARD_MODULUS) * SHARD_MULTIPLIER % SHARD_MODULUS % count
+
+
+class Segment:
+    """Filter penerima broadcast: aktif dalam N hari terakhir, status langganan FSub, pembuka parameter video,
+    dan shard (index, jumlah) untuk membagi broadcast ke beberapa replika.
+
+    Atribut bernilai None berarti tidak difilter. Shard hanya ada saat memakai penyimpanan bersama
+    (Redis), jadi tidak ikut diterjemahkan ke SQL oleh where().
+    """
+
+    def __init__(self, active_days=None, subscribed=None, video=None, shard=None):
+        self.active_days = active_days
+        self.subscribed = subscribed
+        self.video = video
+        self.shard = shard
+
+    @property
+    def is_everyone(self):
+        return self.active_days is None and self.subscribed is None and self.video is None and self.shard is None
+
+    def min_last_seen(self):
+        return int(time.time() - self.active_days * 86400)
+
+    def where(self):
+        """Mengembalikan (klausa WHERE, parameter) untuk tabel users."""
+        clauses = ["blocked = 0"]
+        params = []
+        if self.active_days is not None:
+            clauses.append("last_seen >= ?")
+            params.append(self.min_last_seen())
+        if self.subscribed is not None:
+            clauses.append("subscribed = ?")
+            params.append(int(self.subscribed))
+        if self.video is not None:
+            clauses.append("user_id IN (SELECT user_id FROM video_opens WHERE parameter = ?)")
+            params.append(self.video)
+        return " AND ".join(clauses), params
+
+
+class UserStore(BufferedStore):
+    """Daftar pengguna bot dengan indeks user_id, upsert O(1) dan penulisan secara batch."""
+
+    SCHEMA = """
+        CREATE TABLE IF NOT EXISTS users (
+            user_id INTEGER PRIMARY KEY,
+            first_seen INTEGER NOT NULL,
+            last_seen INTEGER NOT NULL,
+            blocked INTEGER NOT NULL DEFAULT 0,
+            subscribed INTEGER
+        );
+    """
+
+    UPSERT_SQL = """
+        INSERT INTO users (user_id, first_seen, last_seen, blocked, subscribed) VALUES (?, ?, ?, 0, ?)
+        ON CONFLICT(user_id) DO UPDATE SET
+            last_seen = excluded.last_seen,
+            blocked = 0,
+            subscribed = COALESCE(excluded.subscribed, users.subscribed)
+    """
+
+    IMPORT_SQL = """
+        INSERT INTO users (user_id, first_seen, last_seen, blocked) VALUES (?, ?, ?, ?)
+        ON CONFLICT(user_id) DO UPDATE SET
+            first_seen = MIN(users.first_seen, excluded.first_seen),
+            last_seen = MAX(users.last_seen, excluded.last_seen),
+            blocked = CASE WHEN excluded.last_seen > users.last_seen THEN excluded.blocked ELSE users.blocked END
+    """
+
+    # Kolom file ekspor/impor pengguna (/exportusers, /importusers)
+    EXPORT_COLUMNS = ("user_id", "first_seen", "last_seen", "blocked")
+
+    def open(self):
+        super().open()
+        # Database lama belum punya kolom subscribed
+        columns = {row[1] for row in self.db.execute_sync("PRAGMA table_info(users)")}
+        if "subscribed" not in columns:
+            self.db.execute_sync("ALTER TABLE users ADD COLUMN subscribed INTEGER")
+        self.db.execute_sync("CREATE INDEX IF NOT EXISTS users_last_seen ON users (last_seen)")
+
+    def touch(self, user_id: int, subscribed=None):
+        """Mencatat aktivitas (dan status langganan, jika diketahui) di memori; ditulis oleh flusher latar belakang."""
+        self._put(user_id, (int(time.time()), subscribed))
+
+    async def _write(self, pending):
+        rows = [
+            (user_id, seen, seen, None if subscribed is None else int(subscribed))
+            for user_id, (seen, subscribed) in pending.items()
+        ]
+        await self.db.executemany(self.UPSERT_SQL, rows)
+
+    async def add_many(self, user_ids, seen=None):
+        """Menambahkan banyak pengguna sekaligus tanpa mengubah data pengguna yang sudah ada."""
+        seen = seen or int(time.time())
+        rows = [(int(user_id), seen, seen) for user_id in user_ids]
+        for i in range(0, len(rows), 10000):
+            await self.db.executemany(
+                "INSERT OR IGNORE INTO users (user_id, first_seen, last_seen, blocked) VALUES (?, ?, ?, 0)",
+                rows[i:i + 10000]
+            )
+        return len(rows)
+
+    async def mark_blocked(self, user_ids):
+        """Menandai pengguna yang memblokir bot agar dilewati saat broadcast."""
+        rows = [(int(user_id),) for user_id in user_ids]
+        if rows:
+            await self.db.executemany("UPDATE users SET blocked = 1 WHERE user_id = ?", rows)
+
+    async def count(self, include_blocked=False, segment=None):
+        if include_blocked:
+            rows = await self.db.execute("SELECT COUNT(*) FROM users")
+        else:
+            where, params = (segment or Segment()).where()
+            rows = await self.db.execute(f"SELECT COUNT(*) FROM users WHERE {where}", params)
+        return rows[0][0]
+
+    async def iter_rows(self, batch_size=5000):
+        """Mengalirkan semua pengguna (termasuk yang memblokir) sebagai tuple EXPORT_COLUMNS per batch."""
+        last_id = -1
+        while True:
+            rows = await self.db.execute(
+                "SELECT user_id, first_seen, last_seen, blocked FROM users WHERE user_id > ? ORDER BY user_id LIMIT ?",
+                (last_id, batch_size)
+            )
+            if not rows:
+                return
+            yield rows
+            last_id = rows[-1][0]
+
+    async def import_rows(self, rows):
+        """Menggabungkan baris hasil ekspor (user_id, first_seen, last_seen, blocked) ke daftar pengguna.
+
+        Pengguna yang sudah ada tidak diduplikasi: first_seen diambil yang paling awal, last_seen yang
+        paling akhir, dan status blokir mengikuti data yang aktivitasnya lebih baru.
+        """
+        if rows:
+            await self.db.executemany(self.IMPORT_SQL, rows)
+
+    async def migrate_from_config(self, config):
+        """Memindahkan daftar user_ids lama dari bot_config.json ke database (sekali saja)."""
+        user_ids = config.get("user_ids")
+        if user_ids is None:
+            return 0
+        migrated = await self.add_many(user_ids)
+        del config["user_ids"]
+        logging.info(f"Migrasi {migrated} pengguna dari bot_config.json ke {self.location} selesai.")
+        return migrated
+
+
+# --- Jurnal Broadcast ---
+class BroadcastLedger:
+    """Jurnal status pengiriman per penerima, agar broadcast bisa dilanjutkan setelah bot mati."""
+
+    SCHEMA = """
+        CREATE TABLE IF NOT EXISTS broadcasts (
+            broadcast_id INTEGER PRIMARY KEY AUTOINCREMENT,
+            source TEXT NOT NULL,
+            status_chat_id INTEGER,
+            status_message_id INTEGER,
+            status TEXT NOT NULL DEFAULT 'running',
+            created_at INTEGER NOT NULL,
+            album TEXT
+        );
+        CREATE TABLE IF NOT EXISTS broadcast_recipients (
+            broadcast_id INTEGER NOT NULL,
+            user_id INTEGER NOT NULL,
+            status TEXT NOT NULL DEFAULT 'pending',
+            message_id INTEGER,
+            error TEXT,
+            message_ids TEXT,
+            PRIMARY KEY (broadcast_id, user_id)
+        ) WITHOUT ROWID;
+    """
+
+    # Status penerima
+    PENDING = "pending"
+    SENT = "sent"
+    BLOCKED = "blocked"
+    FAILED = "failed"
+    DELETED = "deleted"
+
+    def __init__(self, db: SQLiteDatabase, batch_size=100):
+        self.db = db
+        self.batch_size = batch_size
+        self._results = []
+
+    def open(self):
+        self.db.open()
+        self.db.executescript_sync(self.SCHEMA)
+        # Database lama belum punya kolom album dan message_ids
+        columns = {row[1] for row in self.db.execute_sync("PRAGMA table_info(broadcasts)")}
+        if "album" not in columns:
+            self.db.execute_sync("ALTER TABLE broadcasts ADD COLUMN album TEXT")
+        columns = {row[1] for row in self.db.execute_sync("PRAGMA table_info(broadcast_recipients)")}
+        if "message_ids" not in columns:
+            self.db.execute_sync("ALTER TABLE broadcast_recipients ADD COLUMN message_ids TEXT")
+
+    async def create(self, source, status_chat_id, status_message_id, segment=None, recipients=None, album=None):
+        """Membuat broadcast baru dan mengisi daftar penerima dari pengguna aktif; mengembalikan (id, total).
+
+        `recipients` adalah aliran batch user_id dari penyimpanan pengguna bersama (misalnya Redis);
+        jika None, penerima diambil langsung dari tabel users lokal. `album` berisi message_id semua
+        pesan album sumber (None untuk pesan tunggal).
+        """
+        album = json.dumps(album) if album else None
+        if recipients is not None:
+            return await self._create_from(source, status_chat_id, status_message_id, recipients, album)
+        where, params = (segment or Segment()).where()
+
+        def _create(conn):
+            cursor = conn.execute(
+                "INSERT INTO broadcasts (source, status_chat_id, status_message_id, created_at, album) VALUES (?, ?, ?, ?, ?)",
+                (source, status_chat_id, status_message_id, int(time.time()), album)
+            )
+            broadcast_id = cursor.lastrowid
+            cursor = conn.execute(
+                f"INSERT INTO broadcast_recipients (broadcast_id, user_id) SELECT ?, user_id FROM users WHERE {where}",
+                (broadcast_id, *params)
+            )
+            return broadcast_id, cursor.rowcount
+        return await self.db.run(_create)
+
+    async def _create_from(self, source, status_chat_id, status_message_id, recipients, album):
+        # Berstatus 'preparing' selama daftar penerima diisi, agar tidak dilanjutkan setengah jadi setelah crash
+        def _insert(conn):
+            return conn.execute(
+                "INSERT INTO broadcasts (source, status_chat_id, status_message_id, status, created_at, album) VALUES (?, ?, ?, 'preparing', ?, ?)",
+                (source, status_chat_id, status_message_id, int(time.time()), album)
+            ).lastrowid
+        broadcast_id = await self.db.run(_insert)
+        total = 0
+        async for batch in recipients:
+            await self.db.executemany(
+                "INSERT OR IGNORE INTO broadcast_recipients (broadcast_id, user_id) VALUES (?, ?)",
+                [(broadcast_id, user_id) for user_id in batch]
+            )
+            total += len(batch)
+        await self.set_status(broadcast_id, "running")
+        return broadcast_id, total
+
+    async def get(self, broadcast_id):
+        rows = await self.db.execute(
+            "SELECT broadcast_id, source, status_chat_id, status_message_id, status, created_at, album FROM broadcasts WHERE broadcast_id = ?",
+            (broadcast_id,)
+        )
+        if not rows:
+            return None
+        keys = ("broadcast_id", "source", "status_chat_id", "status_message_id", "status", "created_at", "album")
+        record = dict(zip(keys, rows[0]))
+        record["album"] = json.loads(record["album"]) if record["album"] else None
+        return record
+
+    async def latest_running(self):
+        rows = await self.db.execute("SELECT MAX(broadcast_id) FROM broadcasts WHERE status = 'running'")
+        return await self.get(rows[0][0]) if rows[0][0] is not None else None
+
+    async def set_status(self, broadcast_id, status):
+        await self.db.execute("UPDATE broadcasts SET status = ? WHERE broadcast_id = ?", (status, broadcast_id))
+
+    async def counts(self, broadcast_id):
+        """Jumlah penerima per status, misalnya {'sent': 10, 'pending': 5}."""
+        rows = await self.db.execute(
+            "SELECT status, COUNT(*) FROM broadcast_recipients WHERE broadcast_id = ? GROUP BY status",
+            (broadcast_id,)
+        )
+        return dict(rows)
+
+    def record(self, broadcast_id, user_id, status, message_id=None, error=None, message_ids=None):
+        """Mencatat hasil pengiriman di buffer; mengembalikan True jika buffer sudah perlu di-flush.
+
+        `message_ids` berisi semua message_id album yang terkirim ke pengguna (message_id = yang pertama).
+        """
+        message_ids = json.dumps(message_ids) if message_ids else None
+        self._results.append((status, message_id, message_ids, error, broadcast_id, user_id))
+        return len(self._results) >= self.batch_size
+
+    async def flush(self):
+        """Menulis hasil pengiriman yang tertunda dalam satu transaksi."""
+        if not self._results:
+            return
+        results, self._results = self._results, []
+        try:
+            await self.db.executemany(
+                "UPDATE broadcast_recipients SET status = ?, message_id = COALESCE(?, message_id), "
+                "message_ids = COALESCE(?, message_ids), error = ? "
+                "WHERE broadcast_id = ? AND user_id = ?",
+                results
+            )
+        except sqlite3.Error as e:
+            logging.error(f"Gagal menyimpan {len(results)} hasil broadcast ke jurnal: {e}")
+            self._results[:0] = results
+
+    async def reset_failed(self, broadcast_id):
+        """Mengembalikan penerima yang gagal ke status pending agar bisa dikirim ulang."""
+        def _reset(conn):
+            return conn.execute(
+                "UPDATE broadcast_recipients SET status = 'pending', error = NULL WHERE broadcast_id = ? AND status = 'failed'",
+                (broadcast_id,)
+            ).rowcount
+        return await self.db.run(_reset)
+
+    async def iter_recipients(self, broadcast_id, status, batch_size=500):
+        """Mengalirkan (user_id, message_id) dengan status tertentu per batch (keyset pagination).
+
+        Untuk album, message_id berupa daftar semua message_id yang tercatat saat dikirim.
+        """
+        last_id = None
+        while True:
+            if last_id is None:
+                rows = await self.db.execute(
+                    "SELECT user_id, message_id, message_ids FROM broadcast_recipients WHERE broadcast_id = ? AND status = ? "
+                    "ORDER BY user_id LIMIT ?",
+                    (broadcast_id, status, batch_size)
+                )
+            else:
+                rows = await self.db.execute(
+                    "SELECT user_id, message_id, message_ids FROM broadcast_recipients WHERE broadcast_id = ? AND status = ? "
+                    "AND user_id > ? ORDER BY user_id LIMIT ?",
+                    (broadcast_id, status, last_id, batch_size)
+                )
+            if not rows:
+                return
+            yield [(user_id, json.loads(message_ids) if message_ids else message_id) for user_id, message_id, message_ids in rows]
+            last_id = rows[-1][0]
+
+
+# --- Indeks Keanggotaan Channel FSub ---
+class MembershipStore(BufferedStore):
+    """Indeks lokal keanggotaan pengguna per channel FSub, diisi dari update chat_member."""
+
+    SCHEMA = """
+        CREATE TABLE IF NOT EXISTS memberships (
+            user_id INTEGER NOT NULL,
+            channel_id INTEGER NOT NULL,
+            is_member INTEGER NOT NULL,
+            updated_at INTEGER NOT NULL,
+            PRIMARY KEY (user_id, channel_id)
+        ) WITHOUT ROWID;
+        CREATE INDEX IF NOT EXISTS memberships_channel ON memberships (channel_id);
+    """
+
+    def record(self, channel_id: int, user_id: int, is_member: bool):
+        """Mencatat status keanggotaan terbaru; ditulis ke database oleh flusher latar belakang."""
+        self._put((user_id, channel_id), (is_member, int(time.time())))
+
+    async def _write(self, pending):
+        rows = [(user_id, channel_id, int(is_member), updated_at) for (user_id, channel_id), (is_member, updated_at) in pending.items()]
+        await self.db.executemany(
+            "INSERT OR REPLACE INTO memberships (user_id, channel_id, is_member, updated_at) VALUES (?, ?, ?, ?)",
+            rows
+        )
+
+    async def lookup(self, user_id: int, channel_ids, max_age):
+        """Mengembalikan {channel_id: is_member} untuk channel yang sudah diketahui dan belum kedaluwarsa."""
+        min_updated = int(time.time() - max_age)
+        known = {}
+        missing = []
+        for channel_id in channel_ids:
+            pending = self._pending.get((user_id, channel_id))
+            if pending is not None:
+                known[channel_id] = pending[0]
+            else:
+                missing.append(channel_id)
+        if missing:
+            placeholders = ",".join("?" * len(missing))
+            rows = await self.db.execute(
+                f"SELECT channel_id, is_member FROM memberships WHERE user_id = ? AND channel_id IN ({placeholders}) AND updated_at >= ?",
+                (user_id, *missing, min_updated)
+            )
+            for channel_id, is_member in rows:
+                known[channel_id] = bool(is_member)
+        return known
+
+    async def forget_channel(self, channel_id: int):
+        """Menghapus seluruh indeks satu channel, misalnya saat bot bukan lagi admin di sana."""
+        for key in [key for key in self._pending if key[1] == channel_id]:
+            del self._pending[key]
+        await self.db.execute("DELETE FROM memberships WHERE channel_id = ?", (channel_id,))
+
+
+# --- Riwayat Pembukaan Parameter Video ---
+class VideoOpenStore(BufferedStore):
+    """Mencatat pengguna mana saja yang pernah membuka link parameter video/bundle tertentu."""
+
+    SCHEMA = """
+        CREATE TABLE IF NOT EXISTS video_opens (
+            parameter TEXT NOT NULL,
+            user_id INTEGER NOT NULL,
+            first_opened INTEGER NOT NULL,
+            last_opened INTEGER NOT NULL,
+            PRIMARY KEY (parameter, user_id)
+        ) WITHOUT ROWID;
+    """
+
+    def record(self, user_id: int, parameter: str):
+        self._put((parameter, user_id), int(time.time()))
+
+    async def _write(self, pending):
+        rows = [(parameter, user_id, opened, opened) for (parameter, user_id), opened in pending.items()]
+        await self.db.executemany(
+            "INSERT INTO video_opens (parameter, user_id, first_opened, last_opened) VALUES (?, ?, ?, ?) "
+            "ON CONFLICT(parameter, user_id) DO UPDATE SET last_opened = excluded.last_opened",
+            rows
+        )
+
+
+# --- Statistik Link Video ---
+class VideoStatsStore(BufferedStore):
+    """Penghitung per parameter video: klik, video terkirim, tertahan FSub dan konversi setelah "Coba Lagi".
+
+    Penghitung dijumlahkan di memori dan ditulis per batch, sehingga /start tidak menambah I/O disk.
+    """
+
+    FIELDS = ("clicks", "deliveries", "fsub_blocked", "conversions")
+
+    SCHEMA = """
+        CREATE TABLE IF NOT EXISTS video_stats (
+            parameter TEXT PRIMARY KEY,
+            clicks INTEGER NOT NULL DEFAULT 0,
+            deliveries INTEGER NOT NULL DEFAULT 0,
+            fsub_blocked INTEGER NOT NULL DEFAULT 0,
+            conversions INTEGER NOT NULL DEFAULT 0,
+            last_click INTEGER
+        ) WITHOUT ROWID;
+    """
+
+    def incr(self, parameter: str, field: str):
+        counters = self._pending.get(parameter) or dict.fromkeys(self.FIELDS, 0)
+        counters[field] += 1
+        self._put(parameter, counters)
+
+    def _restore(self, pending):
+        for parameter, counters in pending.items():
+            current = self._pending.setdefault(parameter, dict.fromkeys(self.FIELDS, 0))
+            for field in self.FIELDS:
+                current[field] += counters[field]
+
+    async def _write(self, pending):
+        now = int(time.time())
+        rows = [
+            (parameter, *(counters[field] for field in self.FIELDS), now if counters["clicks"] else None)
+            for parameter, counters in pending.items()
+        ]
+        await self.db.executemany(
+            "INSERT INTO video_stats (parameter, clicks, deliveries, fsub_blocked, conversions, last_click) "
+            "VALUES (?, ?, ?, ?, ?, ?) ON CONFLICT(parameter) DO UPDATE SET "
+            "clicks = clicks + excluded.clicks, "
+            "deliveries = deliveries + excluded.deliveries, "
+            "fsub_blocked = fsub_blocked + excluded.fsub_blocked, "
+            "conversions = conversions + excluded.conversions, "
+            "last_click = COALESCE(excluded.last_click, last_click)",
+            rows
+        )
+
+    async def top(self, limit=10):
+        """Parameter dengan klik terbanyak: daftar dict berisi semua penghitung."""
+        rows = await self.db.execute(
+            "SELECT parameter, clicks, deliveries, fsub_blocked, conversions, last_click FROM video_stats "
+            "ORDER BY clicks DESC, parameter LIMIT ?",
+            (limit,)
+        )
+        keys = ("parameter", *self.FIELDS, "last_click")
+        return [dict(zip(keys, row)) for row in rows]
+
+    async def clicked_parameters(self):
+        rows = await self.db.execute("SELECT parameter FROM video_stats WHERE clicks > 0")
+        return {row[0] for row in rows}